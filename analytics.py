@@ -0,0 +1,273 @@
+# Vectorized attendance analytics
+#
+# Pulls attendance history out of SQLite as flat columns (student index,
+# session index, scan offset) and computes per-student rates, lateness
+# distributions and per-class trends with NumPy instead of walking rows.
+
+import datetime
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+# A scan counts as late when it arrives this long after sessions.start_time
+LATE_THRESHOLD_MINUTES = 10
+
+# Histogram edges (minutes after session start) for the lateness distribution
+LATENESS_BUCKETS_MINUTES = [0, 5, 10, 15, 20, 30, 45, 60]
+
+SECONDS_PER_DAY = 86400.0
+
+
+class AttendanceAnalytics:
+    """Term-level attendance analytics computed with NumPy
+
+    Attendance rows are cached as columns and refreshed incrementally past
+    the highest ``attendance.id`` already loaded, so repeated dashboard loads
+    only pay for scans recorded since the previous call.
+    """
+
+    def __init__(self, db_path='attendance_system.db'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._high_water = 0
+        self._att_student_rowid = np.zeros(0, dtype=np.int64)
+        self._att_session_rowid = np.zeros(0, dtype=np.int64)
+        self._att_offset = np.zeros(0, dtype=np.float64)
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_path)
+
+    def _refresh_attendance(self, cursor):
+        """Append attendance rows recorded since the last refresh"""
+        # Offsets are computed inside SQLite so Python never parses timestamps
+        cursor.execute(f"""
+            SELECT a.id, st.id, s.id,
+                   (julianday(a.card_scan_time) - julianday(s.start_time)) * {SECONDS_PER_DAY}
+            FROM attendance a
+            JOIN sessions s ON a.session_id = s.session_id
+            JOIN students st ON a.student_id = st.student_id
+            WHERE a.id > ? AND s.start_time IS NOT NULL
+            ORDER BY a.id
+        """, (self._high_water,))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        block = np.array(rows, dtype=np.float64)
+        self._high_water = int(block[-1, 0])
+        self._att_student_rowid = np.concatenate([self._att_student_rowid, block[:, 1].astype(np.int64)])
+        self._att_session_rowid = np.concatenate([self._att_session_rowid, block[:, 2].astype(np.int64)])
+        self._att_offset = np.concatenate([self._att_offset, block[:, 3]])
+
+    def load_columns(self, start: Optional[str] = None, end: Optional[str] = None):
+        """Load students, sessions and attendance for a term as NumPy columns"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # One read transaction, so sessions and scans recorded while we read
+        # can't show up in one query but not the other
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute("SELECT id, student_id, name, class_name FROM students ORDER BY id")
+            student_rows = cursor.fetchall()
+
+            cursor.execute("""
+                SELECT id, class_name, julianday(start_time)
+                FROM sessions
+                WHERE start_time IS NOT NULL
+                ORDER BY id
+            """)
+            session_rows = cursor.fetchall()
+
+            with self._lock:
+                self._refresh_attendance(cursor)
+                att_student_rowid = self._att_student_rowid
+                att_session_rowid = self._att_session_rowid
+                att_offset = self._att_offset
+        finally:
+            conn.commit()
+            conn.close()
+
+        student_ids = np.array([row[0] for row in student_rows], dtype=np.int64)
+        session_ids = np.array([row[0] for row in session_rows], dtype=np.int64)
+        session_start = np.array([row[2] for row in session_rows], dtype=np.float64)
+
+        classes, student_class = np.unique(
+            np.array([row[3] for row in student_rows] + [row[1] for row in session_rows], dtype=object).astype(str),
+            return_inverse=True,
+        )
+        session_class = student_class[len(student_rows):]
+        student_class = student_class[:len(student_rows)]
+
+        # Map DB row ids to dense ordinals; both id arrays are sorted
+        att_student = np.searchsorted(student_ids, att_student_rowid)
+        att_session = np.searchsorted(session_ids, att_session_rowid)
+
+        # Cached scans whose student or session has since been deleted don't
+        # map to a row; drop them rather than count them for a neighbour
+        known = ((att_student < len(student_ids)) & (att_session < len(session_ids)))
+        known[known] &= ((student_ids[att_student[known]] == att_student_rowid[known])
+                         & (session_ids[att_session[known]] == att_session_rowid[known]))
+        if not known.all():
+            att_student = att_student[known]
+            att_session = att_session[known]
+            att_offset = att_offset[known]
+
+        # Restrict sessions (and their attendance) to the requested term
+        in_term = np.ones(len(session_ids), dtype=bool)
+        if start:
+            in_term &= session_start >= _to_julian(start)
+        if end:
+            in_term &= session_start < _to_julian(end)
+        if not in_term.all():
+            att_mask = in_term[att_session]
+            session_ordinal = np.cumsum(in_term) - 1
+            att_student = att_student[att_mask]
+            att_session = session_ordinal[att_session[att_mask]]
+            att_offset = att_offset[att_mask]
+            session_class = session_class[in_term]
+            session_start = session_start[in_term]
+
+        return {
+            'student_keys': [row[1] for row in student_rows],
+            'student_names': [row[2] for row in student_rows],
+            'student_class': student_class,
+            'session_class': session_class,
+            'session_start': session_start,
+            'classes': classes,
+            'att_student': att_student,
+            'att_session': att_session,
+            'att_offset': att_offset,
+        }
+
+    def compute(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict:
+        """Compute per-student, lateness and per-class trend aggregates"""
+        cols = self.load_columns(start, end)
+
+        n_students = len(cols['student_keys'])
+        n_classes = len(cols['classes'])
+
+        # Rates compare a student's scans with their own class's sessions, so
+        # scans into another class's session are counted apart as visits
+        own = cols['student_class'][cols['att_student']] == cols['session_class'][cols['att_session']]
+        visits = np.bincount(cols['att_student'][~own], minlength=n_students)
+        if not own.all():
+            cols = dict(cols, att_student=cols['att_student'][own], att_session=cols['att_session'][own],
+                        att_offset=cols['att_offset'][own])
+
+        att_student = cols['att_student']
+        offset_minutes = cols['att_offset'] / 60.0
+        late_mask = offset_minutes > LATE_THRESHOLD_MINUTES
+
+        # Sessions held per student = sessions held for the student's class
+        sessions_per_class = np.bincount(cols['session_class'], minlength=n_classes)
+        held = sessions_per_class[cols['student_class']]
+        attended = np.bincount(att_student, minlength=n_students)
+        late = np.bincount(att_student[late_mask], minlength=n_students)
+        lateness_sum = np.bincount(att_student, weights=np.clip(offset_minutes, 0, None), minlength=n_students)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(held > 0, attended / held, 0.0)
+            mean_lateness = np.where(attended > 0, lateness_sum / attended, 0.0)
+
+        edges = np.array(LATENESS_BUCKETS_MINUTES + [np.inf], dtype=np.float64)
+        lateness_counts, _ = np.histogram(np.clip(offset_minutes, 0, None), bins=edges)
+
+        total_held = int(held.sum())
+        total_attended = int(attended.sum())
+
+        return {
+            'term': {'start': start, 'end': end},
+            'summary': {
+                'students': n_students,
+                'sessions': int(len(cols['session_start'])),
+                'attendance_records': total_attended,
+                'visitor_scans': int(visits.sum()),
+                'attendance_rate': round(total_attended / total_held, 4) if total_held else 0.0,
+                'late_rate': round(int(late_mask.sum()) / total_attended, 4) if total_attended else 0.0,
+            },
+            'students': self._student_rows(cols, held, attended, late, visits, rate, mean_lateness),
+            'lateness_distribution': {
+                'bucket_edges_minutes': LATENESS_BUCKETS_MINUTES,
+                'counts': lateness_counts.tolist(),
+                'late_threshold_minutes': LATE_THRESHOLD_MINUTES,
+            },
+            'classes': self._class_trends(cols, sessions_per_class),
+        }
+
+    def _student_rows(self, cols, held, attended, late, visits, rate, mean_lateness):
+        """Per-student aggregates as JSON-ready dicts"""
+        class_names = cols['classes'][cols['student_class']].tolist()
+        return [
+            {
+                'student_id': student_id,
+                'name': name,
+                'class_name': class_name,
+                'sessions_held': n_held,
+                'sessions_attended': n_attended,
+                'late_arrivals': n_late,
+                'visits': n_visits,
+                'attendance_rate': round(r, 4),
+                'mean_lateness_minutes': round(m, 2),
+            }
+            for student_id, name, class_name, n_held, n_attended, n_late, n_visits, r, m in zip(
+                cols['student_keys'], cols['student_names'], class_names,
+                held.tolist(), attended.tolist(), late.tolist(), visits.tolist(),
+                rate.tolist(), mean_lateness.tolist(),
+            )
+        ]
+
+    def _class_trends(self, cols, sessions_per_class):
+        """Weekly attendance rate per class across the term"""
+        session_start = cols['session_start']
+        n_classes = len(cols['classes'])
+        if not len(session_start):
+            return []
+
+        term_start = np.floor(session_start.min())
+        session_week = ((session_start - term_start) // 7).astype(np.int64)
+        n_weeks = int(session_week.max()) + 1
+
+        class_size = np.bincount(cols['student_class'], minlength=n_classes)
+
+        # Expected attendance per (class, week) = sessions held * class size
+        held_cells = np.bincount(cols['session_class'] * n_weeks + session_week, minlength=n_classes * n_weeks)
+        expected = held_cells.reshape(n_classes, n_weeks) * class_size[:, None]
+
+        att_session = cols['att_session']
+        attended_cells = np.bincount(
+            cols['session_class'][att_session] * n_weeks + session_week[att_session],
+            minlength=n_classes * n_weeks,
+        ).reshape(n_classes, n_weeks)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weekly_rate = np.where(expected > 0, attended_cells / expected, np.nan)
+
+        week_starts = [
+            _julian_to_date(term_start + 7 * week).isoformat() for week in range(n_weeks)
+        ]
+
+        trends = []
+        for c in range(n_classes):
+            if not sessions_per_class[c]:
+                continue
+            trends.append({
+                'class_name': str(cols['classes'][c]),
+                'students': int(class_size[c]),
+                'sessions_held': int(sessions_per_class[c]),
+                'week_starts': week_starts,
+                'attendance_rate': [None if np.isnan(r) else round(float(r), 4) for r in weekly_rate[c]],
+            })
+        return trends
+
+
+def _julian_to_date(julian_day: float) -> datetime.date:
+    # Julian day 2440587.5 is the Unix epoch
+    return datetime.date(1970, 1, 1) + datetime.timedelta(days=int(julian_day - 2440587.5))
+
+
+def _to_julian(value: str) -> float:
+    moment = datetime.datetime.fromisoformat(value)
+    return (moment - datetime.datetime(1970, 1, 1)).total_seconds() / SECONDS_PER_DAY + 2440587.5
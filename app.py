@@ -2,22 +2,43 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for
 import sqlite3
 import datetime
+import os
 import uuid
 from typing import Dict, List
 
+from analytics import AttendanceAnalytics
+from records import AttendanceRecord, CameraLog, Session, Student, Teacher
+from rollups import get_class_monthly_report, get_student_monthly_report
+from scan_ingest import MAX_BATCH_SIZE, apply_scan_batch
+import http_middleware
+import image_store
+import metrics
+import sql_profiler
+import static_assets
+
 app = Flask(__name__)
 
+# With `gunicorn --preload` this runs once in the master, and forked workers
+# share the loaded detector instead of each loading their own
+if os.environ.get('ATTENDANCE_PRELOAD_MODELS'):
+    import model_manager
+    model_manager.MODELS.preload_from_env()
+
+# Fingerprinted, precompressed assets (see `python static_assets.py build`)
+static_assets.init_app(app)
+
 class WebAttendanceSystem:
     def __init__(self, db_path='attendance_system.db'):
         self.db_path = db_path
 
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        return sql_profiler.connect(self.db_path)
 
     def get_all_teachers(self):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM teachers ORDER BY name")
+        cursor.row_factory = Teacher.row_factory
+        cursor.execute(f"SELECT {Teacher.SQL_COLUMNS} FROM teachers t ORDER BY t.name")
         teachers = cursor.fetchall()
         conn.close()
         return teachers
@@ -25,16 +46,26 @@ class WebAttendanceSystem:
     def get_all_students(self):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM students ORDER BY class_name, name")
+        cursor.row_factory = Student.row_factory
+        cursor.execute(f"SELECT {Student.SQL_COLUMNS} FROM students st ORDER BY st.class_name, st.name")
         students = cursor.fetchall()
         conn.close()
         return students
 
+    def get_counts(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT (SELECT COUNT(*) FROM teachers), (SELECT COUNT(*) FROM students)")
+        total_teachers, total_students = cursor.fetchone()
+        conn.close()
+        return total_teachers, total_students
+
     def get_recent_sessions(self, limit=10):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT s.*, t.name as teacher_name 
+        cursor.row_factory = Session.row_factory
+        cursor.execute(f"""
+            SELECT {Session.SQL_COLUMNS}
             FROM sessions s 
             JOIN teachers t ON s.teacher_id = t.teacher_id 
             ORDER BY s.created_at DESC 
@@ -49,8 +80,9 @@ class WebAttendanceSystem:
         cursor = conn.cursor()
 
         # Get session info
-        cursor.execute("""
-            SELECT s.*, t.name as teacher_name 
+        cursor.row_factory = Session.row_factory
+        cursor.execute(f"""
+            SELECT {Session.SQL_COLUMNS}
             FROM sessions s 
             JOIN teachers t ON s.teacher_id = t.teacher_id 
             WHERE s.session_id = ?
@@ -58,8 +90,9 @@ class WebAttendanceSystem:
         session = cursor.fetchone()
 
         # Get attendance records
-        cursor.execute("""
-            SELECT a.*, st.name as student_name, st.class_name
+        cursor.row_factory = AttendanceRecord.row_factory
+        cursor.execute(f"""
+            SELECT {AttendanceRecord.SQL_COLUMNS}
             FROM attendance a
             JOIN students st ON a.student_id = st.student_id
             WHERE a.session_id = ?
@@ -68,10 +101,12 @@ class WebAttendanceSystem:
         attendance = cursor.fetchall()
 
         # Get camera verification
-        cursor.execute("""
-            SELECT * FROM camera_logs 
-            WHERE session_id = ? 
-            ORDER BY timestamp DESC 
+        cursor.row_factory = CameraLog.row_factory
+        cursor.execute(f"""
+            SELECT {CameraLog.SQL_COLUMNS}
+            FROM camera_logs c 
+            WHERE c.session_id = ? 
+            ORDER BY c.timestamp DESC 
             LIMIT 1
         """, (session_id,))
         camera_log = cursor.fetchone()
@@ -79,25 +114,49 @@ class WebAttendanceSystem:
         conn.close()
         return session, attendance, camera_log
 
-# Initialize web system
-web_system = WebAttendanceSystem()
+    def record_scans(self, events):
+        conn = self.get_connection()
+        try:
+            return apply_scan_batch(conn, events)
+        finally:
+            conn.close()
+
+# Initialize web system (ATTENDANCE_DB selects another database, e.g. for benchmarks)
+web_system = WebAttendanceSystem(os.environ.get('ATTENDANCE_DB', 'attendance_system.db'))
+analytics = AttendanceAnalytics(web_system.db_path)
+
+# Per-route latency histograms and /metrics (registered first so timing
+# covers the other middleware)
+metrics.init_app(app)
+
+# Opt-in SQL profiling (ATTENDANCE_SQL_PROFILE=1), stats at /debug/sql
+sql_profiler.init_app(app)
+
+# Camera verification images and thumbnails (content-addressed, cached for a year)
+image_store.init_app(app)
+
+# Compression, ETags and 304s for pages and JSON (static assets excluded)
+http_middleware.init_app(app, web_system.db_path,
+                         exempt_endpoints=('metrics_endpoint', 'sql_profile', 'verification_image'))
 
 @app.route('/')
 def dashboard():
     """Main dashboard"""
-    teachers = web_system.get_all_teachers()
-    students = web_system.get_all_students()
+    total_teachers, total_students = web_system.get_counts()
     recent_sessions = web_system.get_recent_sessions()
 
     stats = {
-        'total_teachers': len(teachers),
-        'total_students': len(students),
+        'total_teachers': total_teachers,
+        'total_students': total_students,
         'recent_sessions': len(recent_sessions)
     }
 
+    term_analytics = analytics.compute()
+
     return render_template('dashboard.html', 
                          stats=stats, 
-                         recent_sessions=recent_sessions)
+                         recent_sessions=recent_sessions,
+                         analytics=term_analytics)
 
 @app.route('/teachers')
 def teachers():
@@ -129,7 +188,7 @@ def session_detail(session_id):
     total_present = len(attendance)
     discrepancy = 0
     if camera_log:
-        discrepancy = abs(camera_log[2] - camera_log[3])
+        discrepancy = camera_log.discrepancy
 
     return render_template('session_detail.html',
                          session=session,
@@ -138,6 +197,49 @@ def session_detail(session_id):
                          total_present=total_present,
                          discrepancy=discrepancy)
 
+@app.route('/api/analytics')
+def analytics_api():
+    """API endpoint for term attendance analytics"""
+    start = request.args.get('start')
+    end = request.args.get('end')
+    for name, value in (('start', start), ('end', end)):
+        if value:
+            try:
+                datetime.datetime.fromisoformat(value)
+            except ValueError:
+                return jsonify({'success': False, 'error': f'Invalid {name} date (expected YYYY-MM-DD)'}), 400
+    return jsonify(analytics.compute(start, end))
+
+@app.route('/api/reports/student/<student_id>')
+def student_report_api(student_id):
+    """API endpoint for a student's monthly attendance (from rollups)"""
+    report = get_student_monthly_report(web_system.db_path, student_id,
+                                        request.args.get('start'), request.args.get('end'))
+    return jsonify({'student_id': student_id, 'months': report})
+
+@app.route('/api/reports/class/<class_name>')
+def class_report_api(class_name):
+    """API endpoint for a class's monthly attendance per subject (from rollups)"""
+    report = get_class_monthly_report(web_system.db_path, class_name,
+                                      request.args.get('start'), request.args.get('end'))
+    return jsonify({'class_name': class_name, 'months': report})
+
+@app.route('/api/scans', methods=['POST'])
+def submit_scans():
+    """API endpoint for card readers to submit a batch of scans"""
+    events = request.get_json(silent=True)
+    if isinstance(events, dict):
+        events = events.get('events')
+
+    if not isinstance(events, list):
+        return jsonify({'success': False, 'error': 'Expected a JSON array of scan events'}), 400
+
+    if len(events) > MAX_BATCH_SIZE:
+        return jsonify({'success': False, 'error': f'Batch too large (max {MAX_BATCH_SIZE} events)'}), 413
+
+    results = web_system.record_scans(events)
+    return jsonify({'success': True, 'results': results})
+
 @app.route('/api/add_teacher', methods=['POST'])
 def add_teacher():
     """API endpoint to add teacher"""
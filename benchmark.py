@@ -0,0 +1,234 @@
+# Benchmark suite
+#
+# Times the hot paths against a synthetic school (see synthetic_data.py):
+# card scans through mark_attendance, the dashboard queries, session
+# details, the rendered dashboard and the JSON report/analytics exports.
+# Results are written as JSON and can be compared with a baseline run; any
+# benchmark whose median got slower than the threshold fails the run.
+#
+# Usage: python benchmark.py run --scale 100k --output bench_100k.json
+#        python benchmark.py run --scale 100k --baseline baseline_100k.json
+#        python benchmark.py compare bench_100k.json baseline_100k.json --threshold 0.25
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+import uuid
+
+from scan_ingest import mark_attendance_row
+from synthetic_data import DEFAULT_SEED, SCALES, generate_school
+
+DEFAULT_THRESHOLD = 0.25
+
+# Differences below this are timer noise, whatever the ratio
+MIN_REGRESSION_MS = 0.5
+
+DEFAULT_REPEAT = 50
+WARMUP = 3
+
+BENCH_SESSION_PREFIX = 'bench-'
+
+
+def measure(func, repeat=DEFAULT_REPEAT, warmup=WARMUP):
+    """Run func repeatedly; timing summary in milliseconds"""
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return {
+        'repeat': repeat,
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def mark_attendance(db_path, session_id, card_id):
+    """The same steps as AttendanceSystem.mark_attendance
+
+    script_1.py seeds its demo data on import, so the suite drives the
+    shared write path directly.
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    success, message = mark_attendance_row(cursor, session_id, card_id)
+    if success:
+        conn.commit()
+    conn.close()
+    return success, message
+
+
+def load_app(db_path):
+    """Import the Flask app against db_path"""
+    os.environ['ATTENDANCE_DB'] = db_path
+    import app as appmod
+
+    # Templates live next to app.py until deployment moves them into templates/
+    if not os.path.isdir(os.path.join(appmod.app.root_path, 'templates')):
+        appmod.app.template_folder = appmod.app.root_path
+    return appmod
+
+
+def run_benchmarks(db_path, repeat=DEFAULT_REPEAT, seed=DEFAULT_SEED):
+    rng = random.Random(seed)
+    appmod = load_app(db_path)
+    web_system = appmod.web_system
+    client = appmod.app.test_client()
+
+    conn = sqlite3.connect(db_path)
+    session_ids = [row[0] for row in conn.execute("SELECT session_id FROM sessions ORDER BY id")]
+    class_name, teacher_id = conn.execute("SELECT class_name, teacher_id FROM sessions LIMIT 1").fetchone()
+    cards = [row[0] for row in conn.execute("SELECT card_id FROM students WHERE class_name = ?", (class_name,))]
+    student_id = conn.execute("SELECT student_id FROM students LIMIT 1").fetchone()[0]
+    attendance_rows = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+    conn.close()
+
+    results = {}
+
+    # Scans into a fresh active session; the first scan of each card inserts, repeats are rejected
+    bench_session = f"{BENCH_SESSION_PREFIX}{uuid.UUID(int=rng.getrandbits(128), version=4)}"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO sessions (session_id, teacher_id, class_name, subject, start_time) VALUES (?, ?, ?, ?, ?)",
+        (bench_session, teacher_id, class_name, 'Benchmark', datetime.datetime.now())
+    )
+    conn.commit()
+    try:
+        scan_cards = iter(cards * (1 + (repeat + WARMUP) // max(len(cards), 1)))
+        results['mark_attendance'] = measure(
+            lambda: mark_attendance(db_path, bench_session, next(scan_cards)), repeat)
+    finally:
+        conn.execute("DELETE FROM attendance WHERE session_id = ?", (bench_session,))
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (bench_session,))
+        conn.commit()
+        conn.close()
+
+    results['get_recent_sessions'] = measure(web_system.get_recent_sessions, repeat)
+    results['get_session_details'] = measure(
+        lambda: web_system.get_session_details(rng.choice(session_ids)), repeat)
+
+    def get(url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+
+    results['dashboard_render'] = measure(lambda: get('/'), repeat)
+    results['session_detail_render'] = measure(lambda: get(f"/session/{rng.choice(session_ids)}"), repeat)
+    results['export_analytics'] = measure(lambda: get('/api/analytics'), repeat)
+    results['export_class_report'] = measure(lambda: get(f"/api/reports/class/{class_name}"), repeat)
+    results['export_student_report'] = measure(lambda: get(f"/api/reports/student/{student_id}"), repeat)
+
+    return {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'database': os.path.abspath(db_path),
+        'attendance_rows': attendance_rows,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+        'benchmarks': results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Regressions where the median grew by more than `threshold` (a fraction)"""
+    rows = []
+    for name, base in sorted(baseline['benchmarks'].items()):
+        entry = current['benchmarks'].get(name)
+        if entry is None:
+            continue
+        ratio = entry['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+        regressed = (ratio > 1 + threshold
+                     and entry['median_ms'] - base['median_ms'] > MIN_REGRESSION_MS)
+        rows.append({'name': name, 'baseline_ms': base['median_ms'], 'current_ms': entry['median_ms'],
+                     'ratio': round(ratio, 3), 'regressed': regressed})
+    return rows
+
+
+def print_results(result):
+    print(f"{result['attendance_rows']:,} attendance rows (Python {result['python']}, SQLite {result['sqlite']})")
+    print(f"{'benchmark':<24} {'median ms':>10} {'p95 ms':>10} {'min ms':>10}")
+    for name, entry in result['benchmarks'].items():
+        print(f"{name:<24} {entry['median_ms']:>10.3f} {entry['p95_ms']:>10.3f} {entry['min_ms']:>10.3f}")
+
+
+def print_comparison(rows, threshold):
+    print(f"\n{'benchmark':<24} {'baseline':>10} {'current':>10} {'ratio':>7}  (fail above {1 + threshold:.2f}x)")
+    for row in rows:
+        flag = '  REGRESSION' if row['regressed'] else ''
+        print(f"{row['name']:<24} {row['baseline_ms']:>10.3f} {row['current_ms']:>10.3f} {row['ratio']:>7.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance system benchmark suite")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run the suite against a synthetic school")
+    run_parser.add_argument('--scale', choices=sorted(SCALES), default='100k')
+    run_parser.add_argument('--db', help="Database to use (generated if missing; default school_<scale>.db)")
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    run_parser.add_argument('--output', help="Write results JSON here")
+    run_parser.add_argument('--baseline', help="Baseline JSON to compare against")
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help="Allowed median slowdown as a fraction (0.25 = 25%%)")
+
+    compare_parser = commands.add_parser('compare', help="Compare two result files")
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        db_path = args.db or f"school_{args.scale}.db"
+        if not os.path.exists(db_path):
+            print(f"Generating {db_path} ({args.scale} attendance rows)...")
+            generate_school(db_path, seed=args.seed, **SCALES[args.scale])
+
+        result = run_benchmarks(db_path, args.repeat, args.seed)
+        result['scale'] = args.scale
+        print_results(result)
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f, indent=2)
+            print(f"Results written to {args.output}")
+
+        if not args.baseline:
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        current = result
+    else:
+        with open(args.current) as f:
+            current = json.load(f)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    rows = compare(current, baseline, args.threshold)
+    print_comparison(rows, args.threshold)
+    regressions = [row['name'] for row in rows if row['regressed']]
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
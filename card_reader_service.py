@@ -0,0 +1,544 @@
+# Card reader service
+#
+# Reads a card reader on a background thread and turns every read into a
+# timestamped scan event. CardReader.read_card is a blocking poll, so the
+# reads live on their own thread and never wait for the database:
+#
+#     source --read--> debounce --> bounded queue --> ScanEventWriter --> DB
+#                                      | full
+#                                      +--> spill buffer (drained in order)
+#
+# A card held against the reader repeats its ID many times a second; reads
+# of the same card within the debounce window are dropped. When the writer
+# falls behind the queue fills up, the service raises `backpressure` and
+# keeps later events in a spill buffer instead of blocking the reader or
+# dropping scans. The writer drains everything that is waiting into one
+# transaction (up to MAX_BATCH_SIZE), so a slow disk means bigger batches,
+# not lost scans.
+#
+# Sources: MockCardSource (random sample cards), SerialCardSource (USB/RS-232
+# readers, needs pyserial) and PtyReplaySource (replays a recorded scan file
+# through a pseudo-terminal, exercising the same line parsing as a device).
+#
+# Usage: python card_reader_service.py --source mock --session <session_id>
+#        python card_reader_service.py --source serial --device /dev/ttyUSB0 --session <session_id>
+#        python card_reader_service.py --source replay --trace scans.txt --session <session_id>
+
+import argparse
+import os
+import queue
+import random
+import select
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+import metrics
+from scan_ingest import ALREADY_PRESENT, MAX_BATCH_SIZE, apply_scan_batch, is_locked_error
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+# Reads of the same card closer together than this are one scan
+DEBOUNCE_SECONDS = 2.0
+
+# Events waiting for the writer before backpressure kicks in
+QUEUE_SIZE = 1000
+
+# How long a source read blocks, so stop() is noticed promptly
+READ_TIMEOUT_SECONDS = 0.1
+
+# Writer retry delay after a database error, doubling up to the maximum
+RETRY_DELAY_SECONDS = 0.05
+MAX_RETRY_DELAY_SECONDS = 2.0
+
+# Framing bytes some RFID readers put around the card number
+FRAMING_CHARS = '\x02\x03'
+
+CARD_READS = metrics.counter('card_reader_reads_total', 'Card reads by outcome', ['result'])
+CARD_BACKLOG = metrics.gauge(
+    'card_reader_backlog', 'Scan events waiting to be written', multiprocess_mode='sum')
+
+
+def parse_card_line(line) -> Optional[str]:
+    """One line from a reader -> card ID (None for blank lines)"""
+    if isinstance(line, bytes):
+        line = line.decode('ascii', errors='ignore')
+    card_id = line.strip().strip(FRAMING_CHARS).strip()
+    return card_id or None
+
+
+class _LineBuffer:
+    """Splits a byte stream into card IDs on CR/LF"""
+
+    def __init__(self):
+        self._partial = b''
+        self._cards = deque()
+
+    def feed(self, data: bytes):
+        lines = (self._partial + data).replace(b'\r', b'\n').split(b'\n')
+        self._partial = lines.pop()
+        for line in lines:
+            card_id = parse_card_line(line)
+            if card_id:
+                self._cards.append(card_id)
+
+    def pop(self) -> Optional[str]:
+        return self._cards.popleft() if self._cards else None
+
+
+class MockCardSource:
+    """Random sample cards at roughly `interval` seconds, with occasional bounces"""
+
+    def __init__(self, cards: List[str], interval: float = 1.0, bounce_probability: float = 0.2,
+                 limit: Optional[int] = None, seed: Optional[int] = None):
+        self.cards = list(cards)
+        self.interval = interval
+        self.bounce_probability = bounce_probability
+        self.limit = limit
+        self.exhausted = False
+        self._rng = random.Random(seed)
+        self._reads = 0
+        self._last = None
+        self._next_at = 0.0
+
+    def open(self):
+        self._next_at = time.monotonic()
+
+    def read(self, timeout: float) -> Optional[str]:
+        if self.limit is not None and self._reads >= self.limit:
+            self.exhausted = True
+            return None
+
+        wait = self._next_at - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return None
+        if wait > 0:
+            time.sleep(wait)
+
+        # A card left on the reader is read again almost immediately
+        if self._last and self._rng.random() < self.bounce_probability:
+            self._next_at = time.monotonic() + 0.05
+        else:
+            self._last = self._rng.choice(self.cards)
+            self._next_at = time.monotonic() + self._rng.uniform(0.5, 1.5) * self.interval
+        self._reads += 1
+        return self._last
+
+    def close(self):
+        pass
+
+
+class SerialCardSource:
+    """Card reader on a serial port (USB-serial or RS-232), one card ID per line"""
+
+    def __init__(self, device: str, baudrate: int = 9600):
+        self.device = device
+        self.baudrate = baudrate
+        self.exhausted = False
+        self._serial = None
+        self._lines = _LineBuffer()
+
+    def open(self):
+        if serial is None:
+            raise RuntimeError("pyserial is required for serial card readers (pip install pyserial)")
+        self._serial = serial.Serial(self.device, self.baudrate, timeout=READ_TIMEOUT_SECONDS)
+
+    def read(self, timeout: float) -> Optional[str]:
+        card_id = self._lines.pop()
+        if card_id:
+            return card_id
+        self._serial.timeout = timeout
+        data = self._serial.read(max(1, self._serial.in_waiting))
+        if data:
+            self._lines.feed(data)
+        return self._lines.pop()
+
+    def close(self):
+        if self._serial is not None:
+            self._serial.close()
+            self._serial = None
+
+
+class PtyReplaySource:
+    """Replays a scan file through a pseudo-terminal, like a reader on a serial port
+
+    Each trace line is `offset_seconds,card_id` (seconds since the start) or
+    just `card_id`, which follows the previous scan by one second.
+    """
+
+    def __init__(self, trace_path: str, speed: float = 1.0):
+        self.trace_path = trace_path
+        self.speed = speed
+        self.exhausted = False
+        self.device_name = None
+        self._master = None
+        self._slave = None
+        self._feeder = None
+        self._lines = _LineBuffer()
+        self._stop = threading.Event()
+
+    def load_trace(self):
+        scans = []
+        offset = -1.0
+        with open(self.trace_path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if ',' in line:
+                    offset_text, card_id = line.split(',', 1)
+                    offset = float(offset_text)
+                else:
+                    card_id = line
+                    offset += 1.0
+                scans.append((max(offset, 0.0), card_id.strip()))
+        return scans
+
+    def open(self):
+        import tty
+
+        scans = self.load_trace()
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.device_name = os.ttyname(self._slave)
+        self._feeder = threading.Thread(target=self._feed, args=(scans,), daemon=True,
+                                        name='card-replay')
+        self._feeder.start()
+
+    def _feed(self, scans):
+        start = time.monotonic()
+        for offset, card_id in scans:
+            delay = start + offset / self.speed - time.monotonic() if self.speed > 0 else 0
+            if delay > 0 and self._stop.wait(delay):
+                return
+            os.write(self._master, f"{card_id}\r\n".encode())
+
+    def read(self, timeout: float) -> Optional[str]:
+        card_id = self._lines.pop()
+        if card_id:
+            return card_id
+        ready, _, _ = select.select([self._slave], [], [], timeout)
+        if ready:
+            self._lines.feed(os.read(self._slave, 4096))
+            return self._lines.pop()
+        if not self._feeder.is_alive():
+            self.exhausted = True
+        return None
+
+    def close(self):
+        self._stop.set()
+        if self._feeder is not None:
+            self._feeder.join()
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+
+class CardReaderService:
+    """Background reader thread feeding debounced scan events into a bounded queue"""
+
+    def __init__(self, source, reader_id: str = 'R1', debounce_seconds: float = DEBOUNCE_SECONDS,
+                 queue_size: int = QUEUE_SIZE,
+                 on_backpressure: Optional[Callable[[bool], None]] = None):
+        self.source = source
+        self.reader_id = reader_id
+        self.debounce_seconds = debounce_seconds
+        self.on_backpressure = on_backpressure
+        self.backpressure = threading.Event()
+        self.stats = {'reads': 0, 'debounced': 0, 'queued': 0, 'spilled': 0, 'errors': 0}
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._spill = deque()
+        self._lock = threading.Lock()
+        self._last_read = {}  # card_id -> monotonic time of the last read
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def backlog(self):
+        with self._lock:
+            return self._queue.qsize() + len(self._spill)
+
+    def start(self):
+        self.source.open()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"card-reader-{self.reader_id}")
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """Stop reading; events already read stay queued for the writer"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.source.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                card_id = self.source.read(READ_TIMEOUT_SECONDS)
+            except Exception as e:
+                # A flaky cable shouldn't kill the reader; try again shortly
+                self.stats['errors'] += 1
+                print(f"Card reader {self.reader_id} read failed: {e}")
+                self._stop.wait(1.0)
+                continue
+            if card_id:
+                self.accept(card_id)
+            elif getattr(self.source, 'exhausted', False):
+                break
+
+    def accept(self, card_id: str, scanned_at: Optional[float] = None):
+        """Debounce one read and queue it as a scan event; returns False if debounced"""
+        now = time.monotonic()
+        scanned_at = time.time() if scanned_at is None else scanned_at
+        self.stats['reads'] += 1
+
+        last = self._last_read.get(card_id)
+        self._last_read[card_id] = now
+        if last is not None and now - last < self.debounce_seconds:
+            self.stats['debounced'] += 1
+            CARD_READS.labels('debounced').inc()
+            return False
+        if len(self._last_read) > 4096:
+            cutoff = now - self.debounce_seconds
+            self._last_read = {card: t for card, t in self._last_read.items() if t >= cutoff}
+
+        event = {
+            'event_id': f"{self.reader_id}:{card_id}:{scanned_at:.6f}",
+            'reader_id': self.reader_id,
+            'card_id': card_id,
+            'scanned_at': scanned_at,
+        }
+
+        spilled = False
+        with self._lock:
+            # Once anything has spilled, later events spill too so order is kept
+            if self._spill:
+                spilled = True
+            else:
+                try:
+                    self._queue.put_nowait(event)
+                except queue.Full:
+                    spilled = True
+                    self._set_backpressure(True)
+            if spilled:
+                self._spill.append(event)
+
+        if spilled:
+            self.stats['spilled'] += 1
+            CARD_READS.labels('spilled').inc()
+        else:
+            self.stats['queued'] += 1
+            CARD_READS.labels('queued').inc()
+        CARD_BACKLOG.inc()
+        return True
+
+    def get_batch(self, max_events: int = MAX_BATCH_SIZE, timeout: float = 0.5) -> List[dict]:
+        """Oldest waiting events, blocking up to `timeout` for the first one"""
+        self._refill()
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < max_events:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                self._refill()
+                if self._queue.empty():
+                    break
+        self._refill()
+        CARD_BACKLOG.dec(len(batch))
+        return batch
+
+    def _refill(self):
+        with self._lock:
+            while self._spill and not self._queue.full():
+                self._queue.put_nowait(self._spill.popleft())
+            if not self._spill:
+                self._set_backpressure(False)
+
+    def _set_backpressure(self, active: bool):
+        # Called with the lock held
+        if active == self.backpressure.is_set():
+            return
+        if active:
+            self.backpressure.set()
+        else:
+            self.backpressure.clear()
+        if self.on_backpressure:
+            self.on_backpressure(active)
+
+
+class ScanEventWriter:
+    """Writes a CardReaderService's events through scan_ingest.apply_scan_batch
+
+    `session_for(event)` names the session an event belongs to (None skips
+    it). With a presence.PresenceBitmap, cards already present are rejected
+    without touching the database. A locked or busy database is retried with
+    backoff, so contention never drops a batch; any other database error
+    fails that batch's events (reported through on_result) and moves on.
+    """
+
+    def __init__(self, service: CardReaderService, db_path: str = 'attendance_system.db',
+                 session_for: Callable[[dict], Optional[str]] = lambda event: None,
+                 on_result: Optional[Callable[[dict, dict], None]] = None,
+                 batch_size: int = MAX_BATCH_SIZE, presence=None):
+        self.service = service
+        self.db_path = db_path
+        self.session_for = session_for
+        self.on_result = on_result
+        self.batch_size = batch_size
+        self.presence = presence
+        self.stats = {'events': 0, 'batches': 0, 'marked': 0, 'rejected': 0, 'retries': 0, 'write_errors': 0}
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"scan-writer-{self.service.reader_id}")
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 30.0):
+        """Write whatever is still waiting, then stop"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        self._conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            while True:
+                batch = self.service.get_batch(self.batch_size, timeout=0.2)
+                if batch:
+                    self._write(batch)
+                elif self._stop.is_set() and not self.service.running and not self.service.backlog:
+                    return
+        finally:
+            self._conn.close()
+
+    def _write(self, batch):
+        results = {}
+        ready = []
+        for event in batch:
+            event['session_id'] = self.session_for(event)
+            if not event['session_id']:
+                results[event['event_id']] = {'event_id': event['event_id'], 'success': False,
+                                              'duplicate': False, 'message': 'No active session'}
+            elif self.presence is not None and self.presence.check(event['card_id']):
+                results[event['event_id']] = {'event_id': event['event_id'], 'success': False,
+                                              'duplicate': False, 'message': ALREADY_PRESENT}
+            else:
+                ready.append(event)
+
+        delay = RETRY_DELAY_SECONDS
+        while ready:
+            try:
+                for result in apply_scan_batch(self._conn, ready):
+                    results[result['event_id']] = result
+                break
+            except sqlite3.Error as e:
+                if not is_locked_error(e):
+                    # Retrying won't help (missing table, constraint, ...): fail
+                    # these events and keep the later batches moving
+                    self.stats['write_errors'] += 1
+                    for event in ready:
+                        results[event['event_id']] = {'event_id': event['event_id'], 'success': False,
+                                                      'duplicate': False, 'message': f"Write failed: {e}"}
+                    break
+                # Locked or busy database: the reader thread keeps going meanwhile
+                self.stats['retries'] += 1
+                print(f"Scan write failed ({e}); retrying {len(ready)} events")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY_SECONDS)
+
+        self.stats['batches'] += 1
+        for event in batch:
+            result = results[event['event_id']]
+            if self.presence is not None and (result['success'] or result['message'] == ALREADY_PRESENT):
+                self.presence.mark(event['card_id'])
+            self.stats['events'] += 1
+            self.stats['marked' if result['success'] else 'rejected'] += 1
+            if self.on_result:
+                self.on_result(event, result)
+
+
+def build_source(args):
+    if args.source == 'serial':
+        return SerialCardSource(args.device, args.baudrate)
+    if args.source == 'replay':
+        return PtyReplaySource(args.trace, args.speed)
+
+    conn = sqlite3.connect(args.db)
+    cards = [row[0] for row in conn.execute("SELECT card_id FROM students")]
+    conn.close()
+    return MockCardSource(cards or ['CARD001'], args.interval, limit=args.limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background card reader service")
+    parser.add_argument('--source', choices=['mock', 'serial', 'replay'], default='mock')
+    parser.add_argument('--db', default='attendance_system.db')
+    parser.add_argument('--session', help="Session to mark attendance in (default: the only active one)")
+    parser.add_argument('--reader-id', default='R1')
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS, help="Debounce window in seconds")
+    parser.add_argument('--device', default='/dev/ttyUSB0', help="Serial device (--source serial)")
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--trace', help="Scan file to replay (--source replay)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay speed multiplier (0 = no delays)")
+    parser.add_argument('--interval', type=float, default=1.0, help="Mean seconds between mock reads")
+    parser.add_argument('--limit', type=int, help="Stop after this many mock reads")
+    args = parser.parse_args()
+
+    if args.source == 'replay' and not args.trace:
+        parser.error("--source replay needs --trace")
+
+    session_id = args.session
+    if not session_id:
+        conn = sqlite3.connect(args.db)
+        rows = conn.execute("SELECT session_id FROM sessions WHERE status = 'active' LIMIT 2").fetchall()
+        conn.close()
+        if len(rows) != 1:
+            parser.error("--session is required unless exactly one session is active")
+        session_id = rows[0][0]
+
+    def report(event, result):
+        mark = '✓' if result['success'] else '✗'
+        print(f"{mark} {event['card_id']}: {result['message']}")
+
+    service = CardReaderService(build_source(args), args.reader_id, args.debounce,
+                                on_backpressure=lambda active: print(
+                                    "Writer falling behind; buffering scans" if active else "Writer caught up"))
+    writer = ScanEventWriter(service, args.db, lambda event: session_id, report)
+    service.start()
+    writer.start()
+    try:
+        while service.running:
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        writer.stop()
+        print(f"Reads: {service.stats['reads']}  Debounced: {service.stats['debounced']}  "
+              f"Marked: {writer.stats['marked']}  Rejected: {writer.stats['rejected']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,10 @@ source attendance_env/bin/activate
 echo "Installing Python packages..."
 pip install -r requirements.txt
 
+# Vendor Bootstrap/Font Awesome and build fingerprinted static assets
+echo "Building static assets..."
+python3 static_assets.py build --vendor
+
 # Initialize database
 echo "Setting up database..."
 python3 -c "
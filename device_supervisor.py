@@ -0,0 +1,213 @@
+# Device supervision
+#
+# initialize_hardware used to connect the fingerprint scanner, card reader
+# and camera one after another and give up at the first failure: a camera
+# that took 20 s to time out delayed card scanning by 20 s, and an unplugged
+# one kept the whole device down. The supervisor connects every device at
+# once, each with its own timeout, so start-up takes as long as the slowest
+# device rather than the sum of all of them.
+#
+# Devices that fail or time out leave the system running in degraded mode.
+# A background thread reconnects them with exponential backoff and
+# health-checks the ones that are up, so a camera that drops out mid-lesson
+# is reconnected without touching card scanning.
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import metrics
+
+CONNECT_TIMEOUT_SECONDS = 15.0
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+HEALTH_CHECK_SECONDS = 5.0
+# How often the supervisor thread looks at its devices
+TICK_SECONDS = 0.25
+
+READY = 'ready'
+CONNECTING = 'connecting'
+FAILED = 'failed'
+
+DEVICE_READY = metrics.gauge('device_ready', '1 while the device is connected', ['device'],
+                             multiprocess_mode='max')
+DEVICE_CONNECTS = metrics.counter('device_connect_attempts_total', 'Device connection attempts',
+                                  ['device', 'result'])
+
+
+class _Device:
+    def __init__(self, name, connect, check, timeout, label):
+        self.name = name
+        self.connect = connect
+        self.check = check
+        self.timeout = timeout
+        self.label = label
+        self.state = CONNECTING
+        self.error = None
+        self.attempts = 0
+        self.failures = 0      # consecutive, drives the backoff
+        self.started_at = 0.0  # monotonic start of the current attempt
+        self.retry_at = 0.0
+        self.checked_at = 0.0
+        self.connect_seconds = None
+        self.done = threading.Event()
+        self.thread = None
+
+
+class DeviceSupervisor:
+    """Connects devices concurrently and keeps reconnecting the ones that are down"""
+
+    def __init__(self, name: Optional[str] = None, retry_base: float = RETRY_BASE_SECONDS,
+                 retry_max: float = RETRY_MAX_SECONDS, health_interval: float = HEALTH_CHECK_SECONDS,
+                 on_change: Optional[Callable[[str, str, Optional[str]], None]] = None):
+        # on_change(device, state, error) runs when a device comes up or goes down
+        self.name = name
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.health_interval = health_interval
+        self.on_change = on_change
+        self._devices: Dict[str, _Device] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, device: str, connect: Callable[[], bool], check: Optional[Callable[[], bool]] = None,
+            timeout: float = CONNECT_TIMEOUT_SECONDS):
+        """Register a device: connect() returns True when it is up, check() while it stays up"""
+        label = f"{self.name}/{device}" if self.name else device
+        self._devices[device] = _Device(device, connect, check, timeout, label)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def connect_all(self) -> bool:
+        """Connect every device at once; returns when all are up or have timed out"""
+        start = time.monotonic()
+        devices = list(self._devices.values())
+        for device in devices:
+            self._attempt(device)
+        for device in devices:
+            remaining = start + device.timeout - time.monotonic()
+            if not device.done.wait(max(0.0, remaining)):
+                self._timed_out(device)
+        return all(device.state == READY for device in devices)
+
+    def start(self):
+        """Start the background thread that reconnects and health-checks devices"""
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name=f"supervisor-{self.name or 'hardware'}")
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def ready(self, device: str) -> bool:
+        return self._devices[device].state == READY
+
+    def missing(self):
+        return [name for name, device in self._devices.items() if device.state != READY]
+
+    def mark_failed(self, device: str, error: str = "reported failed"):
+        """A caller found the device broken; reconnect it"""
+        entry = self._devices[device]
+        with self._lock:
+            if entry.state != READY:
+                return
+            entry.failures = 0
+            entry.retry_at = time.monotonic()
+            self._set_state(entry, FAILED, error)
+
+    def status(self) -> Dict[str, dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {name: {
+                'state': device.state,
+                'error': device.error,
+                'attempts': device.attempts,
+                'connect_ms': (round(device.connect_seconds * 1000, 1)
+                               if device.connect_seconds is not None else None),
+                'retry_in': (round(max(0.0, device.retry_at - now), 1)
+                             if device.state == FAILED else None),
+            } for name, device in self._devices.items()}
+
+    def _attempt(self, device):
+        with self._lock:
+            if device.thread is not None and device.thread.is_alive():
+                # A timed-out attempt is still blocked; don't stack another on the device
+                return
+            device.attempts += 1
+            device.started_at = time.monotonic()
+            device.done.clear()
+            self._set_state(device, CONNECTING, device.error)
+            device.thread = threading.Thread(target=self._connect, args=(device,), daemon=True,
+                                             name=f"connect-{device.label}")
+            device.thread.start()
+
+    def _connect(self, device):
+        try:
+            ok = bool(device.connect())
+            error = None if ok else "not available"
+        except Exception as e:
+            ok, error = False, str(e) or type(e).__name__
+        DEVICE_CONNECTS.labels(device.label, 'ok' if ok else 'failed').inc()
+
+        with self._lock:
+            if ok:
+                device.failures = 0
+                device.checked_at = time.monotonic()
+                device.connect_seconds = device.checked_at - device.started_at
+                self._set_state(device, READY, None)
+            elif device.state == FAILED:
+                # Already counted as a timeout; just keep the real reason
+                device.error = error
+            else:
+                self._fail(device, error)
+            device.done.set()
+
+    def _timed_out(self, device):
+        with self._lock:
+            if device.state == CONNECTING:
+                DEVICE_CONNECTS.labels(device.label, 'timeout').inc()
+                self._fail(device, f"no response after {device.timeout:g}s")
+
+    def _fail(self, device, error):
+        device.failures += 1
+        delay = min(self.retry_max, self.retry_base * 2 ** (device.failures - 1))
+        # Jitter so rooms that lost power together don't retry in lockstep
+        device.retry_at = time.monotonic() + delay * random.uniform(0.5, 1.0)
+        self._set_state(device, FAILED, error)
+
+    def _set_state(self, device, state, error):
+        was_ready = device.state == READY
+        device.state = state
+        device.error = error
+        DEVICE_READY.labels(device.label).set(1 if state == READY else 0)
+        # Only up/down transitions are news; retries are not
+        if was_ready != (state == READY) and self.on_change:
+            self.on_change(device.name, state, error)
+
+    def _run(self):
+        while not self._stop.wait(TICK_SECONDS):
+            now = time.monotonic()
+            for device in list(self._devices.values()):
+                if device.state == CONNECTING:
+                    if now - device.started_at >= device.timeout:
+                        self._timed_out(device)
+                elif device.state == FAILED:
+                    if now >= device.retry_at:
+                        self._attempt(device)
+                elif device.check is not None and now - device.checked_at >= self.health_interval:
+                    device.checked_at = now
+                    try:
+                        healthy = device.check()
+                    except Exception:
+                        healthy = False
+                    if not healthy:
+                        self.mark_failed(device.name, "health check failed")
@@ -0,0 +1,592 @@
+# Device traces: record live devices, replay them at any speed
+#
+# The mock devices always read CARD001 and count a random 15-25 people, so
+# nothing realistic can be reproduced. A trace is a JSONL file of
+# timestamped device events. The recorder writes one from live devices. The
+# replay drivers implement the FingerprintScanner, CardReader and
+# CameraSystem interfaces on top of a trace, so a recorded school day can be
+# run through the whole session pipeline at 1x, Nx or as fast as possible.
+#
+# Format: a header line, then one event per line, `t` in seconds since the
+# start of the recording:
+#
+#   {"trace": "attendance-devices", "version": 1, "started_at": "2025-09-17T07:55:00"}
+#   {"t": 312.4, "device": "fingerprint", "teacher_id": "T001", "template": "<base64>"}
+#   {"t": 340.1, "device": "card", "card_id": "CARD001"}
+#   {"t": 600.0, "device": "camera", "count": 18, "counts": [18, 17, 18, 18, 19]}
+#
+# `template` is the probe the sensor produced (replayed as is). Without it
+# the replay scans `teacher_id`'s simulated finger.
+#
+# Usage: python device_trace.py synthesize --class 10A --periods 6 --output day.jsonl
+#        python device_trace.py summary day.jsonl
+
+import argparse
+import base64
+import datetime
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from fingerprint_index import (DEFAULT_MATCH_THRESHOLD, FingerprintIndex, decode_template,
+                               encode_template, simulated_scan, simulated_template)
+
+TRACE_FORMAT = 'attendance-devices'
+TRACE_VERSION = 1
+DEVICES = ('fingerprint', 'card', 'camera')
+
+# Replay speed that skips every wait
+MAX_SPEED = 0.0
+
+
+def parse_speed(text) -> float:
+    """'max', '1x', '10x' or a number; MAX_SPEED (0) means no waiting"""
+    text = str(text).strip().lower()
+    if text in ('max', '0'):
+        return MAX_SPEED
+    speed = float(text[:-1] if text.endswith('x') else text)
+    if speed <= 0:
+        raise ValueError(f"Replay speed must be positive or 'max': {text!r}")
+    return speed
+
+
+class TraceRecorder:
+    """Appends device events to a JSONL trace; safe to share between device threads"""
+
+    def __init__(self, path: str, **header):
+        self.path = path
+        self.events = 0
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._file = open(path, 'w')
+        self._write({'trace': TRACE_FORMAT, 'version': TRACE_VERSION,
+                     'started_at': datetime.datetime.now().isoformat(timespec='seconds'), **header})
+
+    def record(self, device: str, **fields):
+        event = {'t': round(time.monotonic() - self._start, 3), 'device': device, **fields}
+        with self._lock:
+            self._write(event)
+            self.events += 1
+
+    def fingerprint(self, probe, teacher_id: Optional[str] = None):
+        template = base64.b64encode(encode_template(probe)).decode('ascii')
+        self.record('fingerprint', teacher_id=teacher_id, template=template)
+
+    def card(self, card_id: str):
+        self.record('card', card_id=card_id)
+
+    def camera(self, result: dict):
+        self.record('camera', count=int(result['count']), counts=[int(c) for c in result.get('counts', [])])
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def _write(self, event):
+        self._file.write(json.dumps(event, separators=(',', ':')) + '\n')
+        # A crash loses at most the event being written
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record_hardware(hardware, recorder: TraceRecorder):
+    """Record every fingerprint capture, card read and camera count of a HardwareManager"""
+    scanner = hardware.fingerprint_scanner
+    capture = scanner.capture
+
+    def recorded_capture():
+        probe = capture()
+        if probe is not None:
+            teacher_id, _ = scanner.template_index.identify(probe)
+            recorder.fingerprint(probe, teacher_id)
+        return probe
+
+    reader = hardware.card_reader
+    read_card = reader.read_card
+
+    def recorded_read_card():
+        card_id = read_card()
+        if card_id:
+            recorder.card(card_id)
+        return card_id
+
+    camera = hardware.camera_system
+    detect = camera.detect
+
+    def recorded_detect(keep_image: bool = False):
+        result = detect(keep_image)
+        if result is not None:
+            recorder.camera(result)
+        return result
+
+    # Instance attributes shadow the methods, so the devices' own callers are recorded too
+    scanner.capture = recorded_capture
+    reader.read_card = recorded_read_card
+    camera.detect = recorded_detect
+    return hardware
+
+
+class RecordingCardSource:
+    """Wraps a card_reader_service source and records each card it reads"""
+
+    def __init__(self, source, recorder: TraceRecorder):
+        self.source = source
+        self.recorder = recorder
+
+    @property
+    def exhausted(self):
+        return self.source.exhausted
+
+    def open(self):
+        self.source.open()
+
+    def read(self, timeout: float) -> Optional[str]:
+        card_id = self.source.read(timeout)
+        if card_id:
+            self.recorder.card(card_id)
+        return card_id
+
+    def close(self):
+        self.source.close()
+
+
+class Trace:
+    """A loaded trace: header plus events in time order"""
+
+    def __init__(self, header: dict, events: List[dict], path: Optional[str] = None):
+        self.header = header
+        self.events = sorted(events, key=lambda event: event['t'])
+        self.path = path
+
+    @classmethod
+    def load(cls, path: str) -> 'Trace':
+        header, events = {}, []
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if 'trace' in record:
+                    if record['trace'] != TRACE_FORMAT or record.get('version', 1) > TRACE_VERSION:
+                        raise ValueError(f"{path}: not a version {TRACE_VERSION} device trace")
+                    header = record
+                elif record.get('device') in DEVICES and 't' in record:
+                    events.append(record)
+                else:
+                    raise ValueError(f"{path}:{number}: not a device event: {line[:80]}")
+        return cls(header, events, path)
+
+    def for_device(self, device: str) -> List[dict]:
+        return [event for event in self.events if event['device'] == device]
+
+    @property
+    def duration(self) -> float:
+        return self.events[-1]['t'] if self.events else 0.0
+
+    def summary(self) -> dict:
+        counts = {device: len(self.for_device(device)) for device in DEVICES}
+        return {'events': len(self.events), 'duration_seconds': self.duration, **counts}
+
+
+class ReplayClock:
+    """Trace time for replay drivers, running `speed` times faster than real time
+
+    At MAX_SPEED nothing waits: trace time jumps to whatever event is being
+    replayed.
+    """
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self._start = None
+        self._virtual = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._start is None:
+                self._start = time.monotonic()
+        return self
+
+    def now(self) -> float:
+        self.start()
+        if self.speed == MAX_SPEED:
+            return self._virtual
+        return max(self._virtual, (time.monotonic() - self._start) * self.speed)
+
+    def wait_until(self, t: float) -> bool:
+        """Block until trace time t; False if the clock was stopped first"""
+        self.start()
+        if self.speed != MAX_SPEED:
+            delay = self._start + t / self.speed - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                return False
+        with self._lock:
+            self._virtual = max(self._virtual, t)
+        return True
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to timeout real seconds; True if the clock was stopped meanwhile"""
+        return self._stop.wait(timeout)
+
+    def stop(self):
+        self._stop.set()
+
+
+class _EventCursor:
+    """Hands out one device's events in order, each at its trace time"""
+
+    def __init__(self, events: List[dict], clock: ReplayClock):
+        self.events = events
+        self.clock = clock
+        self.position = 0
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self):
+        return self.position >= len(self.events)
+
+    def next(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """The next event once it is due; None if exhausted or not due within timeout (real seconds)"""
+        while True:
+            with self._lock:
+                if self.exhausted:
+                    return None
+                position = self.position
+                event = self.events[position]
+
+            # Wait without the lock, so other readers and stop() aren't held up
+            if timeout is not None and self.clock.speed != MAX_SPEED:
+                due_in = (event['t'] - self.clock.now()) / self.clock.speed
+                if due_in > timeout:
+                    self.clock.wait(timeout)
+                    return None
+            if not self.clock.wait_until(event['t']):
+                return None
+
+            with self._lock:
+                if self.position == position:
+                    self.position += 1
+                    return event
+            # Another reader took this event while we waited; try the next one
+
+
+class ReplayFingerprintScanner:
+    """FingerprintScanner whose sensor reads come from a trace"""
+
+    def __init__(self, trace: Trace, clock: ReplayClock, match_threshold: float = DEFAULT_MATCH_THRESHOLD,
+                 template_index: FingerprintIndex = None):
+        self.is_connected = False
+        self.template_index = (template_index if template_index is not None
+                               else FingerprintIndex(threshold=match_threshold))
+        self.simulated_finger = None
+        self._cursor = _EventCursor(trace.for_device('fingerprint'), clock)
+
+    def connect(self):
+        self.is_connected = True
+        return True
+
+    def load_templates(self, db_path: str):
+        return self.template_index.load_from_db(db_path)
+
+    def register_fingerprint(self, teacher_id: str):
+        if not self.is_connected:
+            return False, "Scanner not connected"
+        template = simulated_template(teacher_id)
+        self.template_index.add(teacher_id, template)
+        return True, encode_template(template)
+
+    def capture(self):
+        """The next recorded probe (None once the trace has no more)"""
+        event = self._cursor.next()
+        if event is None:
+            return None
+        if event.get('template'):
+            return decode_template(base64.b64decode(event['template']))
+        return simulated_scan(event['teacher_id']) if event.get('teacher_id') else None
+
+    def verify_fingerprint(self, scanned_data=None):
+        if not self.is_connected:
+            return False, None
+        probe = self.capture() if scanned_data is None else scanned_data
+        if isinstance(probe, (bytes, bytearray, memoryview)):
+            probe = decode_template(bytes(probe))
+        if probe is None:
+            return False, None
+        teacher_id, score = self.template_index.identify(probe)
+        return teacher_id is not None, teacher_id
+
+
+class ReplayCardReader:
+    """CardReader whose reads come from a trace"""
+
+    def __init__(self, trace: Trace, clock: ReplayClock):
+        self.is_connected = False
+        self._cursor = _EventCursor(trace.for_device('card'), clock)
+
+    @property
+    def exhausted(self):
+        return self._cursor.exhausted
+
+    def connect(self):
+        self.is_connected = True
+        return True
+
+    def read_card(self):
+        if not self.is_connected:
+            return None
+        event = self._cursor.next()
+        return event['card_id'] if event else None
+
+
+class TraceCardSource:
+    """card_reader_service source replaying a trace's card events"""
+
+    def __init__(self, trace: Trace, clock: ReplayClock):
+        self._cursor = _EventCursor(trace.for_device('card'), clock)
+
+    @property
+    def exhausted(self):
+        return self._cursor.exhausted
+
+    def open(self):
+        self._cursor.clock.start()
+
+    def read(self, timeout: float) -> Optional[str]:
+        event = self._cursor.next(timeout)
+        return event['card_id'] if event else None
+
+    def close(self):
+        pass
+
+
+class ReplayCameraSystem:
+    """CameraSystem reporting the count recorded at the current trace time"""
+
+    def __init__(self, trace: Trace, clock: ReplayClock, image_store=None):
+        self.source = f"replay:{trace.path or 'trace'}"
+        self.image_store = image_store
+        self.clock = clock
+        self.is_connected = False
+        self.detection_model_loaded = False
+        self.capture = None
+        self.model = None
+        self.counter = None
+        self.last_result = None
+        self._events = trace.for_device('camera')
+        self._times = [event['t'] for event in self._events]
+
+    @property
+    def simulated(self):
+        return False
+
+    def connect(self):
+        self.is_connected = True
+        return True
+
+    def disconnect(self):
+        self.is_connected = False
+
+    def healthy(self):
+        return self.is_connected and self.detection_model_loaded
+
+    def load_detection_model(self):
+        if not self.is_connected:
+            return False
+        self.detection_model_loaded = True
+        return True
+
+    def count_persons(self, save_image: bool = False):
+        result = self.detect(keep_image=save_image)
+        if result is None:
+            return 0
+        if save_image:
+            self.store_image(result)
+        return result['count']
+
+    def detect(self, keep_image: bool = False):
+        """The latest recorded count at or before now (the first one before any)"""
+        if not self.is_connected or not self.detection_model_loaded or not self._events:
+            return None
+        now = self.clock.now()
+        index = max(0, int(np.searchsorted(self._times, now, side='right')) - 1)
+        event = self._events[index]
+        result = {'count': event['count'], 'counts': event.get('counts') or [event['count']],
+                  'frames': len(event.get('counts') or [1]), 'seconds': 0.0, 'budget_exhausted': False,
+                  'detector': 'replay', 'image': self._render(event, now) if keep_image else None,
+                  'image_key': None}
+        self.last_result = result
+        return result
+
+    def store_image(self, result):
+        image = result.pop('image', None)
+        if image is not None and self.image_store is not None:
+            result['image_key'] = self.image_store.save(image)
+        return result['image_key']
+
+    def latest_frame(self):
+        return None
+
+    @staticmethod
+    def _render(event, now):
+        image = np.full((360, 640, 3), 40, dtype=np.uint8)
+        cv2.putText(image, f"Replay: {event['count']} persons", (20, 60),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 255, 255), 2)
+        cv2.putText(image, f"trace t={event['t']:.1f}s (now {now:.1f}s)", (20, 110),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 200), 2)
+        return image
+
+
+class ReplayDevices:
+    """Replay drivers for one trace, sharing one clock"""
+
+    def __init__(self, trace, speed: float = 1.0, image_store=None, template_index: FingerprintIndex = None):
+        self.trace = trace if isinstance(trace, Trace) else Trace.load(trace)
+        self.clock = ReplayClock(speed)
+        self.fingerprint_scanner = ReplayFingerprintScanner(self.trace, self.clock,
+                                                            template_index=template_index)
+        self.card_reader = ReplayCardReader(self.trace, self.clock)
+        self.camera_system = ReplayCameraSystem(self.trace, self.clock, image_store)
+
+    def card_source(self) -> TraceCardSource:
+        """A card_reader_service source over the same cards (use instead of card_reader)"""
+        return TraceCardSource(self.trace, self.clock)
+
+    def drive(self, session_manager, class_name: str, subject: str = 'Replay') -> dict:
+        """Run the trace through a session manager built on these drivers
+
+        A teacher's fingerprint starts a session (or ends the running one),
+        cards mark attendance and camera events trigger a verification.
+        """
+        stats = {'events': 0, 'sessions': 0, 'scans': 0, 'marked': 0, 'verifications': 0,
+                 'ignored': 0}
+        start = time.perf_counter()
+        self.clock.start()
+        for event in self.trace.events:
+            if not self.clock.wait_until(event['t']):
+                break
+            stats['events'] += 1
+            device = event['device']
+            if device == 'fingerprint':
+                # Both calls read this event through verify_teacher
+                if session_manager.session_active:
+                    session_manager.end_attendance_session()
+                else:
+                    success, _ = session_manager.start_attendance_session(class_name, subject)
+                    stats['sessions'] += success
+            elif device == 'card':
+                card_id = self.card_reader.read_card()
+                if not session_manager.session_active:
+                    stats['ignored'] += 1
+                    continue
+                stats['scans'] += 1
+                success, _ = session_manager.mark_student(card_id)
+                stats['marked'] += success
+            elif session_manager.session_active:
+                success, _ = session_manager.perform_camera_verification()
+                stats['verifications'] += success
+            else:
+                stats['ignored'] += 1
+
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+        stats['trace_seconds'] = self.trace.duration
+        stats['speedup'] = round(self.trace.duration / stats['seconds'], 1) if stats['seconds'] else None
+        return stats
+
+
+def synthesize_day(teacher_ids: List[str], cards: List[str], periods: int = 6,
+                   period_minutes: float = 45.0, break_minutes: float = 10.0,
+                   attendance_rate: float = 0.9, bounce_probability: float = 0.1,
+                   camera_interval_minutes: float = 5.0, seed: Optional[int] = None) -> List[dict]:
+    """A plausible school day of device events for one classroom"""
+    rng = random.Random(seed)
+    events = []
+    t = 0.0
+    for period in range(periods):
+        teacher_id = teacher_ids[period % len(teacher_ids)]
+        start = t + rng.uniform(0, 60)
+        events.append({'t': start, 'device': 'fingerprint', 'teacher_id': teacher_id})
+
+        # Most students arrive in the first few minutes; some tap twice
+        present = [card for card in cards if rng.random() < attendance_rate]
+        for card_id in present:
+            tap = start + rng.expovariate(1 / 90.0) + 5
+            events.append({'t': tap, 'device': 'card', 'card_id': card_id})
+            if rng.random() < bounce_probability:
+                events.append({'t': tap + rng.uniform(0.2, 5), 'device': 'card', 'card_id': card_id})
+
+        end = start + period_minutes * 60
+        for camera_t in np.arange(start + 240, end - 60, camera_interval_minutes * 60):
+            # A student without a card now and then, and detector noise
+            count = len(present) + (rng.random() < 0.1) + rng.choice((-1, 0, 0, 0, 1))
+            counts = [max(0, count + rng.choice((-1, 0, 0, 1))) for _ in range(5)]
+            events.append({'t': float(camera_t), 'device': 'camera', 'count': max(0, count),
+                           'counts': counts})
+
+        events.append({'t': end, 'device': 'fingerprint', 'teacher_id': teacher_id})
+        t = end + break_minutes * 60
+
+    for event in events:
+        event['t'] = round(event['t'], 3)
+    return sorted(events, key=lambda event: event['t'])
+
+
+def write_trace(path: str, events: List[dict], **header):
+    with open(path, 'w') as f:
+        f.write(json.dumps({'trace': TRACE_FORMAT, 'version': TRACE_VERSION,
+                            'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                            **header}) + '\n')
+        for event in events:
+            f.write(json.dumps(event, separators=(',', ':')) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Device traces for replaying school days")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    synth = sub.add_parser('synthesize', help="Generate a school day trace from the roster in the database")
+    synth.add_argument('--db', default='attendance_system.db')
+    synth.add_argument('--class', dest='class_name', required=True)
+    synth.add_argument('--periods', type=int, default=6)
+    synth.add_argument('--seed', type=int)
+    synth.add_argument('--output', required=True)
+
+    summary = sub.add_parser('summary', help="Events per device and duration of a trace")
+    summary.add_argument('trace')
+    args = parser.parse_args()
+
+    if args.command == 'summary':
+        print(json.dumps(Trace.load(args.trace).summary(), indent=2))
+        return 0
+
+    conn = sqlite3.connect(args.db)
+    cards = [row[0] for row in conn.execute(
+        "SELECT card_id FROM students WHERE class_name = ? ORDER BY card_id", (args.class_name,))]
+    teachers = [row[0] for row in conn.execute("SELECT teacher_id FROM teachers ORDER BY teacher_id")]
+    conn.close()
+    if not cards or not teachers:
+        print(f"No students in class {args.class_name} or no teachers in {args.db}", file=sys.stderr)
+        return 1
+
+    events = synthesize_day(teachers, cards, args.periods, seed=args.seed)
+    write_trace(args.output, events, classroom=args.class_name, synthetic=True)
+    print(f"Wrote {len(events)} events ({events[-1]['t'] / 3600:.1f} h) to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# Per-device worker threads
+#
+# Hardware calls block: a fingerprint capture waits for a finger, a camera
+# verification runs the detector for seconds. When one box serves several
+# classrooms, each physical device gets its own thread and command queue,
+# so a slow camera in room 10A never delays a fingerprint scan in 10B, and
+# calls to the same device never overlap.
+
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+import metrics
+
+# Commands waiting per device; beyond this the device is considered stuck
+QUEUE_SIZE = 32
+
+DEVICE_QUEUE_DEPTH = metrics.gauge(
+    'device_queue_depth', 'Commands waiting for a device worker', ['device'], multiprocess_mode='max')
+DEVICE_ERRORS = metrics.counter('device_errors_total', 'Device commands that raised', ['device'])
+
+
+class DeviceBusy(RuntimeError):
+    """The device's command queue is full"""
+
+
+class DeviceWorker:
+    """One thread and one command queue for one physical device"""
+
+    def __init__(self, name: str, queue_size: int = QUEUE_SIZE):
+        self.name = name
+        self.stats = {'processed': 0, 'errors': 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._depth = DEVICE_QUEUE_DEPTH.labels(name)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if not self.running:
+            self._thread = threading.Thread(target=self._run, daemon=True, name=f"device-{self.name}")
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """Finish queued commands, then stop"""
+        if self.running:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Run fn on the device thread; raises DeviceBusy if too many commands are waiting"""
+        future = Future()
+        try:
+            self._queue.put_nowait((future, fn, args, kwargs))
+        except queue.Full:
+            raise DeviceBusy(f"Device {self.name} is busy") from None
+        self._depth.set(self._queue.qsize())
+        return future
+
+    def call(self, fn, *args, timeout: Optional[float] = None, **kwargs):
+        """submit() and wait for the result"""
+        return self.submit(fn, *args, **kwargs).result(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            self._depth.set(self._queue.qsize())
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+                self.stats['processed'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                DEVICE_ERRORS.labels(self.name).inc()
+                future.set_exception(e)
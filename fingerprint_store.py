@@ -0,0 +1,229 @@
+# Persisted fingerprint templates
+#
+# teachers.fingerprint_template is the source of truth. Triggers append to
+# a `fingerprint_enrollments` ledger whenever a template is added, changed
+# or deleted, so any device can ask "what changed since sequence N".
+#
+# Each device keeps a compact copy of all templates next to the database:
+# a .npy matrix (one float32 row per teacher) plus a .json sidecar with the
+# teacher IDs, the ledger sequence it reflects and a digest of the matrix.
+# At boot the matrix is memory-mapped straight into the FingerprintIndex (no
+# BLOB rows are read) and only ledger entries newer than the sidecar are
+# applied on top. The two files are replaced one after the other, so a
+# sidecar whose digest doesn't match the matrix (a crash in between) means
+# the rows can't be trusted to belong to its teacher IDs: load() rebuilds.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from fingerprint_index import TEMPLATE_DIM, decode_template
+
+DEFAULT_TEMPLATE_PATH = 'fingerprint_templates.npy'
+
+# How often a device checks the ledger for enrollments made elsewhere
+REFRESH_INTERVAL_SECONDS = 30.0
+
+
+def create_fingerprint_tables(cursor):
+    """Create the enrollment ledger and its triggers (idempotent)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fingerprint_enrollments (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            teacher_id TEXT NOT NULL,
+            enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS fingerprint_enrollment_insert
+        AFTER INSERT ON teachers WHEN NEW.fingerprint_template IS NOT NULL
+        BEGIN
+            INSERT INTO fingerprint_enrollments (teacher_id) VALUES (NEW.teacher_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS fingerprint_enrollment_update
+        AFTER UPDATE OF fingerprint_template ON teachers
+        BEGIN
+            INSERT INTO fingerprint_enrollments (teacher_id) VALUES (NEW.teacher_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS fingerprint_enrollment_delete
+        AFTER DELETE ON teachers WHEN OLD.fingerprint_template IS NOT NULL
+        BEGIN
+            INSERT INTO fingerprint_enrollments (teacher_id) VALUES (OLD.teacher_id);
+        END
+    ''')
+
+    # Templates stored before the ledger existed
+    cursor.execute('''
+        INSERT INTO fingerprint_enrollments (teacher_id)
+        SELECT teacher_id FROM teachers
+        WHERE fingerprint_template IS NOT NULL
+          AND teacher_id NOT IN (SELECT teacher_id FROM fingerprint_enrollments)
+    ''')
+
+
+class TemplateStore:
+    """Keeps a FingerprintIndex in sync with the database via a memory-mapped file"""
+
+    def __init__(self, db_path='attendance_system.db', template_path=DEFAULT_TEMPLATE_PATH):
+        self.db_path = db_path
+        self.template_path = template_path
+        self.meta_path = os.path.splitext(template_path)[0] + '.json'
+        self.enrollment_seq = 0
+        self.save_error = None  # why the last template file write failed, for the caller to report
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_path)
+
+    def ensure_schema(self):
+        conn = self.get_connection()
+        try:
+            create_fingerprint_tables(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load(self, index):
+        """Map the template file into the index, then apply newer enrollments"""
+        with self._lock:
+            self.ensure_schema()
+            mapped = self._map_file(index)
+            if not mapped:
+                self._rebuild(index)
+            changed = self._apply_enrollments(index)
+            if not mapped or changed:
+                self._save(index)
+            self._last_refresh = time.monotonic()
+            return len(index)
+
+    def refresh(self, index):
+        """Apply enrollments made since the last load/refresh; returns how many"""
+        with self._lock:
+            changed = self._apply_enrollments(index)
+            if changed:
+                self._save(index)
+            self._last_refresh = time.monotonic()
+            return changed
+
+    def refresh_if_due(self, index):
+        if time.monotonic() - self._last_refresh >= REFRESH_INTERVAL_SECONDS:
+            return self.refresh(index)
+        return 0
+
+    def enroll(self, index, teacher_id: str, template_blob: bytes) -> bool:
+        """Store a teacher's template in the database and the local file"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(
+                "UPDATE teachers SET fingerprint_template = ? WHERE teacher_id = ?",
+                (template_blob, teacher_id)
+            )
+            conn.commit()
+            if cursor.rowcount == 0:
+                return False
+        finally:
+            conn.close()
+
+        self.refresh(index)
+        return True
+
+    def _map_file(self, index) -> bool:
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            matrix = np.load(self.template_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return False
+
+        teacher_ids = meta.get('teacher_ids', [])
+        if (meta.get('dim') != TEMPLATE_DIM or matrix.dtype != np.float32
+                or matrix.shape != (len(teacher_ids), TEMPLATE_DIM)
+                or meta.get('digest') != _digest(matrix)):
+            return False
+
+        # A file ahead of the ledger belongs to another (or a restored) database
+        conn = self.get_connection()
+        try:
+            latest = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM fingerprint_enrollments").fetchone()[0]
+        finally:
+            conn.close()
+        if meta.get('enrollment_seq', 0) > latest:
+            return False
+
+        index.attach(matrix, teacher_ids)
+        self.enrollment_seq = meta['enrollment_seq']
+        return True
+
+    def _rebuild(self, index):
+        conn = self.get_connection()
+        try:
+            # Read the sequence first: anything enrolled meanwhile is re-applied afterwards
+            self.enrollment_seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM fingerprint_enrollments").fetchone()[0]
+            rows = conn.execute(
+                "SELECT teacher_id, fingerprint_template FROM teachers WHERE fingerprint_template IS NOT NULL"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        index.clear()
+        for teacher_id, blob in rows:
+            template = decode_template(blob)
+            if template is not None:
+                index.add(teacher_id, template)
+
+    def _apply_enrollments(self, index) -> int:
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('''
+                SELECT e.seq, e.teacher_id, t.fingerprint_template
+                FROM fingerprint_enrollments e
+                LEFT JOIN teachers t ON t.teacher_id = e.teacher_id
+                WHERE e.seq > ?
+                ORDER BY e.seq
+            ''', (self.enrollment_seq,)).fetchall()
+        finally:
+            conn.close()
+
+        for seq, teacher_id, blob in rows:
+            template = decode_template(blob)
+            if template is None:
+                index.remove(teacher_id)
+            else:
+                index.add(teacher_id, template)
+            self.enrollment_seq = seq
+        return len(rows)
+
+    def _save(self, index):
+        matrix, teacher_ids = index.snapshot()
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        meta = {'dim': TEMPLATE_DIM, 'enrollment_seq': self.enrollment_seq, 'teacher_ids': teacher_ids,
+                'digest': _digest(matrix)}
+        try:
+            with open(self.template_path + '.tmp', 'wb') as f:
+                np.save(f, matrix)
+            with open(self.meta_path + '.tmp', 'w') as f:
+                json.dump(meta, f)
+            # A crash between the two leaves a digest mismatch, which load() rebuilds
+            os.replace(self.template_path + '.tmp', self.template_path)
+            os.replace(self.meta_path + '.tmp', self.meta_path)
+            self.save_error = None
+        except OSError as e:
+            # The database still has everything; the next boot just maps less
+            self.save_error = f"Could not write template file {self.template_path}: {e}"
+
+
+def _digest(matrix) -> str:
+    """Digest of the matrix contents, tying a sidecar to the matrix written with it"""
+    return hashlib.blake2b(np.ascontiguousarray(matrix).data, digest_size=16).hexdigest()
@@ -0,0 +1,218 @@
+# Response compression and conditional GET
+#
+# Dashboard pages and JSON endpoints are pure functions of the URL and the
+# database contents. Every write to the core tables bumps a one-row
+# `data_version` counter (maintained by triggers, so it is shared by all
+# gunicorn workers), and GET responses carry a weak ETag built from that
+# counter. A poll whose If-None-Match still matches is answered with 304
+# before the view runs, so nothing is queried or rendered.
+#
+# Responses above a size threshold are gzip- or brotli-compressed according
+# to Accept-Encoding, and bytes saved are recorded per route. The stats are
+# served at /debug/compression only when ATTENDANCE_COMPRESSION_STATS is set.
+
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+
+from flask import g, jsonify, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies are not worth the CPU or the extra headers
+MIN_COMPRESS_BYTES = 1024
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv',
+    'application/json', 'application/javascript', 'text/javascript', 'image/svg+xml',
+}
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Set to serve the per-route stats at /debug/compression (off by default)
+STATS_ENDPOINT_ENV = 'ATTENDANCE_COMPRESSION_STATS'
+
+# Tables whose writes change what pages show
+VERSIONED_TABLES = ('teachers', 'students', 'sessions', 'attendance', 'camera_logs')
+
+
+def create_data_version(cursor):
+    """Create the data_version counter and its triggers (idempotent)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+
+    for table in VERSIONED_TABLES:
+        for action in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS bump_data_version_{table}_{action.lower()}
+                AFTER {action} ON {table}
+                BEGIN
+                    UPDATE data_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+
+class DataVersion:
+    """Reads the shared data_version counter over a per-thread connection"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def ensure_schema(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            create_data_version(conn.cursor())
+            conn.commit()
+        except sqlite3.OperationalError:
+            # Core tables not created yet; ETags fall back to "no version"
+            pass
+        finally:
+            conn.close()
+
+    def current(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+
+
+class CompressionStats:
+    """Bytes before and after compression, per route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, encoding, original, compressed):
+        with self._lock:
+            entry = self._routes.setdefault(route, {
+                'responses': 0, 'compressed_responses': 0, 'not_modified': 0,
+                'bytes_original': 0, 'bytes_sent': 0, 'bytes_saved': 0,
+            })
+            if encoding == '304':
+                entry['not_modified'] += 1
+                return
+            entry['responses'] += 1
+            entry['bytes_original'] += original
+            entry['bytes_sent'] += compressed
+            entry['bytes_saved'] += original - compressed
+            if encoding:
+                entry['compressed_responses'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {route: dict(entry) for route, entry in self._routes.items()}
+
+
+def _code_stamp(app):
+    """Changes whenever templates or the asset manifest change (i.e. on deploy)"""
+    digest = hashlib.sha1()
+    template_folder = os.path.join(app.root_path, app.template_folder or 'templates')
+    if os.path.isdir(template_folder):
+        for name in sorted(os.listdir(template_folder)):
+            stat = os.stat(os.path.join(template_folder, name))
+            digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+    digest.update(repr(sorted(app.config.get('ASSET_MANIFEST', {}).items())).encode())
+    return digest.hexdigest()[:8]
+
+
+def _negotiate(accept_encodings):
+    if brotli is not None and accept_encodings['br'] > 0:
+        return 'br'
+    if accept_encodings['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def init_app(app, db_path, exempt_endpoints=()):
+    """Install conditional GET and compression on every non-static route"""
+    data_version = DataVersion(db_path)
+    data_version.ensure_schema()
+    stats = CompressionStats()
+    code_stamp = _code_stamp(app)
+    exempt = set(exempt_endpoints) | {'static', 'dist_asset'}
+
+    app.extensions['compression_stats'] = stats
+
+    def route_name():
+        return request.url_rule.rule if request.url_rule else request.path
+
+    @app.before_request
+    def short_circuit_not_modified():
+        if request.method not in ('GET', 'HEAD') or request.endpoint in exempt:
+            return None
+
+        version = data_version.current()
+        if version is None:
+            return None
+
+        url_hash = hashlib.sha1(request.full_path.encode()).hexdigest()[:8]
+        g.etag = f"{code_stamp}-{version}-{url_hash}"
+
+        if request.if_none_match.contains_weak(g.etag):
+            stats.record(route_name(), '304', 0, 0)
+            response = app.response_class(status=304)
+            response.set_etag(g.etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return None
+
+    @app.after_request
+    def compress_and_tag(response):
+        if response.status_code == 304:
+            return response
+
+        etag = g.pop('etag', None)
+        if etag and response.status_code == 200 and not response.get_etag()[0]:
+            response.set_etag(etag, weak=True)
+            # Browsers may keep the page but must revalidate (cheaply) each time
+            response.headers.setdefault('Cache-Control', 'no-cache')
+
+        if (request.endpoint in exempt
+                or response.direct_passthrough
+                or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        encoding = _negotiate(request.accept_encodings) if len(body) >= MIN_COMPRESS_BYTES else None
+
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+        elif encoding == 'gzip':
+            compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        else:
+            stats.record(route_name(), None, len(body), len(body))
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        stats.record(route_name(), encoding, len(body), len(compressed))
+        return response
+
+    if os.environ.get(STATS_ENDPOINT_ENV):
+        @app.route('/debug/compression')
+        def compression_stats():
+            """Bytes saved by response compression, per route"""
+            return jsonify(stats.snapshot())
+
+        exempt.add('compression_stats')
+    return stats
@@ -0,0 +1,185 @@
+# Verification image store
+#
+# Camera verification images used to be written synchronously into the
+# working directory. The store instead takes the frame, returns its key at
+# once and leaves JPEG encoding, the thumbnail and the disk write to a
+# background thread, so a verification finishes as soon as the count is
+# known.
+#
+# Images are content-addressed: the key is a hash of the frame's pixels and
+# files are sharded two levels deep to keep directories small:
+#
+#     verification_images/3f/a2/3fa2...e1.jpg        full image
+#     verification_images/3f/a2/3fa2...e1.thumb.jpg  thumbnail for the session page
+#
+# camera_logs.image_path stores the key (`3f/a2/3fa2...e1`). The content
+# behind a key never changes, so the web routes serve images with a
+# one-year immutable Cache-Control header.
+
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from typing import Optional
+
+import cv2
+
+import metrics
+
+DEFAULT_IMAGE_DIR = os.environ.get('ATTENDANCE_IMAGE_DIR', 'verification_images')
+
+DEFAULT_JPEG_QUALITY = 85
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_QUALITY = 70
+
+# Frames waiting for the writer. A 720p frame is ~2.7 MB, so keep this small;
+# when it is full, save() waits for room rather than dropping evidence
+QUEUE_SIZE = 16
+
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}$')
+
+IMAGE_WRITE_SECONDS = metrics.histogram(
+    'image_store_write_seconds', 'Encode and write time per verification image')
+
+
+def image_key(frame) -> str:
+    """Content address of a frame: a hash of its pixels, sharded as aa/bb/aabb..."""
+    digest = hashlib.blake2b(frame.tobytes(), digest_size=16).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def is_image_key(value) -> bool:
+    """True for store keys (as opposed to older free-form image paths)"""
+    return bool(value) and bool(KEY_PATTERN.match(value))
+
+
+class ImageStore:
+    """Content-addressed JPEG store with a background writer"""
+
+    def __init__(self, root: str = DEFAULT_IMAGE_DIR, quality: int = DEFAULT_JPEG_QUALITY,
+                 thumbnail_width: int = THUMBNAIL_WIDTH, queue_size: int = QUEUE_SIZE):
+        self.root = root
+        self.quality = quality
+        self.thumbnail_width = thumbnail_width
+        self.stats = {'saved': 0, 'deduplicated': 0, 'errors': 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def path_for(self, key: str, thumbnail: bool = False) -> str:
+        if not is_image_key(key):
+            raise ValueError(f"Not an image key: {key!r}")
+        return os.path.join(self.root, *key.split('/')) + ('.thumb.jpg' if thumbnail else '.jpg')
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path_for(key))
+
+    def save(self, frame) -> str:
+        """Queue a BGR frame for writing; returns its key immediately"""
+        key = image_key(frame)
+        with self._lock:
+            if key in self._pending:
+                return key
+            self._pending.add(key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name='image-writer')
+                self._thread.start()
+        self._queue.put((key, frame))
+        return key
+
+    def pending(self, key: str) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued image is on disk"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def _run(self):
+        while True:
+            key, frame = self._queue.get()
+            try:
+                self._write(key, frame)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Could not store verification image {key}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def _write(self, key, frame):
+        path = self.path_for(key)
+        if os.path.exists(path):
+            self.stats['deduplicated'] += 1
+            return
+
+        start = time.perf_counter()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        height, width = frame.shape[:2]
+        thumbnail = frame
+        if width > self.thumbnail_width:
+            thumbnail = cv2.resize(frame, (self.thumbnail_width, height * self.thumbnail_width // width),
+                                   interpolation=cv2.INTER_AREA)
+        # Thumbnail first: once the full image exists the key counts as stored
+        _write_jpeg(self.path_for(key, thumbnail=True), thumbnail, THUMBNAIL_QUALITY)
+        _write_jpeg(path, frame, self.quality)
+
+        self.stats['saved'] += 1
+        IMAGE_WRITE_SECONDS.observe(time.perf_counter() - start)
+
+
+def _write_jpeg(path, image, quality):
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality),
+                                               cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(encoded.tobytes())
+    os.replace(tmp_path, path)
+
+
+def init_app(app, root: str = DEFAULT_IMAGE_DIR):
+    """Serve stored images at /images/<key>.jpg and /images/<key>.thumb.jpg"""
+    from flask import abort, send_file, url_for
+
+    store = ImageStore(root)
+    app.extensions['image_store'] = store
+
+    @app.route('/images/<path:filename>')
+    def verification_image(filename):
+        thumbnail = filename.endswith('.thumb.jpg')
+        key = filename[:-len('.thumb.jpg')] if thumbnail else filename[:-len('.jpg')]
+        if not filename.endswith('.jpg') or not is_image_key(key):
+            abort(404)
+
+        path = os.path.abspath(store.path_for(key, thumbnail))
+        if not os.path.exists(path):
+            abort(404)
+        response = send_file(path, mimetype='image/jpeg', conditional=True, etag=True,
+                             max_age=CACHE_MAX_AGE)
+        response.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}, immutable'
+        return response
+
+    @app.template_global()
+    def image_url(image_path, thumbnail=False):
+        """URL of a stored verification image, or None for older free-form paths"""
+        if not is_image_key(image_path):
+            return None
+        suffix = '.thumb.jpg' if thumbnail else '.jpg'
+        return url_for('verification_image', filename=image_path + suffix)
+
+    return store
@@ -0,0 +1,316 @@
+# Person detection in worker processes
+#
+# HOG and cv2.dnn release the GIL for most of an inference, but not all of
+# it: pre/post-processing, NMS and the Python around them hold it. When a
+# camera verification runs in the same process as the Flask handlers or the
+# card reader threads, those stall for a good part of every detection. The
+# executor moves inference into a pool of worker processes that each load
+# the detector once:
+#
+#     caller --frame--> shared memory slot --slot index--> worker: detect()
+#            <------------- Future(boxes) <-------------- boxes (a few ints)
+#
+# Frames are copied into a preallocated shared-memory slot rather than
+# pickled through a pipe, so a 640 px frame costs one memcpy. There is one
+# slot per job that may be in flight (`max_pending`). When they are all taken,
+# submit() raises InferenceBusy instead of queueing without bound. Cancelling
+# a future before its worker starts skips the inference; cancel_all() drops
+# everything still waiting, e.g. when a session ends.
+#
+# Enabled for cameras with ATTENDANCE_INFERENCE_WORKERS=<n> (0 or unset:
+# detect in-process through MODELS). Workers are started with forkserver,
+# so they don't inherit this process's threads. As with any multiprocessing
+# code, a script that enables it must keep its top level under
+# `if __name__ == '__main__':` (notebooks and app.py are fine).
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+import metrics
+from person_counter import DEFAULT_DETECT_WIDTH, make_detector
+
+DEFAULT_WORKERS = 1
+# Jobs in flight (queued or running) per executor; each one holds a slot
+DEFAULT_MAX_PENDING = 4
+# Slot capacity before any frame has been seen: a 640x480 BGR frame
+DEFAULT_SLOT_BYTES = 640 * 480 * 3
+# Slot header; byte 0 is the cancel flag
+HEADER_BYTES = 64
+
+INFERENCE_SECONDS = metrics.histogram(
+    'inference_executor_seconds', 'Detection round trip through the worker pool', ['stage'])
+INFERENCE_PENDING = metrics.gauge(
+    'inference_executor_pending', 'Detection jobs in flight', multiprocess_mode='max')
+INFERENCE_REJECTED = metrics.counter(
+    'inference_executor_rejected_total', 'Detection jobs refused because the queue was full')
+
+
+class InferenceBusy(RuntimeError):
+    """Every slot has a detection in flight"""
+
+
+# --- worker process side ---------------------------------------------------
+
+_detector = None
+_attached: Dict[int, shared_memory.SharedMemory] = {}
+
+
+def _init_worker(factory, model_path, config_path, warmup_width):
+    global _detector
+    _detector = (factory or make_detector)(model_path, config_path)
+    # Pay the lazy setup before the first real frame
+    blank = np.zeros((warmup_width * 9 // 16, warmup_width, 3), dtype=np.uint8)
+    _detector.detect(blank)
+
+
+def _attach(slot: int, name: str) -> shared_memory.SharedMemory:
+    shm = _attached.get(slot)
+    if shm is None or shm.name != name:
+        if shm is not None:
+            shm.close()  # the slot was regrown under a new name
+        shm = _attached[slot] = shared_memory.SharedMemory(name=name)
+    return shm
+
+
+def _detect_in_worker(slot: int, name: str, shape, dtype: str):
+    shm = _attach(slot, name)
+    if shm.buf[0]:
+        return None  # cancelled while queued
+    frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=HEADER_BYTES)
+    start = time.perf_counter()
+    boxes = _detector.detect(frame)
+    elapsed = time.perf_counter() - start
+    del frame  # release the buffer export before the next job
+    return [tuple(int(v) for v in box) for box in boxes], elapsed
+
+
+# --- caller side -----------------------------------------------------------
+
+class _Slot:
+    def __init__(self, index: int, size: int):
+        self.index = index
+        self.shm = shared_memory.SharedMemory(create=True, size=HEADER_BYTES + size)
+
+    @property
+    def capacity(self):
+        return self.shm.size - HEADER_BYTES
+
+    def fit(self, size: int):
+        if size > self.capacity:
+            self.release()
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER_BYTES + size)
+
+    def write(self, frame):
+        self.shm.buf[0] = 0
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf, offset=HEADER_BYTES)
+        np.copyto(view, frame)
+        del view
+
+    def cancel(self):
+        self.shm.buf[0] = 1
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class InferenceExecutor:
+    """Runs a person detector in worker processes; submit() returns a Future of boxes
+
+    `factory(model_path, config_path)` builds the detector in each worker and
+    must be picklable (a module-level function); default make_detector.
+    """
+
+    def __init__(self, model_path: Optional[str] = None, config_path: Optional[str] = None,
+                 workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING,
+                 warmup_width: int = DEFAULT_DETECT_WIDTH, factory: Optional[Callable] = None,
+                 mp_context=None):
+        self.model_path = model_path
+        self.config_path = config_path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.warmup_width = warmup_width
+        self.factory = factory
+        self.name = 'process-pool'
+        self.stats = {'submitted': 0, 'completed': 0, 'cancelled': 0, 'rejected': 0, 'errors': 0}
+        # forkserver: workers don't inherit this process's threads (and their held locks)
+        self._context = mp_context or multiprocessing.get_context(
+            'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+        self._pool = None
+        self._slots = []
+        self._free = []
+        self._jobs: Dict[Future, tuple] = {}  # caller future -> (slot, pool future)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.start_seconds = None      # worker start-up, detector load and warmup
+        self.inference_seconds = None  # first round trip after that
+
+    def start(self, timeout: Optional[float] = None):
+        """Start the workers and wait until the detector is loaded and warmed up"""
+        blank = np.zeros((self.warmup_width * 9 // 16, self.warmup_width, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        self.submit(blank).result(timeout)
+        self.start_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        self.submit(blank).result(timeout)
+        self.inference_seconds = time.perf_counter() - start
+        return self
+
+    def submit(self, frame) -> Future:
+        """Queue a detection; the Future resolves to the frame's boxes
+
+        Raises InferenceBusy when max_pending detections are already in flight.
+        """
+        frame = np.ascontiguousarray(frame)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Inference executor is shut down")
+            if self._free:
+                slot = self._free.pop()
+            elif len(self._slots) < self.max_pending:
+                slot = _Slot(len(self._slots), max(frame.nbytes, DEFAULT_SLOT_BYTES))
+                self._slots.append(slot)
+            else:
+                self.stats['rejected'] += 1
+                INFERENCE_REJECTED.inc()
+                raise InferenceBusy(f"{self.max_pending} detections already in flight")
+            pool = self._ensure_pool()
+
+        slot.fit(frame.nbytes)
+        slot.write(frame)
+        future = Future()
+        submitted = time.perf_counter()
+        try:
+            pool_future = pool.submit(_detect_in_worker, slot.index, slot.shm.name, frame.shape, frame.dtype.str)
+        except BrokenProcessPool:
+            with self._lock:
+                self._pool = None
+                self._free.append(slot)
+            raise
+        with self._lock:
+            self._jobs[future] = (slot, pool_future)
+            self.stats['submitted'] += 1
+            INFERENCE_PENDING.set(len(self._jobs))
+        future.add_done_callback(self._caller_done)
+        pool_future.add_done_callback(lambda f: self._worker_done(future, slot, f, pool, submitted))
+        return future
+
+    def detect(self, frame):
+        """Blocking detect() for PersonCounter; the GIL is free while the worker runs"""
+        return self.submit(frame).result()
+
+    def info(self) -> dict:
+        return {
+            'model': self.model_path or 'hog',
+            'detector': f"{self.name} x{self.workers}",
+            'load_ms': round(self.start_seconds * 1000, 1) if self.start_seconds is not None else None,
+            'warmup_ms': None,  # part of load_ms: each worker warms up as it starts
+            'inference_ms': (round(self.inference_seconds * 1000, 1)
+                             if self.inference_seconds is not None else None),
+        }
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def cancel_all(self) -> int:
+        """Cancel every detection still in flight; returns how many were cancelled"""
+        with self._lock:
+            futures = list(self._jobs)
+        return sum(future.cancel() for future in futures)
+
+    def shutdown(self, wait: bool = True):
+        self.cancel_all()
+        with self._lock:
+            self._closed = True
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+        with self._lock:
+            for slot in self._slots:
+                slot.release()
+            self._slots, self._free = [], []
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=self._context,
+                                             initializer=_init_worker,
+                                             initargs=(self.factory, self.model_path, self.config_path,
+                                                       self.warmup_width))
+        return self._pool
+
+    def _caller_done(self, future):
+        if not future.cancelled():
+            return
+        with self._lock:
+            job = self._jobs.get(future)
+        if job is not None:
+            slot, pool_future = job
+            # Not started yet: the worker sees the flag and skips the frame
+            slot.cancel()
+            pool_future.cancel()
+            self.stats['cancelled'] += 1
+
+    def _worker_done(self, future, slot, pool_future, pool, submitted):
+        with self._lock:
+            self._jobs.pop(future, None)
+            if not self._closed:
+                self._free.append(slot)
+            INFERENCE_PENDING.set(len(self._jobs))
+        if future.done():
+            return  # cancelled by the caller
+
+        error = None if pool_future.cancelled() else pool_future.exception()
+        if pool_future.cancelled() or (error is None and pool_future.result() is None):
+            future.cancel()
+            return
+        if error is not None:
+            self.stats['errors'] += 1
+            if isinstance(error, BrokenProcessPool):
+                # A worker died (e.g. out of memory); start a fresh pool on the next submit
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+            future.set_exception(error)
+            return
+
+        boxes, detect_seconds = pool_future.result()
+        self.stats['completed'] += 1
+        INFERENCE_SECONDS.labels('detect').observe(detect_seconds)
+        INFERENCE_SECONDS.labels('round_trip').observe(time.perf_counter() - submitted)
+        future.set_result(boxes)
+
+
+_executors: Dict[tuple, InferenceExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def configured_workers() -> int:
+    return int(os.environ.get('ATTENDANCE_INFERENCE_WORKERS', '0') or 0)
+
+
+def shared_executor(model_path: Optional[str] = None, config_path: Optional[str] = None,
+                    workers: Optional[int] = None, warmup_width: int = DEFAULT_DETECT_WIDTH) -> InferenceExecutor:
+    """The process's executor for a model, started on first use; shared by every camera"""
+    key = (model_path or None, config_path or None)
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            executor = InferenceExecutor(*key, workers=workers or configured_workers() or DEFAULT_WORKERS,
+                                         warmup_width=warmup_width)
+            try:
+                executor.start()
+            except Exception:
+                executor.shutdown(wait=False)
+                raise
+            _executors[key] = executor
+        return executor
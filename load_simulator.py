@@ -0,0 +1,359 @@
+# Card reader load simulator
+#
+# Finds where SQLite lock contention starts. For every combination of
+# journal mode, batch size and worker count it copies a synthetic school
+# database, opens one active session per classroom door, and runs N
+# simulated card readers split across worker processes (as gunicorn -w
+# would) with one thread per reader. Each scan is written the way the app
+# writes it: batch size 1 goes through the mark_attendance path (one
+# connection and commit per scan), larger sizes buffer scans and submit
+# them through apply_scan_batch like a networked reader.
+#
+# `database is locked` errors are retried with backoff; the report lists
+# throughput, scan-to-commit latency percentiles, lock errors, retries and
+# scans that were given up on, per configuration.
+#
+# Usage: python load_simulator.py --readers 64 --rate 2 --scans 100 \
+#            --journal-modes delete wal --batch-sizes 1 20 --workers 1 4
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from scan_ingest import apply_scan_batch, is_locked_error, mark_attendance_row
+from synthetic_data import generate_school
+
+DEFAULT_BUSY_TIMEOUT = 5.0
+DEFAULT_MAX_RETRIES = 5
+RETRY_BACKOFF_SECONDS = 0.01
+
+# A buffered reader flushes when its batch is full or this old
+MAX_BATCH_DELAY_SECONDS = 0.5
+
+# Share of scans that are a second tap of a card already scanned
+DEFAULT_DUPLICATE_RATE = 0.05
+
+DEFAULT_P99_TARGET_MS = 1000.0
+
+
+class SimulatedCardReader:
+    """Stand-in for CardReader that yields a classroom's cards in random order"""
+
+    def __init__(self, reader_id, cards, duplicate_rate=DEFAULT_DUPLICATE_RATE, seed=None):
+        self.reader_id = reader_id
+        self.is_connected = False
+        self._rng = random.Random(seed)
+        self._cards = list(cards)
+        self._rng.shuffle(self._cards)
+        self._position = 0
+        self._duplicate_rate = duplicate_rate
+
+    def connect(self):
+        self.is_connected = True
+        return True
+
+    def read_card(self):
+        if not self.is_connected:
+            return None
+        if self._position and self._rng.random() < self._duplicate_rate:
+            return self._cards[self._rng.randrange(self._position)]
+        card_id = self._cards[self._position % len(self._cards)]
+        self._position += 1
+        return card_id
+
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.scans = 0
+        self.marked = 0
+        self.rejected = 0
+        self.locked_errors = 0
+        self.retries = 0
+        self.failures = 0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in
+                ('latencies', 'scans', 'marked', 'rejected', 'locked_errors', 'retries', 'failures')}
+
+
+def _with_retries(operation, stats, max_retries, scans=1):
+    """Run operation, retrying `database is locked`; returns its result or None
+
+    `scans` is how many scans the operation carries; all of them count as
+    abandoned when it gives up.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if not is_locked_error(e):
+                raise
+            with stats.lock:
+                stats.locked_errors += 1
+                if attempt == max_retries:
+                    stats.failures += scans
+                    return None
+                stats.retries += 1
+            time.sleep(RETRY_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5))
+    return None
+
+
+def _mark_attendance(db_path, busy_timeout, session_id, card_id):
+    # Same steps as AttendanceSystem.mark_attendance
+    conn = sqlite3.connect(db_path, timeout=busy_timeout)
+    try:
+        cursor = conn.cursor()
+        success, message = mark_attendance_row(cursor, session_id, card_id)
+        if success:
+            conn.commit()
+        return success
+    finally:
+        conn.close()
+
+
+def _submit_batch(db_path, busy_timeout, events):
+    # Same steps as WebAttendanceSystem.record_scans
+    conn = sqlite3.connect(db_path, timeout=busy_timeout)
+    try:
+        return apply_scan_batch(conn, events)
+    finally:
+        conn.close()
+
+
+def _run_reader(reader, session_id, config, start_at, stats):
+    db_path = config['db_path']
+    busy_timeout = config['busy_timeout']
+    max_retries = config['max_retries']
+    batch_size = config['batch_size']
+    interval = 1.0 / config['rate'] if config['rate'] > 0 else 0.0
+
+    buffer = []
+
+    def flush():
+        events = [event for event, _ in buffer]
+        results = _with_retries(lambda: _submit_batch(db_path, busy_timeout, events), stats, max_retries,
+                                len(events))
+        committed = time.perf_counter()
+        with stats.lock:
+            if results is not None:
+                for (event, scanned), result in zip(buffer, results):
+                    stats.latencies.append(committed - scanned)
+                    if result['success']:
+                        stats.marked += 1
+                    else:
+                        stats.rejected += 1
+        buffer.clear()
+
+    reader.connect()
+    time.sleep(max(0.0, start_at - time.time()))
+    next_scan = time.perf_counter()
+
+    for i in range(config['scans']):
+        if interval:
+            # Open loop: scans arrive on schedule even when writes fall behind
+            next_scan += interval * random.uniform(0.5, 1.5)
+            time.sleep(max(0.0, next_scan - time.perf_counter()))
+
+        card_id = reader.read_card()
+        scanned = time.perf_counter()
+        with stats.lock:
+            stats.scans += 1
+
+        if batch_size <= 1:
+            success = _with_retries(
+                lambda: _mark_attendance(db_path, busy_timeout, session_id, card_id), stats, max_retries)
+            latency = time.perf_counter() - scanned
+            with stats.lock:
+                if success is not None:
+                    stats.latencies.append(latency)
+                    if success:
+                        stats.marked += 1
+                    else:
+                        stats.rejected += 1
+            continue
+
+        buffer.append(({
+            'event_id': f"{reader.reader_id}:{i}",
+            'reader_id': reader.reader_id,
+            'card_id': card_id,
+            'session_id': session_id,
+            'scanned_at': datetime.datetime.now().isoformat(),
+        }, scanned))
+        if len(buffer) >= batch_size or time.perf_counter() - buffer[0][1] >= MAX_BATCH_DELAY_SECONDS:
+            flush()
+
+    if buffer:
+        flush()
+
+
+def run_worker(config, assignments, start_at):
+    """One worker process: a thread per (reader_id, session_id, cards) assignment"""
+    stats = _Stats()
+    threads = []
+    for reader_id, session_id, cards, seed in assignments:
+        reader = SimulatedCardReader(reader_id, cards, config['duplicate_rate'], seed)
+        thread = threading.Thread(target=_run_reader, args=(reader, session_id, config, start_at, stats),
+                                  name=f"reader-{reader_id}", daemon=True)
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict(stats.to_dict(), finished_at=time.time())
+
+
+def prepare_database(template_path, target_path, journal_mode, sessions, seed):
+    """Copy the template school, set the journal mode, open `sessions` active sessions
+
+    Returns the opened (session_id, class_name) pairs and each class's cards.
+    """
+    shutil.copyfile(template_path, target_path)
+    conn = sqlite3.connect(target_path)
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+
+    rng = random.Random(seed)
+    classes = [row[0] for row in conn.execute("SELECT DISTINCT class_name FROM students ORDER BY class_name")]
+    teacher_id = conn.execute("SELECT teacher_id FROM teachers LIMIT 1").fetchone()[0]
+    opened = []
+    for i in range(sessions):
+        class_name = classes[i % len(classes)]
+        session_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        conn.execute(
+            "INSERT INTO sessions (session_id, teacher_id, class_name, subject, start_time) VALUES (?, ?, ?, ?, ?)",
+            (session_id, teacher_id, class_name, 'Load test', datetime.datetime.now())
+        )
+        opened.append((session_id, class_name))
+    conn.commit()
+
+    cards = {class_name: [] for class_name in classes}
+    for class_name, card_id in conn.execute("SELECT class_name, card_id FROM students"):
+        cards[class_name].append(card_id)
+    conn.close()
+    return opened, cards
+
+
+def run_configuration(template_path, work_dir, journal_mode, batch_size, workers, args):
+    db_path = os.path.join(work_dir, f"load_{journal_mode}_{batch_size}_{workers}.db")
+    sessions = args.sessions or args.readers
+    opened, cards = prepare_database(template_path, db_path, journal_mode, sessions, args.seed)
+
+    config = {
+        'db_path': db_path,
+        'batch_size': batch_size,
+        'rate': args.rate,
+        'scans': args.scans,
+        'busy_timeout': args.busy_timeout,
+        'max_retries': args.max_retries,
+        'duplicate_rate': args.duplicate_rate,
+    }
+
+    # Readers are spread over the worker processes round-robin; each one
+    # reads the cards of its session's class
+    assignments = [[] for _ in range(workers)]
+    for i in range(args.readers):
+        session_id, class_name = opened[i % len(opened)]
+        assignments[i % workers].append(
+            (f"R{i:04d}", session_id, cards[class_name], args.seed * 100_003 + i))
+
+    # Every reader starts at the same moment, once all processes and threads are up
+    start_at = time.time() + 1.0 + 0.05 * args.readers / workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_worker, config, chunk, start_at) for chunk in assignments if chunk]
+        results = [future.result() for future in futures]
+    elapsed = max(r['finished_at'] for r in results) - start_at
+
+    latencies = np.array([lat for r in results for lat in r['latencies']]) * 1000
+    totals = {key: sum(r[key] for r in results)
+              for key in ('scans', 'marked', 'rejected', 'locked_errors', 'retries', 'failures')}
+
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    def percentile(q):
+        return round(float(np.percentile(latencies, q)), 2) if latencies.size else None
+
+    p99 = percentile(99)
+    return {
+        'journal_mode': journal_mode,
+        'batch_size': batch_size,
+        'workers': workers,
+        'readers': args.readers,
+        'rate_per_reader': args.rate,
+        **totals,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(totals['scans'] / elapsed, 1) if elapsed > 0 else None,
+        'latency_ms': {'p50': percentile(50), 'p95': percentile(95), 'p99': p99,
+                       'max': round(float(latencies.max()), 2) if latencies.size else None},
+        'safe': totals['failures'] == 0 and p99 is not None and p99 <= args.p99_target_ms,
+    }
+
+
+def print_report(rows, p99_target_ms):
+    print(f"\n{'journal':<8} {'batch':>5} {'workers':>7} {'scans':>7} {'scans/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'locked':>7} {'retries':>7} {'failed':>6}  safe")
+    for row in rows:
+        latency = row['latency_ms']
+        print(f"{row['journal_mode']:<8} {row['batch_size']:>5} {row['workers']:>7} {row['scans']:>7} "
+              f"{row['throughput_per_second']:>8} {latency['p50']:>8} {latency['p95']:>8} {latency['p99']:>8} "
+              f"{row['locked_errors']:>7} {row['retries']:>7} {row['failures']:>6}  "
+              f"{'yes' if row['safe'] else 'no'}")
+    print(f"(safe = no abandoned scans and p99 <= {p99_target_ms:g} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent card reader load simulator")
+    parser.add_argument('--db', help="Template school database (default: generate one)")
+    parser.add_argument('--students', type=int, default=1200, help="School size when generating")
+    parser.add_argument('--readers', type=int, default=32, help="Simulated card readers (threads)")
+    parser.add_argument('--sessions', type=int, help="Active sessions (default: one per reader)")
+    parser.add_argument('--scans', type=int, default=100, help="Scans per reader")
+    parser.add_argument('--rate', type=float, default=2.0, help="Scans per second per reader (0 = unthrottled)")
+    parser.add_argument('--journal-modes', nargs='+', default=['delete', 'wal'])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 20])
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 4], help="Worker process counts")
+    parser.add_argument('--busy-timeout', type=float, default=DEFAULT_BUSY_TIMEOUT,
+                        help="sqlite3 connect timeout in seconds")
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument('--duplicate-rate', type=float, default=DEFAULT_DUPLICATE_RATE)
+    parser.add_argument('--p99-target-ms', type=float, default=DEFAULT_P99_TARGET_MS)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write results JSON here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='attendance-load-') as work_dir:
+        template_path = args.db
+        if not template_path:
+            template_path = os.path.join(work_dir, 'template.db')
+            print(f"Generating a {args.students}-student school...")
+            generate_school(template_path, students=args.students, days=5, seed=args.seed)
+
+        rows = []
+        for journal_mode, batch_size, workers in itertools.product(
+                args.journal_modes, args.batch_sizes, args.workers):
+            print(f"Running journal_mode={journal_mode} batch_size={batch_size} workers={workers}...")
+            rows.append(run_configuration(template_path, work_dir, journal_mode, batch_size, workers, args))
+
+    print_report(rows, args.p99_target_ms)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
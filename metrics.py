@@ -0,0 +1,374 @@
+# Metrics registry with Prometheus text export
+#
+# Counters, gauges and fixed-bucket histograms, optionally labelled:
+#
+#     SCANS = metrics.counter('scans_total', 'Card scans', ['result'])
+#     SCANS.labels('marked').inc()
+#
+#     with LATENCY.time():
+#         ...
+#
+# Under gunicorn each worker has its own registry. When the
+# ATTENDANCE_METRICS_DIR environment variable is set, every process flushes
+# a snapshot to <dir>/metrics_<pid>.json about once a second, and /metrics
+# merges all snapshots: counters and histograms are summed, gauges are
+# combined per their mode. Empty the directory before starting the server.
+
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+MULTIPROCESS_DIR_ENV = 'ATTENDANCE_METRICS_DIR'
+FLUSH_INTERVAL_SECONDS = 1.0
+
+# Latency buckets (seconds) from sub-millisecond DB writes to slow camera runs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def labels(self, *labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return _Child(self, tuple(str(value) for value in labelvalues))
+
+    def _default_child(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return _Child(self, ())
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): self._copy(value) for key, value in self._values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class _Child:
+    """A metric bound to one set of label values"""
+
+    __slots__ = ('_metric', '_key')
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        self._metric._inc(self._key, amount)
+
+    def dec(self, amount=1):
+        self._metric._inc(self._key, -amount)
+
+    def set(self, value):
+        self._metric._set(self._key, value)
+
+    def observe(self, value):
+        self._metric._observe(self._key, value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def _inc(self, key, amount):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        super().__init__(name, documentation, labelnames)
+        # How values from several worker processes combine: sum, max or min
+        self.multiprocess_mode = multiprocess_mode
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def dec(self, amount=1):
+        self._default_child().dec(amount)
+
+    def set(self, value):
+        self._default_child().set(value)
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value):
+        self._default_child().observe(value)
+
+    @contextmanager
+    def time(self):
+        with self._default_child().time():
+            yield
+
+    def _observe(self, key, value):
+        # Per-bucket (non-cumulative) counts plus a +Inf slot, then sum and count
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {
+                'type': metric.type_name,
+                'documentation': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'buckets': list(getattr(metric, 'buckets', ())),
+                'mode': getattr(metric, 'multiprocess_mode', None),
+                'values': metric.snapshot(),
+            }
+            for metric in metrics
+        }
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), multiprocess_mode='sum'):
+    return REGISTRY.register(Gauge(name, documentation, labelnames, multiprocess_mode))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Multi-process support
+
+# Threads do not survive fork, so track which process owns the flusher
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _multiprocess_dir():
+    return os.environ.get(MULTIPROCESS_DIR_ENV)
+
+
+def flush(registry=REGISTRY):
+    """Write this process's snapshot for other workers' /metrics to merge"""
+    directory = _multiprocess_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+    with open(path + '.tmp', 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def _start_flusher():
+    global _flusher_pid
+    if _flusher_pid == os.getpid() or not _multiprocess_dir():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(FLUSH_INTERVAL_SECONDS)
+            try:
+                flush()
+            except OSError:
+                pass
+
+    threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+    atexit.register(flush)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect(registry=REGISTRY):
+    """Current metrics: this process only, or merged across workers"""
+    directory = _multiprocess_dir()
+    if not directory:
+        return registry.snapshot()
+
+    flush(registry)
+    merged = {}
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('metrics_') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = _pid_alive(int(name[len('metrics_'):-len('.json')]))
+        _merge(merged, snapshot, alive)
+    return merged
+
+
+def _merge(merged, snapshot, alive):
+    for name, metric in snapshot.items():
+        target = merged.setdefault(name, dict(metric, values={}))
+        if metric['type'] == 'gauge' and not alive:
+            # A dead worker's gauges no longer describe anything
+            continue
+        for key, value in metric['values'].items():
+            if key not in target['values']:
+                target['values'][key] = value
+            elif metric['type'] == 'histogram':
+                target['values'][key] = [a + b for a, b in zip(target['values'][key], value)]
+            elif metric['type'] == 'gauge' and metric['mode'] == 'max':
+                target['values'][key] = max(target['values'][key], value)
+            elif metric['type'] == 'gauge' and metric['mode'] == 'min':
+                target['values'][key] = min(target['values'][key], value)
+            else:
+                target['values'][key] += value
+
+
+# Prometheus text format
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_text(snapshot):
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        labelnames = metric['labelnames']
+        lines.append(f"# HELP {name} {metric['documentation']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key in sorted(metric['values']):
+            labelvalues = json.loads(key)
+            value = metric['values'][key]
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+                continue
+
+            cumulative = 0
+            bounds = metric['buckets'] + [float('inf')]
+            for bound, count in zip(bounds, value[:-2]):
+                cumulative += count
+                le = (('le', _format_value(float(bound))),)
+                lines.append(f"{name}_bucket{_format_labels(labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, labelvalues)} {_format_value(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(labelnames, labelvalues)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+# Flask integration
+
+HTTP_REQUEST_SECONDS = histogram(
+    'http_request_duration_seconds', 'Flask request latency', ['route', 'method', 'status'])
+
+
+def init_app(app):
+    """Time every Flask route and serve /metrics"""
+    _start_flusher()
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+        # A no-op except in the first request of a worker forked after init_app
+        _start_flusher()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_REQUEST_SECONDS.labels(route, request.method, response.status_code).observe(
+                time.perf_counter() - start)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus text exposition of all metrics"""
+        return Response(render_text(collect()), mimetype='text/plain; version=0.0.4')
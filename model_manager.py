@@ -0,0 +1,132 @@
+# Detection model manager
+#
+# Loading a person detector (reading DNN weights, building the HOG SVM) and
+# its first inference (memory allocation, kernel selection) can take
+# seconds on a Raspberry Pi. The manager loads each model once per process
+# and runs a warmup inference straight away, so no camera verification pays
+# that cold start. Every CameraSystem in the process shares the same loaded
+# model.
+#
+# Under gunicorn, load the models in the master before it forks
+# (`--preload` with ATTENDANCE_PRELOAD_MODELS=1). The workers then share
+# the weights copy-on-write instead of each holding its own copy.
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+import metrics
+from person_counter import DEFAULT_DETECT_WIDTH, make_detector
+
+MODEL_LOAD_SECONDS = metrics.histogram(
+    'detection_model_load_seconds', 'Detection model load and warmup time', ['phase'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+
+class SharedModel:
+    """A loaded detector shared by every camera in the process
+
+    cv2.dnn networks are not safe to run from two threads at once, so
+    detect() calls are serialized.
+    """
+
+    def __init__(self, key, detector, load_seconds: float):
+        self.key = key
+        self.detector = detector
+        self.name = getattr(detector, 'name', type(detector).__name__)
+        self.load_seconds = load_seconds
+        self.warmup_seconds = None
+        self.inference_seconds = None  # first inference after warmup
+        self.loaded_pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def detect(self, frame):
+        with self._lock:
+            return self.detector.detect(frame)
+
+    def warmup(self, width: int = DEFAULT_DETECT_WIDTH):
+        """Run two inferences on a blank frame; the first one pays the lazy setup"""
+        frame = np.zeros((width * 9 // 16, width, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        self.detect(frame)
+        self.warmup_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        self.detect(frame)
+        self.inference_seconds = time.perf_counter() - start
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def info(self) -> dict:
+        return {
+            'model': self.key[0] or 'hog',
+            'detector': self.name,
+            'load_ms': round(self.load_seconds * 1000, 1),
+            'warmup_ms': round(self.warmup_seconds * 1000, 1) if self.warmup_seconds is not None else None,
+            'inference_ms': round(self.inference_seconds * 1000, 1) if self.inference_seconds is not None else None,
+            # Loaded by the parent before fork: shared copy-on-write
+            'inherited': self.loaded_pid != os.getpid(),
+        }
+
+
+class ModelManager:
+    """Loads each detection model once per process, on first use or at preload"""
+
+    def __init__(self):
+        self._models: Dict[tuple, SharedModel] = {}
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            # A lock held by another thread at fork time would never be released in the child
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self, model_path: Optional[str] = None, config_path: Optional[str] = None,
+            warmup_width: int = DEFAULT_DETECT_WIDTH) -> SharedModel:
+        """The shared model for (model_path, config_path), loading and warming it up if needed"""
+        key = (model_path or None, config_path or None)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            model = self._models.get(key)
+            if model is not None:
+                return model
+
+            start = time.perf_counter()
+            detector = make_detector(*key)
+            model = SharedModel(key, detector, time.perf_counter() - start)
+            model.warmup(warmup_width)
+            MODEL_LOAD_SECONDS.labels('load').observe(model.load_seconds)
+            MODEL_LOAD_SECONDS.labels('warmup').observe(model.warmup_seconds)
+            self._models[key] = model
+            return model
+
+    def preload_from_env(self) -> Optional[SharedModel]:
+        """Load the model configured by ATTENDANCE_DETECTION_MODEL (HOG if unset)"""
+        try:
+            model = self.get(os.environ.get('ATTENDANCE_DETECTION_MODEL'),
+                             os.environ.get('ATTENDANCE_DETECTION_CONFIG'))
+        except (RuntimeError, cv2.error) as e:
+            # Cameras will report the same error when they try to load it
+            print(f"Detection model not preloaded: {e}")
+            return None
+        info = model.info()
+        print(f"Detection model {info['model']} preloaded: load {info['load_ms']} ms, "
+              f"warmup {info['warmup_ms']} ms, inference {info['inference_ms']} ms")
+        return model
+
+    def loaded(self):
+        return [model.info() for model in self._models.values()]
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        for model in self._models.values():
+            model._after_fork()
+
+
+MODELS = ModelManager()
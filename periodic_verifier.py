@@ -0,0 +1,190 @@
+# Motion-gated periodic camera verification
+#
+# Running the person detector on every frame would keep a Raspberry Pi busy
+# all lesson. Instead the verifier samples a frame every `sample_interval`
+# seconds and scores it against the previous sample: the share of pixels
+# that changed, on a small blurred grayscale copy (1-2 ms for a
+# 720p frame). The full detector only runs
+#
+#   - after motion crossed `motion_threshold` and the room has settled again
+#     (counting people mid-walk gives wrong answers), or has kept moving for
+#     `max_motion_wait` seconds, and at least `min_interval` after the last run
+#   - or when `max_interval` has passed without a run
+#
+# and a camera_logs row (with its image) is written only when the count
+# differs from the last logged one. A quiet room costs one cheap score per
+# sample; a busy changeover costs a few detector runs. A tick that fails
+# (camera unplugged, database locked) is logged and counted, and the next
+# interval runs as usual.
+
+import logging
+import threading
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+import metrics
+
+SAMPLE_INTERVAL_SECONDS = 1.0
+MOTION_WIDTH = 160
+
+# Share of pixels that must change to count as motion
+MOTION_THRESHOLD = 0.01
+# Per-pixel difference (0-255) that counts as a change
+PIXEL_THRESHOLD = 25
+
+SETTLE_SECONDS = 3.0
+MAX_MOTION_WAIT_SECONDS = 30.0
+MIN_INTERVAL_SECONDS = 10.0
+MAX_INTERVAL_SECONDS = 300.0
+
+VERIFIER_DETECTIONS = metrics.counter(
+    'camera_verifier_detections_total', 'Detector runs by the periodic verifier', ['trigger'])
+VERIFIER_ERRORS = metrics.counter(
+    'camera_verifier_errors_total', 'Periodic verifier ticks that raised')
+VERIFIER_MOTION = metrics.gauge(
+    'camera_verifier_motion', 'Latest motion score (share of changed pixels)', multiprocess_mode='max')
+
+logger = logging.getLogger('periodic_verifier')
+
+
+class MotionScorer:
+    """Share of pixels that changed since the previous sample"""
+
+    def __init__(self, width: int = MOTION_WIDTH, pixel_threshold: int = PIXEL_THRESHOLD):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self._previous = None
+
+    def score(self, frame) -> float:
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, height * self.width // width)),
+                           interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # Blur so sensor noise and compression artefacts don't count as motion
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        previous, self._previous = self._previous, small
+        if previous is None or previous.shape != small.shape:
+            return 0.0
+        changed = cv2.absdiff(small, previous) > self.pixel_threshold
+        return float(np.count_nonzero(changed)) / changed.size
+
+
+class PeriodicVerifier:
+    """Background thread that re-counts the room when it changes"""
+
+    def __init__(self, camera_system, attendance_system, session_id: str,
+                 sample_interval: float = SAMPLE_INTERVAL_SECONDS,
+                 motion_threshold: float = MOTION_THRESHOLD, settle_seconds: float = SETTLE_SECONDS,
+                 max_motion_wait: float = MAX_MOTION_WAIT_SECONDS,
+                 min_interval: float = MIN_INTERVAL_SECONDS, max_interval: float = MAX_INTERVAL_SECONDS,
+                 on_log=None):
+        self.camera_system = camera_system
+        self.attendance_system = attendance_system
+        self.session_id = session_id
+        self.sample_interval = sample_interval
+        self.motion_threshold = motion_threshold
+        self.settle_seconds = settle_seconds
+        self.max_motion_wait = max_motion_wait
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.on_log = on_log
+        self.scorer = MotionScorer()
+        self.last_count = None
+        self.stats = {'samples': 0, 'motion_samples': 0, 'detections': 0, 'logged': 0,
+                      'motion_triggered': 0, 'interval_triggered': 0, 'detector_seconds': 0.0, 'errors': 0}
+
+        self._last_detection = None   # monotonic time of the last detector run
+        self._motion_started = None   # first motion since the last run
+        self._last_motion = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"verifier-{self.session_id[:8]}")
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        # Count once at the start so there is a baseline to compare against
+        self._tick('start')
+        while not self._stop.wait(self.sample_interval):
+            self._tick()
+
+    def _tick(self, trigger: Optional[str] = None):
+        """Sample, and run the detector if due; a failure doesn't end the thread"""
+        try:
+            trigger = trigger or self.sample()
+            if trigger:
+                self._verify(trigger)
+        except Exception:
+            self.stats['errors'] += 1
+            VERIFIER_ERRORS.inc()
+            logger.exception("Camera verification tick failed for session %s", self.session_id)
+
+    def sample(self, now: Optional[float] = None) -> Optional[str]:
+        """Score the latest frame; the reason to run the detector now, if any"""
+        now = time.monotonic() if now is None else now
+        frame = self.camera_system.latest_frame()
+        if frame is not None:
+            score = self.scorer.score(frame)
+            self.stats['samples'] += 1
+            VERIFIER_MOTION.set(score)
+            if score >= self.motion_threshold:
+                self.stats['motion_samples'] += 1
+                self._last_motion = now
+                if self._motion_started is None:
+                    self._motion_started = now
+
+        since_detection = now - self._last_detection if self._last_detection is not None else float('inf')
+        if since_detection >= self.max_interval:
+            return 'interval'
+        if self._motion_started is None or since_detection < self.min_interval:
+            return None
+        if now - self._last_motion >= self.settle_seconds or now - self._motion_started >= self.max_motion_wait:
+            return 'motion'
+        return None
+
+    def _verify(self, trigger: str):
+        start = time.perf_counter()
+        try:
+            result = self.camera_system.detect(keep_image=True)
+        finally:
+            # Also after a failed run, so a broken detector is retried at
+            # the normal cadence rather than on every sample
+            self._last_detection = time.monotonic()
+            self._motion_started = self._last_motion = None
+        if result is None:
+            return
+
+        self.stats['detections'] += 1
+        self.stats['detector_seconds'] += time.perf_counter() - start
+        if trigger in ('motion', 'interval'):
+            self.stats[f'{trigger}_triggered'] += 1
+        VERIFIER_DETECTIONS.labels(trigger).inc()
+
+        count = result['count']
+        if count == self.last_count:
+            return
+        image_key = self.camera_system.store_image(result)
+        discrepancy = self.attendance_system.log_camera_verification(self.session_id, count, image_key)
+        # Only once logged, so a failed write is retried on the next run
+        self.last_count = count
+        self.stats['logged'] += 1
+        if self.on_log:
+            self.on_log(count, discrepancy, trigger)
@@ -0,0 +1,368 @@
+# Person counting for camera verification
+#
+# A capture thread reads the classroom camera (or a video file) into a small
+# ring buffer of recent frames. A verification takes a burst of fresh frames,
+# downscales each to the detection width, runs a CPU person detector on it
+# and reports the median count, so one frame where a student is hidden
+# behind another (or a coat looks like a person) doesn't decide the result.
+#
+# Detectors: OpenCV's HOG people detector (no model file needed; part of
+# opencv-python 4.x) or an SSD model through cv2.dnn, e.g. MobileNet-SSD
+# (Caffe) or ssd_mobilenet (TensorFlow), which is more accurate for seated
+# people. Both run on a Raspberry Pi CPU; the frame width, burst size and a
+# time budget bound how long a verification takes.
+#
+# Usage: python person_counter.py --source 0 --frames 5 --width 640 --budget 3
+#        python person_counter.py --source classroom.mp4 --model MobileNetSSD_deploy.caffemodel \
+#            --config MobileNetSSD_deploy.prototxt --person-class 15 --save counted.jpg
+
+import argparse
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, TimeoutError as FuturesTimeout
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Frames are shrunk to this width before detection (HOG cost grows with area)
+DEFAULT_DETECT_WIDTH = 640
+
+# Frames per verification, and the wall-clock budget they must fit in
+DEFAULT_BURST_FRAMES = 5
+DEFAULT_TIME_BUDGET_SECONDS = 3.0
+
+# Recent frames kept by the capture thread
+RING_SIZE = 8
+
+CAPTURE_WIDTH = 1280
+CAPTURE_HEIGHT = 720
+
+# Overlapping boxes above this IoU are one person
+NMS_THRESHOLD = 0.45
+
+DEFAULT_DNN_CONFIDENCE = 0.5
+# Class ID of "person" in the model's label map (MobileNet-SSD Caffe: 15, COCO TF models: 1)
+DEFAULT_PERSON_CLASS = 15
+
+Box = Tuple[int, int, int, int]
+
+
+class FrameRing:
+    """Thread-safe ring buffer of the most recent (sequence, timestamp, frame)"""
+
+    def __init__(self, size: int = RING_SIZE):
+        self._frames = deque(maxlen=size)
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    def push(self, frame):
+        with self._condition:
+            self._sequence += 1
+            self._frames.append((self._sequence, time.monotonic(), frame))
+            self._condition.notify_all()
+
+    def latest(self):
+        """The newest (sequence, timestamp, frame), or None before the first frame"""
+        with self._condition:
+            return self._frames[-1] if self._frames else None
+
+    def next_after(self, sequence: int, timeout: float):
+        """The oldest buffered frame newer than `sequence` (None on timeout)"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                for entry in self._frames:
+                    if entry[0] > sequence:
+                        return entry
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    return None
+
+
+class CaptureThread:
+    """Reads frames from a camera index or video file into a FrameRing"""
+
+    def __init__(self, source, width: int = CAPTURE_WIDTH, height: int = CAPTURE_HEIGHT,
+                 ring_size: int = RING_SIZE, loop: bool = True):
+        # "0" on the command line means camera 0, anything else is a file/URL
+        self.source = int(source) if str(source).isdigit() else source
+        self.width = width
+        self.height = height
+        self.loop = loop
+        self.ring = FrameRing(ring_size)
+        self.error = None
+        self._capture = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_file(self):
+        return not isinstance(self.source, int)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        self._capture = cv2.VideoCapture(self.source)
+        if not self._capture.isOpened():
+            self.error = f"Cannot open camera source {self.source!r}"
+            return False
+        if not self.is_file:
+            self._capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self._capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+            # Keep the driver from queueing stale frames behind ours
+            self._capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='camera-capture')
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def _run(self):
+        # Files are paced at their own frame rate so they behave like a live camera
+        fps = self._capture.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        interval = 1.0 / fps if fps and fps > 0 else 0.0
+        next_at = time.monotonic()
+
+        while not self._stop.is_set():
+            ok, frame = self._capture.read()
+            if not ok:
+                if self.is_file and self.loop:
+                    self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                self.error = "Camera stopped delivering frames"
+                return
+            self.ring.push(frame)
+            if interval:
+                next_at += interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(delay)
+                else:
+                    next_at = time.monotonic()
+
+
+def downscale(frame, width: int):
+    """Resize to `width` keeping the aspect ratio; returns (frame, scale)"""
+    height, original_width = frame.shape[:2]
+    if original_width <= width:
+        return frame, 1.0
+    scale = width / original_width
+    return cv2.resize(frame, (width, int(round(height * scale))), interpolation=cv2.INTER_AREA), scale
+
+
+def _suppress(boxes: List[Box], scores: List[float], score_threshold: float) -> List[Box]:
+    if not boxes:
+        return []
+    keep = cv2.dnn.NMSBoxes(boxes, [float(s) for s in scores], score_threshold, NMS_THRESHOLD)
+    return [boxes[i] for i in np.array(keep).ravel()]
+
+
+class HogPersonDetector:
+    """OpenCV's default HOG + linear SVM people detector"""
+
+    name = 'hog'
+
+    def __init__(self, win_stride=(8, 8), padding=(8, 8), scale=1.05, hit_threshold=0.0):
+        if not hasattr(cv2, 'HOGDescriptor'):
+            raise RuntimeError("This OpenCV build has no HOG detector; use a DNN model (--model)")
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        self.win_stride = win_stride
+        self.padding = padding
+        self.scale = scale
+        self.hit_threshold = hit_threshold
+
+    def detect(self, frame) -> List[Box]:
+        rects, weights = self.hog.detectMultiScale(
+            frame, hitThreshold=self.hit_threshold, winStride=self.win_stride,
+            padding=self.padding, scale=self.scale)
+        boxes = [tuple(int(v) for v in rect) for rect in rects]
+        return _suppress(boxes, np.ravel(weights).tolist(), self.hit_threshold)
+
+
+class DnnPersonDetector:
+    """SSD-style detection network (DetectionOutput: [1, 1, N, 7]) through cv2.dnn"""
+
+    name = 'dnn'
+
+    def __init__(self, model_path: str, config_path: Optional[str] = None, input_size=(300, 300),
+                 confidence: float = DEFAULT_DNN_CONFIDENCE, person_class: int = DEFAULT_PERSON_CLASS,
+                 scale_factor: float = 1 / 127.5, mean=(127.5, 127.5, 127.5), swap_rb: bool = False):
+        self.net = cv2.dnn.readNet(model_path, config_path or '')
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.confidence = confidence
+        self.person_class = person_class
+        self.scale_factor = scale_factor
+        self.mean = mean
+        self.swap_rb = swap_rb
+
+    def detect(self, frame) -> List[Box]:
+        height, width = frame.shape[:2]
+        blob = cv2.dnn.blobFromImage(frame, self.scale_factor, self.input_size, self.mean,
+                                     swapRB=self.swap_rb, crop=False)
+        self.net.setInput(blob)
+        detections = self.net.forward().reshape(-1, 7)
+
+        rows = detections[(detections[:, 1] == self.person_class) & (detections[:, 2] >= self.confidence)]
+        boxes = []
+        for x1, y1, x2, y2 in np.clip(rows[:, 3:7], 0.0, 1.0) * [width, height, width, height]:
+            boxes.append((int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+        return _suppress(boxes, rows[:, 2].tolist(), self.confidence)
+
+
+def make_detector(model_path: Optional[str] = None, config_path: Optional[str] = None, **options):
+    """DNN detector if a model is given, otherwise HOG"""
+    if model_path:
+        return DnnPersonDetector(model_path, config_path, **options)
+    return HogPersonDetector()
+
+
+class PersonCounter:
+    """Median person count over a burst of fresh frames, within a time budget"""
+
+    def __init__(self, capture: CaptureThread, detector, detect_width: int = DEFAULT_DETECT_WIDTH,
+                 burst_frames: int = DEFAULT_BURST_FRAMES,
+                 time_budget: float = DEFAULT_TIME_BUDGET_SECONDS):
+        self.capture = capture
+        self.detector = detector
+        self.detect_width = detect_width
+        self.burst_frames = burst_frames
+        self.time_budget = time_budget
+
+    def count(self, keep_image: bool = False) -> dict:
+        """Median count over the burst; with keep_image, result['image'] is the annotated median frame"""
+        start = time.monotonic()
+        deadline = start + self.time_budget
+        sequence = self.capture.ring.sequence  # only frames captured after the request
+        counts = []
+        detections = []  # (frame, boxes, scale), kept only for keep_image
+        slowest = 0.0
+
+        while len(counts) < self.burst_frames:
+            remaining = deadline - time.monotonic()
+            # Skip the next frame if it probably can't finish inside the budget
+            if remaining <= slowest or remaining <= 0:
+                break
+            entry = self.capture.ring.next_after(sequence, remaining)
+            if entry is None:
+                break
+            sequence, _, frame = entry
+
+            frame_start = time.monotonic()
+            small, scale = downscale(frame, self.detect_width)
+            boxes = self._detect(small, remaining)
+            if boxes is None:
+                break
+            slowest = max(slowest, time.monotonic() - frame_start)
+            counts.append(len(boxes))
+            if keep_image:
+                detections.append((frame, boxes, scale))
+
+        result = {
+            'count': int(np.median(counts)) if counts else 0,
+            'counts': counts,
+            'frames': len(counts),
+            'seconds': round(time.monotonic() - start, 3),
+            'budget_exhausted': len(counts) < self.burst_frames,
+            'detector': getattr(self.detector, 'name', type(self.detector).__name__),
+        }
+
+        if keep_image:
+            result['image'] = None
+            if detections:
+                # The frame whose count is closest to the reported median
+                frame, boxes, scale = min(detections, key=lambda d: abs(len(d[1]) - result['count']))
+                result['image'] = annotate(frame, boxes, scale, result['count'])
+        return result
+
+    def _detect(self, frame, timeout: float):
+        """Boxes for a frame; None if an out-of-process detector can't deliver within timeout"""
+        submit = getattr(self.detector, 'submit', None)
+        if submit is None:
+            return self.detector.detect(frame)
+
+        from inference_executor import InferenceBusy
+        try:
+            future = submit(frame)
+        except InferenceBusy:
+            return None
+        try:
+            return future.result(timeout)
+        except FuturesTimeout:
+            # Don't leave the worker a frame nobody will read
+            future.cancel()
+            return None
+        except CancelledError:
+            # Cancelled by the executor (cancel_all/shutdown): count what we have
+            return None
+
+
+def annotate(frame, boxes: List[Box], scale: float, count: int):
+    """Copy of the frame with detection boxes (given at `scale`) and the count"""
+    image = frame.copy()
+    for x, y, w, h in boxes:
+        x, y, w, h = (int(round(v / scale)) for v in (x, y, w, h))
+        cv2.rectangle(image, (x, y), (x + w, y + h), (0, 200, 0), 2)
+    cv2.putText(image, f"Persons: {count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count persons from a camera or video file")
+    parser.add_argument('--source', default='0', help="Camera index or video file")
+    parser.add_argument('--frames', type=int, default=DEFAULT_BURST_FRAMES, help="Frames per count")
+    parser.add_argument('--width', type=int, default=DEFAULT_DETECT_WIDTH, help="Detection width in pixels")
+    parser.add_argument('--budget', type=float, default=DEFAULT_TIME_BUDGET_SECONDS, help="Seconds per count")
+    parser.add_argument('--model', help="DNN model file (default: HOG people detector)")
+    parser.add_argument('--config', help="DNN config file (.prototxt / .pbtxt)")
+    parser.add_argument('--person-class', type=int, default=DEFAULT_PERSON_CLASS)
+    parser.add_argument('--repeat', type=int, default=1, help="Counts to run")
+    parser.add_argument('--save', help="Write the annotated median frame here")
+    args = parser.parse_args()
+
+    options = {'person_class': args.person_class} if args.model else {}
+    try:
+        detector = make_detector(args.model, args.config, **options)
+    except (RuntimeError, cv2.error) as e:
+        print(f"Person detector unavailable: {e}")
+        return 1
+    capture = CaptureThread(args.source)
+    if not capture.start():
+        print(capture.error)
+        return 1
+
+    try:
+        counter = PersonCounter(capture, detector, args.width, args.frames, args.budget)
+        for _ in range(args.repeat):
+            result = counter.count(keep_image=bool(args.save))
+            if result.get('image') is not None:
+                cv2.imwrite(args.save, result['image'])
+            print(f"{result['count']} persons (per frame {result['counts']}) "
+                  f"in {result['seconds']}s using {result['detector']}"
+                  + (" - budget reached" if result['budget_exhausted'] else ""))
+    finally:
+        capture.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# Session presence bitmap
+#
+# During the bell rush most reads are repeats: a student tapping twice, a
+# card held too long, a friend checking they were counted. Each of those
+# used to cost a DB round trip just to answer "Already marked present".
+#
+# A PresenceBitmap holds one bit per student of the session's class,
+# indexed by a dense ordinal (position in the class roster, ordered by
+# student_id). It is loaded from the DB when a session starts or resumes
+# and a bit is set only after the DB has confirmed the student present, so
+# a set bit is always safe to reject on. Cards from outside the class roster
+# are tracked in a small set. Present/absent counts are kept incrementally.
+
+import threading
+from typing import Dict, List, Optional
+
+import metrics
+
+PRESENCE_REJECTIONS = metrics.counter(
+    'presence_duplicate_rejections_total', 'Repeat scans rejected from the in-memory presence bitmap')
+
+
+class PresenceBitmap:
+    """Who is present in one session: one bit per student of the class"""
+
+    def __init__(self, session_id: str, class_name: str, roster: List[tuple]):
+        # roster: (student_id, card_id) for every student in the class, any order
+        roster = sorted(roster)
+        self.session_id = session_id
+        self.class_name = class_name
+        self.student_ids = [student_id for student_id, _ in roster]
+        self._ordinals: Dict[str, int] = {card_id: i for i, (_, card_id) in enumerate(roster)}
+        self._bits = bytearray((len(roster) + 7) // 8)
+        self._roster_present = 0
+        self._other_cards = set()  # present students from outside the class roster
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, conn, session_id: str) -> Optional['PresenceBitmap']:
+        """Build the bitmap for a session from the DB (None if it doesn't exist)"""
+        row = conn.execute("SELECT class_name FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        class_name = row[0]
+
+        roster = conn.execute(
+            "SELECT student_id, card_id FROM students WHERE class_name = ?", (class_name,)
+        ).fetchall()
+        bitmap = cls(session_id, class_name, roster)
+
+        present = conn.execute('''
+            SELECT s.card_id FROM attendance a
+            JOIN students s ON a.student_id = s.student_id
+            WHERE a.session_id = ?
+        ''', (session_id,)).fetchall()
+        for (card_id,) in present:
+            bitmap.mark(card_id)
+        return bitmap
+
+    @classmethod
+    def load_active(cls, conn, classes: Optional[List[str]] = None) -> Dict[str, 'PresenceBitmap']:
+        """Bitmaps of every active session (optionally only some classes), keyed by session_id
+
+        One roster query and one attendance query for all sessions, instead of
+        three queries per session.
+        """
+        class_filter, params = '', ()
+        if classes is not None:
+            class_filter = f"AND s.class_name IN ({', '.join('?' * len(classes))})"
+            params = tuple(classes)
+
+        sessions = conn.execute(f'''
+            SELECT s.session_id, s.class_name FROM sessions s
+            WHERE s.status = 'active' {class_filter}
+        ''', params).fetchall()
+        if not sessions:
+            return {}
+
+        rosters: Dict[str, List[tuple]] = {class_name: [] for _, class_name in sessions}
+        roster_rows = conn.execute(f'''
+            SELECT class_name, student_id, card_id FROM students
+            WHERE class_name IN ({', '.join('?' * len(rosters))})
+        ''', tuple(rosters)).fetchall()
+        for class_name, student_id, card_id in roster_rows:
+            rosters[class_name].append((student_id, card_id))
+
+        bitmaps = {session_id: cls(session_id, class_name, rosters[class_name])
+                   for session_id, class_name in sessions}
+        present = conn.execute(f'''
+            SELECT a.session_id, st.card_id FROM sessions s
+            JOIN attendance a ON a.session_id = s.session_id
+            JOIN students st ON st.student_id = a.student_id
+            WHERE s.status = 'active' {class_filter}
+        ''', params).fetchall()
+        for session_id, card_id in present:
+            bitmap = bitmaps.get(session_id)
+            if bitmap is not None:  # started between the two queries
+                bitmap.mark(card_id)
+        return bitmaps
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def __contains__(self, card_id):
+        return self.is_present(card_id)
+
+    def is_present(self, card_id: str) -> bool:
+        ordinal = self._ordinals.get(card_id)
+        if ordinal is None:
+            return card_id in self._other_cards
+        return bool(self._bits[ordinal >> 3] & (1 << (ordinal & 7)))
+
+    def check(self, card_id: str) -> bool:
+        """is_present, counting a hit as a rejected repeat scan"""
+        if self.is_present(card_id):
+            PRESENCE_REJECTIONS.inc()
+            return True
+        return False
+
+    def mark(self, card_id: str) -> bool:
+        """Record a DB-confirmed presence; False if already set"""
+        ordinal = self._ordinals.get(card_id)
+        with self._lock:
+            if ordinal is None:
+                if card_id in self._other_cards:
+                    return False
+                self._other_cards.add(card_id)
+                return True
+
+            byte, bit = ordinal >> 3, 1 << (ordinal & 7)
+            if self._bits[byte] & bit:
+                return False
+            self._bits[byte] |= bit
+            self._roster_present += 1
+            return True
+
+    @property
+    def present_count(self) -> int:
+        return self._roster_present + len(self._other_cards)
+
+    @property
+    def absent_count(self) -> int:
+        """Students of the class not yet marked present"""
+        return len(self.student_ids) - self._roster_present
+
+    def absent_student_ids(self) -> List[str]:
+        return [student_id for i, student_id in enumerate(self.student_ids)
+                if not self._bits[i >> 3] & (1 << (i & 7))]
@@ -0,0 +1,366 @@
+# Card reader TCP listener
+#
+# Lightweight alternative to POST /api/scans for dumb serial-to-Ethernet
+# card readers. Readers keep a persistent TCP connection and send one scan
+# per line:
+#
+#     reader_id,card_id,timestamp[,session_id]
+#
+# Scans from all connections are queued, written in batches through
+# scan_ingest.apply_scan_batch, and acknowledged per line, in order:
+#
+#     status,card_id,timestamp,message
+#
+# where status is OK, DUP (already applied), FAIL (rejected), ERR (malformed
+# line) or RETRY (not written: the database stayed locked or the listener is
+# stopping; resend the same line, it is deduplicated by its event ID). When no session_id is sent the scan goes to the active
+# session of the reader's assigned class (--assign R1=10A), or to the only
+# active session if there is exactly one.
+#
+# Usage: python reader_listener.py [--port 5001] [--assign R1=10A ...]
+
+import argparse
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from scan_ingest import MAX_BATCH_SIZE, apply_scan_batch, is_locked_error
+
+DEFAULT_PORT = 5001
+
+# Longest accepted line; anything longer is a misbehaving reader
+MAX_LINE_BYTES = 256
+
+# Scans waiting for the writer across all connections. When full, connection
+# handlers stop reading and TCP flow control pushes back on the readers.
+QUEUE_SIZE = 10000
+
+# Unacknowledged scans allowed per connection
+MAX_IN_FLIGHT = 64
+
+# Pending connection backlog; readers reconnect in bursts after a power cut
+LISTEN_BACKLOG = 4096
+
+# How long the writer waits to fill a batch once the first scan arrives
+BATCH_WINDOW_SECONDS = 0.02
+
+# Writes of a batch while the database is locked or busy, with the delay
+# doubling between them, before its scans are acknowledged RETRY
+WRITE_ATTEMPTS = 4
+RETRY_DELAY_SECONDS = 0.05
+
+
+class ReaderListener:
+    """Asyncio TCP server that batches card reader scans into the DB"""
+
+    def __init__(self, db_path='attendance_system.db', host='0.0.0.0', port=DEFAULT_PORT,
+                 reader_classes: Optional[Dict[str, str]] = None,
+                 batch_size=MAX_BATCH_SIZE, batch_window=BATCH_WINDOW_SECONDS):
+        self.db_path = db_path
+        self.host = host
+        self.port = port
+        self.reader_classes = reader_classes or {}
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+
+        self.queue = None
+        self.server = None
+        self.connections = 0
+        self.stats = {'scans': 0, 'batches': 0, 'errors': 0, 'retries': 0}
+
+        # SQLite is blocking, so all writes happen on one dedicated thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scan-writer')
+        self._conn = None
+        self._writer_task = None
+        self._stopping = False
+        self._handlers = set()  # (task, StreamReader) of open connections
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._writer_task = asyncio.create_task(self._batch_writer())
+        self.server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port,
+            limit=MAX_LINE_BYTES, backlog=LISTEN_BACKLOG
+        )
+        # Port 0 picks a free port; report the real one
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def stop(self):
+        """Stop accepting scans, answer every pending one and close
+
+        Scans that were queued but not written are acknowledged RETRY, so no
+        connection handler is left waiting on a future that never resolves.
+        """
+        self._stopping = True
+        if self.server:
+            self.server.close()
+        if self._writer_task:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+        if self.queue is not None:
+            while not self.queue.empty():
+                event, future = self.queue.get_nowait()
+                _retry(future, event, 'Listener stopping')
+
+        # End open connections; their handlers flush the remaining acks
+        for _, reader in self._handlers:
+            reader.feed_eof()
+        handlers = [task for task, _ in self._handlers]
+        if handlers:
+            await asyncio.gather(*handlers, return_exceptions=True)
+        if self.server:
+            await self.server.wait_closed()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_connection)
+        self._executor.shutdown(wait=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Card reader listener on {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        handler = (asyncio.current_task(), reader)
+        self._handlers.add(handler)
+        self.connections += 1
+        in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        acks = asyncio.Queue()
+        ack_task = asyncio.create_task(self._send_acks(writer, acks, in_flight))
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    await in_flight.acquire()
+                    await acks.put(_ready(('ERR', '', '', 'Line too long')))
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+
+                text = line.decode('utf-8', errors='replace').strip()
+                if not text:
+                    continue
+
+                await in_flight.acquire()
+                event, error = self._parse_line(text)
+                if error:
+                    await acks.put(_ready(('ERR', '', '', error)))
+                    continue
+
+                future = asyncio.get_running_loop().create_future()
+                if not self._stopping:
+                    await self.queue.put((event, future))
+                if self._stopping:
+                    # Also when stop() began while this put waited for room
+                    _retry(future, event, 'Listener stopping')
+                await acks.put(future)
+        finally:
+            await acks.put(None)
+            await ack_task
+            self.connections -= 1
+            self._handlers.discard(handler)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _send_acks(self, writer, acks, in_flight):
+        """Write acknowledgements back to the reader in line order"""
+        while True:
+            future = await acks.get()
+            if future is None:
+                return
+            try:
+                status, card_id, timestamp, message = await future
+            finally:
+                in_flight.release()
+            try:
+                writer.write(f"{status},{card_id},{timestamp},{message}\n".encode())
+                await writer.drain()
+            except ConnectionError:
+                # Reader went away; keep draining so its scans still complete
+                continue
+
+    def _parse_line(self, text):
+        fields = [field.strip() for field in text.split(',')]
+        if len(fields) not in (3, 4) or not all(fields[:3]):
+            return None, 'Expected reader_id,card_id,timestamp[,session_id]'
+
+        reader_id, card_id, timestamp = fields[:3]
+        event = {
+            # Deterministic, so a reader resending after a dropped connection
+            # is deduplicated like any other retry
+            'event_id': f"{reader_id}:{card_id}:{timestamp}",
+            'reader_id': reader_id,
+            'card_id': card_id,
+            'timestamp': timestamp,
+            'scanned_at': float(timestamp) if _is_number(timestamp) else timestamp,
+            'session_id': fields[3] if len(fields) == 4 and fields[3] else None,
+        }
+        return event, None
+
+    async def _batch_writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await self._write_with_retries([event for event, _ in batch])
+            except asyncio.CancelledError:
+                # Stopping mid-write: the batch may or may not have been
+                # applied, and a resend is deduplicated either way
+                for event, future in batch:
+                    _retry(future, event, 'Listener stopping')
+                raise
+
+            self.stats['batches'] += 1
+            self.stats['scans'] += len(batch)
+
+            for (event, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if result.get('retry'):
+                    status = 'RETRY'
+                elif result['duplicate']:
+                    status = 'DUP'
+                elif result['success']:
+                    status = 'OK'
+                else:
+                    status = 'FAIL'
+                future.set_result((status, event['card_id'], event['timestamp'], result['message']))
+
+    async def _write_with_retries(self, events):
+        """Write a batch, retrying while the database is locked or busy
+
+        Other errors fail the batch: retrying won't help (missing table,
+        constraint, ...). A database still locked after WRITE_ATTEMPTS gets
+        RETRY results, so the readers resend rather than drop the scans.
+        """
+        loop = asyncio.get_running_loop()
+        delay = RETRY_DELAY_SECONDS
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                return await loop.run_in_executor(self._executor, self._write_batch, events)
+            except Exception as e:
+                if not is_locked_error(e):
+                    self.stats['errors'] += 1
+                    return [{'success': False, 'duplicate': False, 'message': f"Write failed: {e}"}] * len(events)
+                error = e
+            if attempt + 1 < WRITE_ATTEMPTS:
+                # Connections keep reading and queueing meanwhile
+                self.stats['retries'] += 1
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        self.stats['errors'] += 1
+        return [{'success': False, 'duplicate': False, 'retry': True,
+                 'message': f"Database busy, resend ({error})"}] * len(events)
+
+    def _write_batch(self, events):
+        """Runs on the writer thread"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, timeout=30)
+
+        sessions = {}
+        for event in events:
+            if event['session_id'] is None:
+                reader_id = event['reader_id']
+                if reader_id not in sessions:
+                    sessions[reader_id] = self._active_session_for(reader_id)
+                event['session_id'] = sessions[reader_id]
+
+        ready = [event for event in events if event['session_id']]
+        results = iter(apply_scan_batch(self._conn, ready) if ready else [])
+
+        return [
+            next(results) if event['session_id'] else
+            {'event_id': event['event_id'], 'success': False, 'duplicate': False,
+             'message': 'No active session for reader'}
+            for event in events
+        ]
+
+    def _active_session_for(self, reader_id):
+        cursor = self._conn.cursor()
+        class_name = self.reader_classes.get(reader_id)
+        if class_name:
+            cursor.execute(
+                "SELECT session_id FROM sessions WHERE status = 'active' AND class_name = ? "
+                "ORDER BY start_time DESC LIMIT 1",
+                (class_name,)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        cursor.execute("SELECT session_id FROM sessions WHERE status = 'active' LIMIT 2")
+        rows = cursor.fetchall()
+        return rows[0][0] if len(rows) == 1 else None
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _retry(future, event, message):
+    if not future.done():
+        future.set_result(('RETRY', event['card_id'], event['timestamp'], message))
+
+
+def _ready(value):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(value)
+    return future
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Card reader TCP listener")
+    parser.add_argument('--db', default='attendance_system.db')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--assign', action='append', default=[], metavar='READER=CLASS',
+                        help="Assign a reader to a class, e.g. --assign R1=10A")
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE)
+    args = parser.parse_args()
+
+    reader_classes = dict(item.split('=', 1) for item in args.assign)
+    listener = ReaderListener(args.db, args.host, args.port, reader_classes, args.batch_size)
+
+    try:
+        asyncio.run(listener.serve_forever())
+    except KeyboardInterrupt:
+        print("\nListener stopped")
+    finally:
+        print(f"Scans: {listener.stats['scans']}  Batches: {listener.stats['batches']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# Domain records
+#
+# Compact __slots__ records for rows read from the database, so templates
+# and reports use names (session.status) instead of positions (session[7])
+# and a schema change can't silently shift every index. Each record lists
+# the exact columns it needs in SQL_COLUMNS; queries select those columns
+# and set the record's row_factory on the cursor, e.g.
+#
+#     cursor.row_factory = Session.row_factory
+#     cursor.execute(f"SELECT {Session.SQL_COLUMNS} FROM sessions s JOIN teachers t ...")
+#
+# Listing queries never pull teachers.fingerprint_template; Teacher only
+# carries whether a template is enrolled.
+
+
+class Record:
+    """Base class for __slots__ domain records
+
+    Records compare and hash by type and slot values, so they work in sets
+    and as dict keys. They are plain values read from the database; don't
+    change one while it is used as a key.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        return cls(*row)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __hash__(self):
+        return hash((type(self),) + tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Teacher(Record):
+    __slots__ = ('id', 'teacher_id', 'name', 'has_fingerprint', 'created_at')
+
+    SQL_COLUMNS = "t.id, t.teacher_id, t.name, t.fingerprint_template IS NOT NULL, t.created_at"
+
+    def __init__(self, id, teacher_id, name, has_fingerprint, created_at):
+        self.id = id
+        self.teacher_id = teacher_id
+        self.name = name
+        self.has_fingerprint = bool(has_fingerprint)
+        self.created_at = created_at
+
+
+class Student(Record):
+    __slots__ = ('id', 'student_id', 'name', 'card_id', 'class_name', 'created_at')
+
+    SQL_COLUMNS = "st.id, st.student_id, st.name, st.card_id, st.class_name, st.created_at"
+
+    def __init__(self, id, student_id, name, card_id, class_name, created_at):
+        self.id = id
+        self.student_id = student_id
+        self.name = name
+        self.card_id = card_id
+        self.class_name = class_name
+        self.created_at = created_at
+
+
+class Session(Record):
+    __slots__ = ('id', 'session_id', 'teacher_id', 'class_name', 'subject',
+                 'start_time', 'end_time', 'status', 'created_at', 'teacher_name')
+
+    # Expects sessions aliased as s joined to teachers aliased as t
+    SQL_COLUMNS = ("s.id, s.session_id, s.teacher_id, s.class_name, s.subject, "
+                   "s.start_time, s.end_time, s.status, s.created_at, t.name")
+
+    def __init__(self, id, session_id, teacher_id, class_name, subject,
+                 start_time, end_time, status, created_at, teacher_name):
+        self.id = id
+        self.session_id = session_id
+        self.teacher_id = teacher_id
+        self.class_name = class_name
+        self.subject = subject
+        self.start_time = start_time
+        self.end_time = end_time
+        self.status = status
+        self.created_at = created_at
+        self.teacher_name = teacher_name
+
+    @property
+    def is_active(self):
+        return self.status == 'active'
+
+
+class AttendanceRecord(Record):
+    __slots__ = ('id', 'session_id', 'student_id', 'card_scan_time', 'is_present',
+                 'verified_by_camera', 'student_name', 'class_name')
+
+    # Expects attendance aliased as a joined to students aliased as st
+    SQL_COLUMNS = ("a.id, a.session_id, a.student_id, a.card_scan_time, a.is_present, "
+                   "a.verified_by_camera, st.name, st.class_name")
+
+    def __init__(self, id, session_id, student_id, card_scan_time, is_present,
+                 verified_by_camera, student_name, class_name):
+        self.id = id
+        self.session_id = session_id
+        self.student_id = student_id
+        self.card_scan_time = card_scan_time
+        self.is_present = bool(is_present)
+        self.verified_by_camera = bool(verified_by_camera)
+        self.student_name = student_name
+        self.class_name = class_name
+
+
+class CameraLog(Record):
+    __slots__ = ('id', 'session_id', 'detected_count', 'card_scan_count', 'timestamp', 'image_path')
+
+    SQL_COLUMNS = "c.id, c.session_id, c.detected_count, c.card_scan_count, c.timestamp, c.image_path"
+
+    def __init__(self, id, session_id, detected_count, card_scan_count, timestamp, image_path):
+        self.id = id
+        self.session_id = session_id
+        self.detected_count = detected_count
+        self.card_scan_count = card_scan_count
+        self.timestamp = timestamp
+        self.image_path = image_path
+
+    @property
+    def discrepancy(self):
+        return abs(self.detected_count - self.card_scan_count)
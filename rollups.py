@@ -0,0 +1,224 @@
+# Monthly attendance rollups
+#
+# Keeps per-student and per-class monthly totals (sessions held, sessions
+# attended, late arrivals) so long-range attendance reports read a few
+# hundred rollup rows instead of the whole attendance history. Rollups are
+# applied incrementally when a session ends; `python rollups.py rebuild`
+# recomputes them from scratch for backfills. The tables are created by
+# create_database (script.py) and by the rebuild command, which is also the
+# way to add them to a database created before rollups existed.
+
+import sqlite3
+import sys
+
+from analytics import LATE_THRESHOLD_MINUTES
+
+
+def create_rollup_tables(cursor):
+    """Create rollup tables (idempotent)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS student_monthly_rollup (
+            student_id TEXT NOT NULL,
+            class_name TEXT NOT NULL,
+            month TEXT NOT NULL,
+            sessions_held INTEGER NOT NULL DEFAULT 0,
+            sessions_attended INTEGER NOT NULL DEFAULT 0,
+            late_arrivals INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (student_id, class_name, month)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS class_monthly_rollup (
+            class_name TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            month TEXT NOT NULL,
+            sessions_held INTEGER NOT NULL DEFAULT 0,
+            expected_attendance INTEGER NOT NULL DEFAULT 0,
+            sessions_attended INTEGER NOT NULL DEFAULT 0,
+            late_arrivals INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (class_name, subject, month)
+        )
+    ''')
+
+    # Indexes the incremental rollup queries rely on
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_class_name ON students (class_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_session ON attendance (session_id, student_id)")
+
+    # Sessions already counted, so ending a session twice never double counts
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_sessions (
+            session_id TEXT PRIMARY KEY,
+            FOREIGN KEY (session_id) REFERENCES sessions (session_id)
+        )
+    ''')
+
+
+def _apply_rollups(cursor, session_filter: str, params: tuple):
+    """Add completed sessions matching the filter into both rollup tables"""
+    late = f"(julianday(a.card_scan_time) - julianday(s.start_time)) * 1440 > {LATE_THRESHOLD_MINUTES}"
+
+    # Every student of the session's class counts the session as held;
+    # students who scanned into another class's session are counted there too
+    cursor.execute(f'''
+        INSERT INTO student_monthly_rollup
+            (student_id, class_name, month, sessions_held, sessions_attended, late_arrivals)
+        SELECT student_id, class_name, month, SUM(held), SUM(attended), SUM(late)
+        FROM (
+            SELECT st.student_id, s.class_name, strftime('%Y-%m', s.start_time) AS month,
+                   1 AS held, 0 AS attended, 0 AS late
+            FROM sessions s
+            JOIN students st ON st.class_name = s.class_name
+            WHERE s.status = 'completed' {session_filter}
+            UNION ALL
+            SELECT a.student_id, s.class_name, strftime('%Y-%m', s.start_time),
+                   st.class_name <> s.class_name, 1, {late}
+            FROM attendance a
+            JOIN sessions s ON a.session_id = s.session_id
+            JOIN students st ON st.student_id = a.student_id
+            WHERE s.status = 'completed' {session_filter}
+        )
+        GROUP BY student_id, class_name, month
+        ON CONFLICT (student_id, class_name, month) DO UPDATE SET
+            sessions_held = sessions_held + excluded.sessions_held,
+            sessions_attended = sessions_attended + excluded.sessions_attended,
+            late_arrivals = late_arrivals + excluded.late_arrivals
+    ''', params + params)
+
+    # Attended counts the class's own students only, like expected_attendance;
+    # visitors from other classes are in their student rollups above
+    cursor.execute(f'''
+        INSERT INTO class_monthly_rollup
+            (class_name, subject, month, sessions_held, expected_attendance, sessions_attended, late_arrivals)
+        SELECT s.class_name, s.subject, strftime('%Y-%m', s.start_time),
+               COUNT(*),
+               SUM((SELECT COUNT(*) FROM students st WHERE st.class_name = s.class_name)),
+               COALESCE(SUM(x.attended), 0), COALESCE(SUM(x.late), 0)
+        FROM sessions s
+        LEFT JOIN (
+            SELECT a.session_id, COUNT(*) AS attended, SUM({late}) AS late
+            FROM attendance a
+            JOIN sessions s ON a.session_id = s.session_id
+            JOIN students st ON st.student_id = a.student_id AND st.class_name = s.class_name
+            WHERE s.status = 'completed' {session_filter}
+            GROUP BY a.session_id
+        ) x ON x.session_id = s.session_id
+        WHERE s.status = 'completed' {session_filter}
+        GROUP BY s.class_name, s.subject, strftime('%Y-%m', s.start_time)
+        ON CONFLICT (class_name, subject, month) DO UPDATE SET
+            sessions_held = sessions_held + excluded.sessions_held,
+            expected_attendance = expected_attendance + excluded.expected_attendance,
+            sessions_attended = sessions_attended + excluded.sessions_attended,
+            late_arrivals = late_arrivals + excluded.late_arrivals
+    ''', params + params)
+
+
+def apply_session_rollup(cursor, session_id: str):
+    """Fold one completed session into the rollups (no-op if already applied)
+
+    Runs on the caller's cursor so it commits together with the session's
+    status change. The rollup tables must exist: create_database and
+    `python rollups.py rebuild` create them.
+    """
+    cursor.execute("INSERT OR IGNORE INTO rollup_sessions (session_id) VALUES (?)", (session_id,))
+    if cursor.rowcount == 0:
+        return False
+
+    _apply_rollups(cursor, "AND s.session_id = ?", (session_id,))
+    return True
+
+
+def rebuild_rollups(db_path='attendance_system.db'):
+    """Recompute all rollups from the attendance history"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    try:
+        create_rollup_tables(cursor)
+        cursor.execute("DELETE FROM student_monthly_rollup")
+        cursor.execute("DELETE FROM class_monthly_rollup")
+        cursor.execute("DELETE FROM rollup_sessions")
+
+        _apply_rollups(cursor, "", ())
+        cursor.execute("INSERT INTO rollup_sessions (session_id) SELECT session_id FROM sessions WHERE status = 'completed'")
+        sessions_rolled_up = cursor.rowcount
+
+        # The rollup tables carry no data_version triggers (incremental
+        # rollups ride on the sessions update that triggers them), so bump it
+        # here or /api/reports/* keeps answering 304 for the old figures
+        has_version = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'data_version'").fetchone()
+        if has_version:
+            cursor.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+
+        conn.commit()
+        return sessions_rolled_up
+    finally:
+        conn.close()
+
+
+def get_student_monthly_report(db_path, student_id: str, start_month: str = None, end_month: str = None):
+    """Monthly attendance percentages for a student, from the rollup table"""
+    rows = _monthly_rows(db_path, 'student_monthly_rollup', 'student_id', student_id,
+                         'class_name, sessions_held', start_month, end_month)
+    return [
+        {
+            'class_name': class_name,
+            'month': month,
+            'sessions_held': held,
+            'sessions_attended': attended,
+            'late_arrivals': late,
+            'attendance_rate': round(attended / held, 4) if held else 0.0,
+        }
+        for month, class_name, held, attended, late in rows
+    ]
+
+
+def get_class_monthly_report(db_path, class_name: str, start_month: str = None, end_month: str = None):
+    """Monthly attendance percentages per subject for a class, from the rollup table"""
+    rows = _monthly_rows(db_path, 'class_monthly_rollup', 'class_name', class_name,
+                         'subject, sessions_held, expected_attendance', start_month, end_month)
+    return [
+        {
+            'subject': subject,
+            'month': month,
+            'sessions_held': held,
+            'sessions_attended': attended,
+            'late_arrivals': late,
+            'attendance_rate': round(attended / expected, 4) if expected else 0.0,
+        }
+        for month, subject, held, expected, attended, late in rows
+    ]
+
+
+def _monthly_rows(db_path, table, key_column, key, columns, start_month, end_month):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    query = f"SELECT month, {columns}, sessions_attended, late_arrivals FROM {table} WHERE {key_column} = ?"
+    params = [key]
+    if start_month:
+        query += " AND month >= ?"
+        params.append(start_month)
+    if end_month:
+        query += " AND month <= ?"
+        params.append(end_month)
+    query += " ORDER BY month"
+
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    except sqlite3.OperationalError:
+        # Rollup tables not created yet
+        return []
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print("Usage: python rollups.py rebuild [db_path]")
+        sys.exit(1)
+
+    db_path = sys.argv[2] if len(sys.argv) > 2 else 'attendance_system.db'
+    count = rebuild_rollups(db_path)
+    print(f"Rollups rebuilt from {count} completed sessions")
@@ -0,0 +1,193 @@
+# Card scan ingestion
+#
+# Shared write path for student card scans. AttendanceSystem.mark_attendance
+# and the batch endpoint used by networked card readers both go through
+# mark_attendance_row, so every entry point applies the same rules. Batches
+# are applied in one transaction and deduplicated on the reader-supplied
+# event_id, so readers can retry a batch without double-marking anyone.
+
+import datetime
+import sqlite3
+import time
+from typing import Dict, List
+
+import metrics
+
+# Largest batch a reader may submit in one request
+MAX_BATCH_SIZE = 500
+
+REQUIRED_FIELDS = ('event_id', 'reader_id', 'card_id', 'session_id')
+# Used as DB parameters and dictionary keys, so anything else is rejected
+STRING_FIELDS = ('event_id', 'card_id', 'session_id')
+
+ALREADY_PRESENT = "Already marked present"
+
+SCAN_BATCH_SIZE = metrics.histogram(
+    'scan_batch_events', 'Events per applied scan batch', buckets=(1, 5, 10, 25, 50, 100, 250, 500))
+SCAN_TO_COMMIT_SECONDS = metrics.histogram(
+    'scan_to_commit_seconds', 'Time from the reader scan to the committed attendance row',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+DB_LOCK_WAIT_SECONDS = metrics.histogram(
+    'db_lock_wait_seconds', 'Time waiting for the SQLite write lock', ['operation'])
+SCAN_EVENTS = metrics.counter('scan_events_total', 'Scan events applied', ['result'])
+
+
+def create_scan_tables(cursor):
+    """Create the scan event ledger (idempotent)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_events (
+            event_id TEXT PRIMARY KEY,
+            reader_id TEXT NOT NULL,
+            card_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            scanned_at TIMESTAMP,
+            success BOOLEAN NOT NULL,
+            message TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def is_locked_error(error) -> bool:
+    """True for `database is locked` / busy errors, which are worth retrying"""
+    message = str(error)
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+
+def mark_attendance_row(cursor, session_id: str, card_id: str, scan_time=None):
+    """Mark attendance for a card scan on the caller's cursor (no commit)"""
+    # Get student ID from card ID
+    cursor.execute("SELECT student_id FROM students WHERE card_id = ?", (card_id,))
+    student_result = cursor.fetchone()
+
+    if not student_result:
+        return False, "Student not found"
+
+    student_id = student_result[0]
+
+    # Check if already marked
+    cursor.execute(
+        "SELECT id FROM attendance WHERE session_id = ? AND student_id = ?",
+        (session_id, student_id)
+    )
+
+    if cursor.fetchone():
+        return False, ALREADY_PRESENT
+
+    # Mark attendance
+    cursor.execute(
+        "INSERT INTO attendance (session_id, student_id, card_scan_time) VALUES (?, ?, ?)",
+        (session_id, student_id, scan_time or datetime.datetime.now())
+    )
+    return True, "Attendance marked successfully"
+
+
+def parse_scan_time(value):
+    """Parse a reader timestamp into a naive local datetime (None -> now)"""
+    if value is None:
+        return datetime.datetime.now()
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value)
+
+    scanned_at = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone().replace(tzinfo=None)
+    return scanned_at
+
+
+def apply_scan_batch(conn, events: List[Dict]) -> List[Dict]:
+    """Apply a batch of reader scan events in one transaction
+
+    Returns one result per event, in order. Events whose event_id was
+    already applied return the stored result with ``duplicate`` set.
+    """
+    cursor = conn.cursor()
+    results = []
+    session_status = {}
+    seen = {}
+
+    create_scan_tables(cursor)
+    lock_start = time.perf_counter()
+    cursor.execute("BEGIN IMMEDIATE")
+    DB_LOCK_WAIT_SECONDS.labels('scan_batch').observe(time.perf_counter() - lock_start)
+    try:
+        for event in events:
+            result = _apply_scan_event(cursor, event, session_status, seen)
+            results.append(result)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    committed_at = datetime.datetime.now()
+    SCAN_BATCH_SIZE.observe(len(events))
+    for event, result in zip(events, results):
+        if result['duplicate']:
+            SCAN_EVENTS.labels('duplicate').inc()
+        elif result['success']:
+            SCAN_EVENTS.labels('marked').inc()
+            lag = (committed_at - parse_scan_time(event.get('scanned_at'))).total_seconds()
+            SCAN_TO_COMMIT_SECONDS.observe(max(lag, 0.0))
+        else:
+            SCAN_EVENTS.labels('rejected').inc()
+
+    return results
+
+
+def _apply_scan_event(cursor, event, session_status, seen):
+    if not isinstance(event, dict):
+        return {'event_id': None, 'success': False, 'duplicate': False, 'message': 'Invalid event'}
+
+    event_id = event.get('event_id')
+    missing = [field for field in REQUIRED_FIELDS if not event.get(field)]
+    if missing:
+        return {'event_id': event_id, 'success': False, 'duplicate': False,
+                'message': f"Missing required fields: {', '.join(missing)}"}
+
+    invalid = [field for field in STRING_FIELDS if not isinstance(event[field], str)]
+    if invalid:
+        return {'event_id': event_id if isinstance(event_id, str) else None, 'success': False,
+                'duplicate': False, 'message': f"Fields must be strings: {', '.join(invalid)}"}
+
+    # Retries inside the same batch
+    if event_id in seen:
+        return dict(seen[event_id], duplicate=True)
+
+    # Retries of an earlier batch
+    cursor.execute("SELECT success, message FROM scan_events WHERE event_id = ?", (event_id,))
+    previous = cursor.fetchone()
+    if previous:
+        return {'event_id': event_id, 'success': bool(previous[0]), 'duplicate': True, 'message': previous[1]}
+
+    session_id = event['session_id']
+    card_id = event['card_id']
+
+    try:
+        scanned_at = parse_scan_time(event.get('scanned_at'))
+    except (TypeError, ValueError, OverflowError, OSError):
+        # Malformed timestamps are rejected without recording the event, so a
+        # corrected retry with the same event_id is still accepted
+        return {'event_id': event_id, 'success': False, 'duplicate': False, 'message': 'Invalid scanned_at'}
+
+    if session_id not in session_status:
+        cursor.execute("SELECT status FROM sessions WHERE session_id = ?", (session_id,))
+        row = cursor.fetchone()
+        session_status[session_id] = row[0] if row else None
+
+    status = session_status[session_id]
+    if status is None:
+        success, message = False, "Session not found"
+    elif status != 'active':
+        success, message = False, "Session is not active"
+    else:
+        success, message = mark_attendance_row(cursor, session_id, card_id, scanned_at)
+
+    cursor.execute(
+        "INSERT INTO scan_events (event_id, reader_id, card_id, session_id, scanned_at, success, message) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (event_id, str(event['reader_id']), card_id, session_id, scanned_at, success, message)
+    )
+
+    result = {'event_id': event_id, 'success': success, 'duplicate': False, 'message': message}
+    seen[event_id] = result
+    return result
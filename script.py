@@ -5,9 +5,15 @@
 import sqlite3
 import os
 
+from rollups import create_rollup_tables
+from scan_ingest import create_scan_tables
+from http_middleware import create_data_version
+from fingerprint_store import create_fingerprint_tables
+from session_recovery import create_session_indexes
+
 # Create database schema
-def create_database():
-    conn = sqlite3.connect('attendance_system.db')
+def create_database(db_path='attendance_system.db'):
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
     # Teachers table
@@ -77,8 +83,24 @@ def create_database():
         )
     ''')
     
+    # Monthly attendance rollups
+    create_rollup_tables(cursor)
+    
+    # Card reader scan events (idempotency ledger)
+    create_scan_tables(cursor)
+    
+    # Write counter behind the web dashboard's ETags
+    create_data_version(cursor)
+    
+    # Fingerprint enrollment ledger (incremental template refresh)
+    create_fingerprint_tables(cursor)
+    
+    # Active sessions, found again at start-up after a crash
+    create_session_indexes(cursor)
+    
     conn.commit()
     conn.close()
     print("Database schema created successfully!")
 
-create_database()
\ No newline at end of file
+if __name__ == '__main__':
+    create_database()
@@ -6,13 +6,28 @@ import json
 import uuid
 from typing import List, Dict, Optional
 import sqlite3
+import time
+
+import metrics
+import sql_profiler
+from records import AttendanceRecord, CameraLog, Session
+from rollups import apply_session_rollup
+from scan_ingest import mark_attendance_row
+
+MARK_ATTENDANCE_SECONDS = metrics.histogram(
+    'attendance_mark_seconds', 'Card scan to commit latency in mark_attendance', ['result'])
+CAMERA_LOG_SECONDS = metrics.histogram(
+    'camera_verification_log_seconds', 'Time to record a camera verification')
+CAMERA_DISCREPANCY = metrics.histogram(
+    'camera_verification_discrepancy', 'Difference between detected persons and card scans',
+    buckets=(0, 1, 2, 3, 5, 10, 20))
 
 class AttendanceSystem:
     def __init__(self, db_path='attendance_system.db'):
         self.db_path = db_path
         
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        return sql_profiler.connect(self.db_path)
     
     def add_teacher(self, teacher_id: str, name: str, fingerprint_data: bytes = None):
         """Add a new teacher to the system"""
@@ -69,45 +84,29 @@ class AttendanceSystem:
             "UPDATE sessions SET end_time = ?, status = 'completed' WHERE session_id = ?",
             (datetime.datetime.now(), session_id)
         )
+        
+        # Fold the session into the monthly rollups in the same transaction
+        apply_session_rollup(cursor, session_id)
         conn.commit()
         conn.close()
     
     def mark_attendance(self, session_id: str, card_id: str):
         """Mark attendance using card scan"""
+        start = time.perf_counter()
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        # Get student ID from card ID
-        cursor.execute("SELECT student_id FROM students WHERE card_id = ?", (card_id,))
-        student_result = cursor.fetchone()
-        
-        if not student_result:
-            conn.close()
-            return False, "Student not found"
-        
-        student_id = student_result[0]
+        success, message = mark_attendance_row(cursor, session_id, card_id)
         
-        # Check if already marked
-        cursor.execute(
-            "SELECT id FROM attendance WHERE session_id = ? AND student_id = ?",
-            (session_id, student_id)
-        )
-        
-        if cursor.fetchone():
-            conn.close()
-            return False, "Already marked present"
-        
-        # Mark attendance
-        cursor.execute(
-            "INSERT INTO attendance (session_id, student_id, card_scan_time) VALUES (?, ?, ?)",
-            (session_id, student_id, datetime.datetime.now())
-        )
-        conn.commit()
+        if success:
+            conn.commit()
         conn.close()
-        return True, "Attendance marked successfully"
+        MARK_ATTENDANCE_SECONDS.labels('marked' if success else 'rejected').observe(time.perf_counter() - start)
+        return success, message
     
     def log_camera_verification(self, session_id: str, detected_count: int, image_path: str = None):
         """Log camera detection results"""
+        start = time.perf_counter()
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -125,7 +124,10 @@ class AttendanceSystem:
         conn.commit()
         conn.close()
         
-        return abs(detected_count - card_scan_count)  # Return discrepancy
+        discrepancy = abs(detected_count - card_scan_count)
+        CAMERA_LOG_SECONDS.observe(time.perf_counter() - start)
+        CAMERA_DISCREPANCY.observe(discrepancy)
+        return discrepancy  # Return discrepancy
     
     def get_session_report(self, session_id: str):
         """Generate attendance report for a session"""
@@ -133,8 +135,9 @@ class AttendanceSystem:
         cursor = conn.cursor()
         
         # Get session details
-        cursor.execute("""
-            SELECT s.*, t.name as teacher_name 
+        cursor.row_factory = Session.row_factory
+        cursor.execute(f"""
+            SELECT {Session.SQL_COLUMNS}
             FROM sessions s 
             JOIN teachers t ON s.teacher_id = t.teacher_id 
             WHERE s.session_id = ?
@@ -146,8 +149,9 @@ class AttendanceSystem:
             return None
         
         # Get attendance records
-        cursor.execute("""
-            SELECT a.*, st.name as student_name, st.class_name
+        cursor.row_factory = AttendanceRecord.row_factory
+        cursor.execute(f"""
+            SELECT {AttendanceRecord.SQL_COLUMNS}
             FROM attendance a
             JOIN students st ON a.student_id = st.student_id
             WHERE a.session_id = ?
@@ -155,8 +159,9 @@ class AttendanceSystem:
         attendance_records = cursor.fetchall()
         
         # Get camera logs
+        cursor.row_factory = CameraLog.row_factory
         cursor.execute(
-            "SELECT * FROM camera_logs WHERE session_id = ? ORDER BY timestamp DESC LIMIT 1",
+            f"SELECT {CameraLog.SQL_COLUMNS} FROM camera_logs c WHERE c.session_id = ? ORDER BY c.timestamp DESC LIMIT 1",
             (session_id,)
         )
         camera_log = cursor.fetchone()
@@ -1,40 +1,93 @@
 # Hardware interface modules
 
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+import metrics
+from fingerprint_index import (DEFAULT_MATCH_THRESHOLD, FingerprintIndex, decode_template,
+                               encode_template, simulated_scan, simulated_template)
+from device_supervisor import DeviceSupervisor
+from device_worker import DeviceBusy, DeviceWorker
+from fingerprint_store import DEFAULT_TEMPLATE_PATH, TemplateStore
+from image_store import DEFAULT_IMAGE_DIR, ImageStore
+from inference_executor import configured_workers, shared_executor
+from model_manager import MODELS
+from person_counter import (DEFAULT_BURST_FRAMES, DEFAULT_DETECT_WIDTH, DEFAULT_TIME_BUDGET_SECONDS,
+                            CaptureThread, PersonCounter)
+
+COUNT_PERSONS_SECONDS = metrics.histogram(
+    'camera_count_persons_seconds', 'Person detection latency in CameraSystem.count_persons')
+PERSONS_DETECTED = metrics.gauge(
+    'camera_persons_detected', 'Persons in the most recent detection', multiprocess_mode='max')
+
+# How long a session waits on a classroom device before giving up
+DEVICE_TIMEOUT_SECONDS = 30.0
+
+# Per-device connect timeouts at start-up; loading the detection model dominates the camera's
+DEVICE_CONNECT_TIMEOUTS = {'fingerprint': 10.0, 'card_reader': 5.0, 'camera': 30.0}
+DEVICE_NAMES = {'fingerprint': 'Fingerprint scanner', 'card_reader': 'Card reader', 'camera': 'Camera'}
+
 class FingerprintScanner:
     """Mock fingerprint scanner interface"""
     
-    def __init__(self):
+    def __init__(self, match_threshold: float = DEFAULT_MATCH_THRESHOLD, template_index: FingerprintIndex = None):
         self.is_connected = False
-        self.registered_teachers = {}  # teacher_id -> fingerprint_hash
+        # Scanners in one process can share an index (one copy of the templates)
+        self.template_index = (template_index if template_index is not None
+                               else FingerprintIndex(threshold=match_threshold))
+        self.simulated_finger = None  # teacher whose finger the mock sensor reads
     
     def connect(self):
         """Connect to fingerprint scanner"""
         self.is_connected = True
         return True
     
+    def load_templates(self, db_path: str):
+        """Load enrolled templates from teachers.fingerprint_template"""
+        return self.template_index.load_from_db(db_path)
+    
     def register_fingerprint(self, teacher_id: str):
         """Register a teacher's fingerprint"""
         if not self.is_connected:
             return False, "Scanner not connected"
         
-        # Simulate fingerprint registration
-        fingerprint_hash = hashlib.md5(f"fingerprint_{teacher_id}".encode()).hexdigest()
-        self.registered_teachers[teacher_id] = fingerprint_hash
-        return True, fingerprint_hash
+        # Simulate capturing an enrolment template
+        template = simulated_template(teacher_id)
+        self.template_index.add(teacher_id, template)
+        if self.simulated_finger is None:
+            self.simulated_finger = teacher_id
+        return True, encode_template(template)
+    
+    def capture(self):
+        """Read a probe template from the sensor (None if no finger)"""
+        # In real implementation, this would wait for a finger on the sensor
+        finger = self.simulated_finger
+        if finger is None:
+            enrolled = self.template_index.teacher_ids()
+            finger = enrolled[0] if enrolled else None
+        if finger is None:
+            return None
+        return simulated_scan(finger)
     
-    def verify_fingerprint(self, scanned_data: str = None):
-        """Verify a fingerprint scan"""
+    def verify_fingerprint(self, scanned_data=None):
+        """Identify the teacher for a scan (captured from the sensor if not given)"""
         if not self.is_connected:
             return False, None
         
-        # Simulate fingerprint verification
-        # In real implementation, this would process actual fingerprint data
-        for teacher_id, stored_hash in self.registered_teachers.items():
-            # Simulate successful verification for demonstration
-            if scanned_data == stored_hash or scanned_data is None:
-                return True, teacher_id
+        probe = self.capture() if scanned_data is None else scanned_data
+        if isinstance(probe, (bytes, bytearray, memoryview)):
+            probe = decode_template(bytes(probe))
+        if probe is None:
+            return False, None
         
-        return False, None
+        teacher_id, score = self.template_index.identify(probe)
+        return teacher_id is not None, teacher_id
 
 class CardReader:
     """Mock card reader interface"""
@@ -57,101 +110,458 @@ class CardReader:
         return "CARD001"  # Mock card ID
 
 class CameraSystem:
-    """Mock camera system for person detection"""
+    """Classroom camera with person detection
+
+    With no camera source configured (ATTENDANCE_CAMERA_SOURCE: a camera index
+    or a video file) the camera is simulated.
+    """
     
-    def __init__(self):
+    def __init__(self, source=None, model_path=None, config_path=None,
+                 detect_width: int = DEFAULT_DETECT_WIDTH, burst_frames: int = DEFAULT_BURST_FRAMES,
+                 time_budget: float = DEFAULT_TIME_BUDGET_SECONDS, image_store: ImageStore = None):
+        self.image_store = image_store or ImageStore()
+        self.source = source if source is not None else os.environ.get('ATTENDANCE_CAMERA_SOURCE')
+        self.model_path = model_path or os.environ.get('ATTENDANCE_DETECTION_MODEL')
+        self.config_path = config_path or os.environ.get('ATTENDANCE_DETECTION_CONFIG')
+        self.detect_width = detect_width
+        self.burst_frames = burst_frames
+        self.time_budget = time_budget
         self.is_connected = False
         self.detection_model_loaded = False
+        self.capture = None
+        self.model = None
+        self.counter = None
+        self.last_result = None
+    
+    @property
+    def simulated(self):
+        return not self.source
     
     def connect(self):
         """Connect to camera"""
+        if not self.simulated:
+            self.capture = CaptureThread(self.source)
+            if not self.capture.start():
+                print(self.capture.error)
+                self.capture = None
+                return False
         self.is_connected = True
         return True
     
+    def disconnect(self):
+        self.is_connected = False
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
+    
+    def healthy(self):
+        """Connected, model loaded and (for a real camera) still delivering frames"""
+        if not self.is_connected or not self.detection_model_loaded:
+            return False
+        return self.simulated or (self.capture is not None and self.capture.running)
+    
     def load_detection_model(self):
-        """Load YOLO model for person detection"""
+        """Load and warm up the person detector (HOG, or a cv2.dnn model if configured)
+
+        The model is loaded once per process and shared by every camera.
+        """
         if not self.is_connected:
             return False
         
+        if not self.simulated:
+            try:
+                if configured_workers():
+                    # Inference in worker processes, off this process's GIL
+                    self.model = shared_executor(self.model_path, self.config_path,
+                                                 warmup_width=self.detect_width)
+                else:
+                    self.model = MODELS.get(self.model_path, self.config_path, self.detect_width)
+            except (RuntimeError, cv2.error, BrokenProcessPool) as e:
+                print(f"Person detector unavailable: {e}")
+                return False
+            self.counter = PersonCounter(self.capture, self.model, self.detect_width,
+                                         self.burst_frames, self.time_budget)
         self.detection_model_loaded = True
         return True
     
-    def count_persons(self, save_image_path: str = None):
-        """Count number of persons in camera view"""
-        if not self.is_connected or not self.detection_model_loaded:
+    def count_persons(self, save_image: bool = False):
+        """Count number of persons in camera view (median over a burst of frames)
+
+        With save_image, the annotated frame is handed to the image store and
+        its key is in last_result['image_key']; the write happens in the
+        background.
+        """
+        result = self.detect(keep_image=save_image)
+        if result is None:
             return 0
+        if save_image:
+            self.store_image(result)
+        return result['count']
+    
+    def detect(self, keep_image: bool = False):
+        """Run the detector; the result dict (None if the camera isn't ready)"""
+        if not self.is_connected or not self.detection_model_loaded:
+            return None
+        
+        start = time.perf_counter()
+        if self.simulated:
+            result = self._simulated_count(keep_image)
+        else:
+            result = self.counter.count(keep_image=keep_image)
+        result['image_key'] = None
+        self.last_result = result
         
-        # Simulate person detection
-        # In real implementation, this would use OpenCV + YOLO
+        COUNT_PERSONS_SECONDS.observe(time.perf_counter() - start)
+        PERSONS_DETECTED.set(result['count'])
+        return result
+    
+    def store_image(self, result):
+        """Queue a detect() result's annotated frame for the image store; returns its key"""
+        image = result.pop('image', None)
+        if image is not None:
+            result['image_key'] = self.image_store.save(image)
+        return result['image_key']
+    
+    def latest_frame(self):
+        """The newest captured frame (None for the simulated camera)"""
+        if self.capture is None:
+            return None
+        entry = self.capture.ring.latest()
+        return entry[2] if entry else None
+    
+    def _simulated_count(self, keep_image):
         import random
         detected_count = random.randint(15, 25)  # Simulate 15-25 students detected
         
-        if save_image_path:
-            # Simulate saving detection image
-            with open(save_image_path, 'w') as f:
-                f.write(f"Detection image saved at {datetime.datetime.now()}")
-        
-        return detected_count
+        image = None
+        if keep_image:
+            image = np.full((360, 640, 3), 40, dtype=np.uint8)
+            cv2.putText(image, f"Simulated camera: {detected_count} persons", (20, 60),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 255, 255), 2)
+            cv2.putText(image, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'), (20, 110),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 200), 2)
+        return {'count': detected_count, 'counts': [detected_count], 'frames': 1,
+                'seconds': 0.0, 'budget_exhausted': False, 'detector': 'simulated', 'image': image}
 
 # Hardware manager class
 class HardwareManager:
-    """Manages all hardware components"""
+    """Manages all hardware components
+
+    Devices connect concurrently and a DeviceSupervisor reconnects any that
+    are missing, so the system runs degraded (e.g. card scanning without the
+    camera) instead of not at all.
+    """
     
-    def __init__(self):
-        self.fingerprint_scanner = FingerprintScanner()
-        self.card_reader = CardReader()
-        self.camera_system = CameraSystem()
+    def __init__(self, db_path='attendance_system.db', template_path=DEFAULT_TEMPLATE_PATH,
+                 image_dir=DEFAULT_IMAGE_DIR, camera_source=None, template_index: FingerprintIndex = None,
+                 template_store: TemplateStore = None, image_store: ImageStore = None,
+                 name: str = None, connect_timeouts: dict = None,
+                 fingerprint_scanner=None, card_reader=None, camera_system=None):
+        # Any device can be swapped for another driver (e.g. device_trace.ReplayDevices)
+        self.fingerprint_scanner = fingerprint_scanner or FingerprintScanner(template_index=template_index)
+        self.card_reader = card_reader or CardReader()
+        self.image_store = image_store if image_store is not None else ImageStore(image_dir)
+        self.camera_system = camera_system or CameraSystem(camera_source, image_store=self.image_store)
+        self.template_store = template_store if template_store is not None else TemplateStore(db_path, template_path)
         self.is_initialized = False
+        self._print_lock = threading.Lock()
+        
+        timeouts = dict(DEVICE_CONNECT_TIMEOUTS, **(connect_timeouts or {}))
+        self.supervisor = DeviceSupervisor(name, on_change=self._device_changed)
+        self.supervisor.add('fingerprint', self._connect_fingerprint,
+                            lambda: self.fingerprint_scanner.is_connected, timeouts['fingerprint'])
+        self.supervisor.add('card_reader', self._connect_card_reader,
+                            lambda: self.card_reader.is_connected, timeouts['card_reader'])
+        self.supervisor.add('camera', self._connect_camera, lambda: self.camera_system.healthy(),
+                            timeouts['camera'])
     
     def initialize_hardware(self):
-        """Initialize all hardware components"""
+        """Connect all devices at once; True if every one of them is ready
+
+        Devices that fail or time out are retried in the background.
+        """
         print("Initializing hardware components...")
+        start = time.perf_counter()
+        all_ready = self.supervisor.connect_all()
         
-        # Connect fingerprint scanner
-        if self.fingerprint_scanner.connect():
-            print("✓ Fingerprint scanner connected")
-        else:
-            print("✗ Failed to connect fingerprint scanner")
-            return False
+        for device, status in self.supervisor.status().items():
+            if status['state'] != 'ready':
+                self._report(f"✗ {DEVICE_NAMES[device]} unavailable: {status['error']}")
         
-        # Connect card reader
-        if self.card_reader.connect():
-            print("✓ Card reader connected")
+        self.is_initialized = True
+        self.supervisor.start()
+        elapsed = (time.perf_counter() - start) * 1000
+        if all_ready:
+            self._report(f"All hardware components initialized successfully! ({elapsed:.0f} ms)")
         else:
-            print("✗ Failed to connect card reader")
+            missing = ", ".join(DEVICE_NAMES[device].lower() for device in self.supervisor.missing())
+            self._report(f"⚠ Running in degraded mode without: {missing} ({elapsed:.0f} ms); "
+                         "reconnecting in the background")
+        return all_ready
+    
+    def device_ready(self, device: str) -> bool:
+        return self.supervisor.ready(device)
+    
+    def shutdown(self):
+        self.supervisor.stop()
+        self.camera_system.disconnect()
+    
+    def _connect_fingerprint(self):
+        if not self.fingerprint_scanner.connect():
             return False
+        self._report("✓ Fingerprint scanner connected")
         
-        # Connect camera and load model
-        if self.camera_system.connect():
-            print("✓ Camera connected")
-            if self.camera_system.load_detection_model():
-                print("✓ Person detection model loaded")
-            else:
-                print("✗ Failed to load detection model")
-                return False
+        # Map enrolled templates (memory-mapped file + newer enrollments from the DB)
+        start = time.perf_counter()
+        index = self.fingerprint_scanner.template_index
+        if len(index):
+            # Shared with another classroom's scanner and already mapped
+            self.template_store.refresh(index)
         else:
-            print("✗ Failed to connect camera")
+            self.template_store.load(index)
+        elapsed = (time.perf_counter() - start) * 1000
+        self._report(f"✓ {len(index)} fingerprint templates loaded in {elapsed:.1f} ms")
+        if self.template_store.save_error:
+            self._report(f"⚠ {self.template_store.save_error}")
+        return True
+    
+    def _connect_card_reader(self):
+        if not self.card_reader.connect():
+            return False
+        self._report("✓ Card reader connected")
+        return True
+    
+    def _connect_camera(self):
+        camera = self.camera_system
+        camera.disconnect()
+        if not camera.connect():
             return False
+        self._report("✓ Camera connected")
+        if not camera.load_detection_model():
+            camera.disconnect()
+            raise RuntimeError("detection model failed to load")
         
-        self.is_initialized = True
-        print("All hardware components initialized successfully!")
+        if camera.model is not None:
+            info = camera.model.info()
+            timings = ", ".join(f"{phase} {info[f'{phase}_ms']} ms" for phase in ('load', 'warmup', 'inference')
+                                if info.get(f'{phase}_ms') is not None)
+            self._report(f"✓ Person detection model loaded ({info['detector']}: {timings})")
+        else:
+            self._report("✓ Person detection model loaded")
         return True
     
+    def _device_changed(self, device, state, error):
+        # Start-up results are reported by initialize_hardware
+        if not self.is_initialized:
+            return
+        if state == 'ready':
+            self._report(f"✓ {DEVICE_NAMES[device]} reconnected")
+        else:
+            self._report(f"✗ {DEVICE_NAMES[device]} lost: {error}")
+    
+    def _report(self, message):
+        # Devices connect on their own threads; keep their lines whole
+        with self._print_lock:
+            print(message)
+    
     def register_teacher_fingerprint(self, teacher_id: str):
         """Register teacher fingerprint"""
-        return self.fingerprint_scanner.register_fingerprint(teacher_id)
+        success, template = self.fingerprint_scanner.register_fingerprint(teacher_id)
+        if not success:
+            return success, template
+        
+        # Persist so the enrollment survives restarts and reaches other devices
+        index = self.fingerprint_scanner.template_index
+        if not self.template_store.enroll(index, teacher_id, template):
+            index.remove(teacher_id)
+            return False, "Teacher not found"
+        if self.template_store.save_error:
+            # Enrolled in the database; only this device's warm-start file is stale
+            self._report(f"⚠ {self.template_store.save_error}")
+        return True, template
     
-    def verify_teacher(self, fingerprint_data: str = None):
+    def verify_teacher(self, fingerprint_data=None):
         """Verify teacher fingerprint"""
-        return self.fingerprint_scanner.verify_fingerprint(fingerprint_data)
+        scanner = self.fingerprint_scanner
+        self.template_store.refresh_if_due(scanner.template_index)
+        
+        probe = scanner.capture() if fingerprint_data is None else fingerprint_data
+        if probe is None:
+            return False, None
+        
+        success, teacher_id = scanner.verify_fingerprint(probe)
+        if not success and self.template_store.refresh(scanner.template_index):
+            # Possibly enrolled on another device since the last refresh
+            success, teacher_id = scanner.verify_fingerprint(probe)
+        return success, teacher_id
     
     def read_student_card(self):
         """Read student card"""
         return self.card_reader.read_card()
     
-    def count_students(self, image_path: str = None):
+    def count_students(self, save_image: bool = False):
         """Count students using camera"""
-        return self.camera_system.count_persons(image_path)
+        return self.camera_system.count_persons(save_image)
+    
+    def capture_verification(self):
+        """Count students and store the annotated image: (count, image key)
+
+        (None, None) while the camera is unavailable.
+        """
+        result = self.camera_system.detect(keep_image=True)
+        if result is None:
+            return None, None
+        return result['count'], self.camera_system.store_image(result)
+
+class ClassroomDevices:
+    """One classroom's scanner, card reader and camera, each driven by its own worker thread
+
+    Offers the HardwareManager calls the session manager makes, so an
+    AttendanceSessionManager can run one room of a DeviceRegistry. A device
+    that is stuck (queue full, or no answer within `timeout`) gets the same
+    result as an unavailable one, so a session never fails on a hung device.
+    """
+    
+    def __init__(self, classroom: str, hardware: HardwareManager, card_source=None,
+                 timeout: float = DEVICE_TIMEOUT_SECONDS):
+        self.classroom = classroom
+        self.hardware = hardware
+        self.card_source = card_source  # card_reader_service source; its service runs its own thread
+        self.timeout = timeout
+        self.fingerprint_worker = DeviceWorker(f"{classroom}/fingerprint")
+        self.camera_worker = DeviceWorker(f"{classroom}/camera")
+    
+    @property
+    def camera_system(self):
+        return self.hardware.camera_system
+    
+    @property
+    def fingerprint_scanner(self):
+        return self.hardware.fingerprint_scanner
+    
+    def start(self):
+        self.fingerprint_worker.start()
+        self.camera_worker.start()
+        return self
+    
+    def stop(self):
+        self.fingerprint_worker.stop()
+        self.camera_worker.stop()
+        self.hardware.shutdown()
+    
+    def _call(self, worker: DeviceWorker, unavailable, fn, *args):
+        """Run fn on the device's worker; `unavailable` if the device is busy or too slow"""
+        try:
+            future = worker.submit(fn, *args)
+        except DeviceBusy as e:
+            print(f"⚠ [{self.classroom}] {e}")
+            return unavailable
+        try:
+            return future.result(self.timeout)
+        except FuturesTimeout:
+            # Drop it if it hasn't started; a running call can't be interrupted
+            future.cancel()
+            print(f"⚠ [{self.classroom}] {worker.name} did not answer within {self.timeout:g}s")
+            return unavailable
+    
+    def register_teacher_fingerprint(self, teacher_id: str):
+        return self._call(self.fingerprint_worker, (False, "Fingerprint scanner not responding"),
+                          self.hardware.register_teacher_fingerprint, teacher_id)
+    
+    def verify_teacher(self, fingerprint_data=None):
+        return self._call(self.fingerprint_worker, (False, None), self.hardware.verify_teacher, fingerprint_data)
+    
+    def read_student_card(self):
+        return self.hardware.read_student_card()
+    
+    def count_students(self, save_image: bool = False):
+        return self._call(self.camera_worker, 0, self.hardware.count_students, save_image)
+    
+    def capture_verification(self):
+        return self._call(self.camera_worker, (None, None), self.hardware.capture_verification)
+    
+    def status(self):
+        return {
+            'classroom': self.classroom,
+            'camera': 'simulated' if self.camera_system.simulated else str(self.camera_system.source),
+            'card_reader': type(self.card_source).__name__ if self.card_source is not None else None,
+            'devices': {device: status['state'] for device, status in self.hardware.supervisor.status().items()},
+            'fingerprint_backlog': self.fingerprint_worker.backlog,
+            'camera_backlog': self.camera_worker.backlog,
+        }
+
+class DeviceRegistry:
+    """Maps classrooms to their device sets, so one process can serve a corridor of rooms
+
+    All rooms share one fingerprint index and template store, one image
+    store and (through MODELS) one loaded detection model.
+    """
+    
+    def __init__(self, db_path='attendance_system.db', template_path=DEFAULT_TEMPLATE_PATH,
+                 image_dir=DEFAULT_IMAGE_DIR, match_threshold: float = DEFAULT_MATCH_THRESHOLD):
+        self.db_path = db_path
+        self.template_index = FingerprintIndex(threshold=match_threshold)
+        self.template_store = TemplateStore(db_path, template_path)
+        self.image_store = ImageStore(image_dir)
+        self._rooms = {}
+        self._lock = threading.Lock()
+    
+    def add_classroom(self, classroom: str, camera_source='', card_source=None,
+                      timeout: float = DEVICE_TIMEOUT_SECONDS) -> ClassroomDevices:
+        """Connect a classroom's devices (camera_source '' simulates the camera)
+
+        Devices that are missing are reconnected in the background.
+        """
+        with self._lock:
+            if classroom in self._rooms:
+                raise ValueError(f"Classroom {classroom} already has devices")
+        
+        hardware = HardwareManager(self.db_path, camera_source=camera_source,
+                                   template_index=self.template_index,
+                                   template_store=self.template_store, image_store=self.image_store,
+                                   name=classroom)
+        print(f"\n[{classroom}]", end=" ")
+        # A room with a missing device still serves sessions; the supervisor reconnects it
+        hardware.initialize_hardware()
+        
+        devices = ClassroomDevices(classroom, hardware, card_source, timeout)
+        with self._lock:
+            if classroom in self._rooms:
+                hardware.shutdown()
+                raise ValueError(f"Classroom {classroom} already has devices")
+            self._rooms[classroom] = devices.start()
+        return devices
+    
+    def remove_classroom(self, classroom: str):
+        with self._lock:
+            devices = self._rooms.pop(classroom, None)
+        if devices is not None:
+            devices.stop()
+        return devices is not None
+    
+    def get(self, classroom: str) -> ClassroomDevices:
+        with self._lock:
+            devices = self._rooms.get(classroom)
+        if devices is None:
+            raise KeyError(f"No devices registered for classroom {classroom}")
+        return devices
+    
+    def __contains__(self, classroom):
+        with self._lock:
+            return classroom in self._rooms
+    
+    def classrooms(self):
+        with self._lock:
+            return sorted(self._rooms)
+    
+    def status(self):
+        with self._lock:
+            rooms = list(self._rooms.values())
+        return [devices.status() for devices in rooms]
+    
+    def stop(self):
+        for classroom in self.classrooms():
+            self.remove_classroom(classroom)
 
 # Initialize hardware manager
 hardware_manager = HardwareManager()
@@ -161,8 +571,8 @@ hardware_manager.initialize_hardware()
 print("\nRegistering teacher fingerprints...")
 success, fp_data = hardware_manager.register_teacher_fingerprint("T001")
 if success:
-    print(f"Teacher T001 fingerprint registered: {fp_data[:10]}...")
+    print(f"Teacher T001 fingerprint registered: {fp_data[:8].hex()}...")
     
 success, fp_data = hardware_manager.register_teacher_fingerprint("T002")
 if success:
-    print(f"Teacher T002 fingerprint registered: {fp_data[:10]}...")
\ No newline at end of file
+    print(f"Teacher T002 fingerprint registered: {fp_data[:8].hex()}...")
\ No newline at end of file
@@ -1,40 +1,83 @@
 # Main attendance session workflow
 
+import datetime
+import threading
+import time
+
+from card_reader_service import CardReaderService, ScanEventWriter
+from periodic_verifier import PeriodicVerifier
+from presence import PresenceBitmap
+from scan_ingest import ALREADY_PRESENT
+from session_recovery import STALE_AFTER_HOURS, recover_active_sessions
+from session_registry import ActiveSession, SessionConflict, SessionRegistry
+
 class AttendanceSessionManager:
-    """Manages the complete attendance session workflow"""
+    """Manages the complete attendance session workflow
+
+    Any number of sessions can be active at once (one per classroom); each
+    operation takes the session_id it applies to. With a single active
+    session, session_id can be left out.
+    """
     
     def __init__(self, attendance_system, hardware_manager):
         self.attendance_system = attendance_system
         self.hardware_manager = hardware_manager
-        self.current_session = None
-        self.session_active = False
+        self.sessions = SessionRegistry()
+    
+    @property
+    def session_active(self):
+        return len(self.sessions) > 0
+    
+    @property
+    def current_session(self):
+        """The active session's ID while exactly one is active"""
+        sessions = self.sessions.sessions()
+        return sessions[0].session_id if len(sessions) == 1 else None
+    
+    def _session(self, session_id=None):
+        """(ActiveSession, None) or (None, error message)"""
+        if session_id is not None:
+            session = self.sessions.get(session_id)
+            return (session, None) if session else (None, "Session not active")
+        sessions = self.sessions.sessions()
+        if not sessions:
+            return None, "No active session"
+        if len(sessions) > 1:
+            return None, "Several sessions are active; give a session_id"
+        return sessions[0], None
     
     def start_attendance_session(self, class_name: str, subject: str):
         """Start a new attendance session"""
-        if self.session_active:
-            return False, "Another session is already active"
+        if not self.sessions.reserve(class_name):
+            return False, f"Class {class_name} already has an active session"
         
-        print("\n" + "="*50)
-        print("STARTING ATTENDANCE SESSION")
-        print("="*50)
-        
-        # Step 1: Teacher fingerprint verification
-        print("Step 1: Teacher verification required...")
-        print("Please scan your fingerprint...")
-        
-        # Simulate fingerprint scan (in real implementation, this would wait for actual scan)
-        success, teacher_id = self.hardware_manager.verify_teacher()
-        
-        if not success:
-            print("✗ Teacher verification failed!")
-            return False, "Teacher verification failed"
-        
-        print(f"✓ Teacher verified: {teacher_id}")
-        
-        # Step 2: Start session in database
-        session_id = self.attendance_system.start_session(teacher_id, class_name, subject)
-        self.current_session = session_id
-        self.session_active = True
+        try:
+            print("\n" + "="*50)
+            print("STARTING ATTENDANCE SESSION")
+            print("="*50)
+            
+            # Step 1: Teacher fingerprint verification
+            print("Step 1: Teacher verification required...")
+            print("Please scan your fingerprint...")
+            
+            # Simulate fingerprint scan (in real implementation, this would wait for actual scan)
+            success, teacher_id = self.hardware_manager.verify_teacher()
+            
+            if not success:
+                print("✗ Teacher verification failed!")
+                self.sessions.release(class_name)
+                return False, "Teacher verification failed"
+            
+            print(f"✓ Teacher verified: {teacher_id}")
+            
+            # Step 2: Start session in database
+            session_id = self.attendance_system.start_session(teacher_id, class_name, subject)
+            session = ActiveSession(session_id, class_name, subject, teacher_id)
+            session.presence = self._load_presence(session_id)
+            self.sessions.add(session)
+        except Exception:
+            self.sessions.release(class_name)
+            raise
         
         print(f"✓ Session started with ID: {session_id}")
         print(f"Class: {class_name}")
@@ -44,10 +87,115 @@ class AttendanceSessionManager:
         
         return True, session_id
     
-    def process_student_attendance(self, num_students: int = 3):
+    def resume_attendance_session(self, session_id: str):
+        """Pick up a session that is still active in the database (e.g. after a restart)"""
+        if session_id in self.sessions:
+            return False, "Session already active"
+        
+        conn = self.attendance_system.get_connection()
+        row = conn.execute("SELECT status, class_name, subject, teacher_id FROM sessions WHERE session_id = ?",
+                           (session_id,)).fetchone()
+        conn.close()
+        if not row:
+            return False, "Session not found"
+        status, class_name, subject, teacher_id = row
+        if status != 'active':
+            return False, "Session is not active"
+        if not self.sessions.reserve(class_name):
+            return False, f"Class {class_name} already has an active session"
+        
+        session = ActiveSession(session_id, class_name, subject, teacher_id)
+        try:
+            session.presence = self._load_presence(session_id)
+            self.sessions.add(session)
+        except Exception:
+            self.sessions.release(class_name)
+            raise
+        print(f"✓ Session resumed: {session_id} ({session.presence.present_count} present, "
+              f"{session.presence.absent_count} absent)")
+        return True, session_id
+    
+    def recover_sessions(self, stale_after_hours: float = STALE_AFTER_HOURS, classes=None):
+        """Resume the sessions a crash left active in the database, closing stale ones
+        
+        Returns (resumed session IDs, closed session IDs).
+        """
+        start = time.perf_counter()
+        conn = self.attendance_system.get_connection()
+        try:
+            sessions, closed = recover_active_sessions(conn, stale_after_hours, classes)
+        finally:
+            conn.close()
+        resumed = self.adopt_sessions(sessions)
+        if resumed or closed:
+            print(f"✓ Recovered {len(resumed)} active session(s), closed {len(closed)} stale "
+                  f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return resumed, closed
+    
+    def adopt_sessions(self, sessions):
+        """Register recovered ActiveSessions; returns the IDs that were not already running"""
+        resumed = []
+        for session in sessions:
+            try:
+                self.sessions.add(session)
+            except SessionConflict:
+                continue
+            resumed.append(session.session_id)
+            print(f"✓ Session resumed: {session.session_id} ({session.class_name}, "
+                  f"{session.presence.present_count} present, {session.presence.absent_count} absent)")
+        return resumed
+    
+    def load_presence(self, session_id: str):
+        """(Re)build the presence bitmap of a session from the database"""
+        presence = self._load_presence(session_id)
+        session = self.sessions.get(session_id)
+        if session is not None:
+            with session.lock:
+                session.presence = presence
+        return presence
+    
+    def _load_presence(self, session_id):
+        conn = self.attendance_system.get_connection()
+        try:
+            return PresenceBitmap.load(conn, session_id)
+        finally:
+            conn.close()
+    
+    def mark_student(self, card_id: str, session_id: str = None):
+        """Mark a card scan, rejecting repeat taps from memory"""
+        session, error = self._session(session_id)
+        if session is None:
+            return False, error
+        
+        presence = session.presence
+        if presence is not None and presence.check(card_id):
+            return False, ALREADY_PRESENT
+        
+        success, message = self.attendance_system.mark_attendance(session.session_id, card_id)
+        if presence is not None and (success or message == ALREADY_PRESENT):
+            with session.lock:
+                presence.mark(card_id)
+        return success, message
+    
+    def mark_from_device(self, device: str, card_id: str):
+        """Mark a scan from a reader attached to a session with start_card_reader"""
+        session = self.sessions.for_device(device)
+        if session is None:
+            return False, f"No active session for device {device}"
+        return self.mark_student(card_id, session.session_id)
+    
+    def presence_counts(self, session_id: str = None):
+        """(present, absent) for a session, without a DB query"""
+        session, _ = self._session(session_id)
+        if session is None or session.presence is None:
+            return 0, 0
+        return session.presence.present_count, session.presence.absent_count
+    
+    def process_student_attendance(self, num_students: int = 3, session_id: str = None):
         """Process student card scans for attendance"""
-        if not self.session_active:
-            return False, "No active session"
+        session, error = self._session(session_id)
+        if session is None:
+            return False, error
         
         print("\n" + "-"*40)
         print("STUDENT ATTENDANCE PHASE")
@@ -61,7 +209,7 @@ class AttendanceSessionManager:
             
             # Simulate card scan
             card_id = sample_cards[i]
-            success, message = self.attendance_system.mark_attendance(self.current_session, card_id)
+            success, message = self.mark_student(card_id, session.session_id)
             
             if success:
                 print(f"✓ Attendance marked for card: {card_id}")
@@ -69,13 +217,66 @@ class AttendanceSessionManager:
             else:
                 print(f"✗ Failed to mark attendance: {message}")
         
+        present, absent = self.presence_counts(session.session_id)
         print(f"\nTotal students marked present: {attendance_count}")
+        print(f"Class presence: {present} present, {absent} absent")
         return True, attendance_count
     
-    def perform_camera_verification(self):
+    def start_card_reader(self, source, reader_id: str = 'R1', session_id: str = None, **service_options):
+        """Mark attendance from a background card reader until the session ends"""
+        session, error = self._session(session_id)
+        if session is None:
+            return False, error
+        
+        with session.lock:
+            if session.card_service is not None:
+                return False, "Card reader already running"
+            try:
+                self.sessions.attach_device(session.session_id, reader_id)
+            except SessionConflict as e:
+                return False, str(e)
+            
+            def report(event, result):
+                mark = "✓" if result['success'] else "✗"
+                print(f"{mark} {event['card_id']}: {result['message']}")
+            
+            # Scans are written to the session the reader was started for
+            session.reader_id = reader_id
+            session.card_service = CardReaderService(source, reader_id, **service_options)
+            session.scan_writer = ScanEventWriter(session.card_service, self.attendance_system.db_path,
+                                                  lambda event: session.session_id, report,
+                                                  presence=session.presence)
+            session.card_service.start()
+            session.scan_writer.start()
+        print(f"Card reader {reader_id} listening in the background")
+        return True, reader_id
+    
+    def stop_card_reader(self, session_id: str = None):
+        """Stop reading cards and write any scans still queued"""
+        session, error = self._session(session_id)
+        if session is None:
+            return False, error
+        
+        with session.lock:
+            if session.card_service is None:
+                return False, "Card reader not running"
+            
+            session.card_service.stop()
+            session.scan_writer.stop()
+            marked = session.scan_writer.stats['marked']
+            print(f"Card reader stopped: {session.card_service.stats['reads']} reads, "
+                  f"{session.card_service.stats['debounced']} debounced, {marked} marked present")
+            self.sessions.detach_device(session.reader_id)
+            session.card_service = None
+            session.scan_writer = None
+            session.reader_id = None
+        return True, marked
+    
+    def perform_camera_verification(self, session_id: str = None):
         """Perform camera-based verification"""
-        if not self.session_active:
-            return False, "No active session"
+        session, error = self._session(session_id)
+        if session is None:
+            return False, error
         
         print("\n" + "-"*40)
         print("CAMERA VERIFICATION PHASE")
@@ -83,14 +284,18 @@ class AttendanceSessionManager:
         
         print("Camera scanning classroom...")
         
-        # Get camera count
-        detected_count = self.hardware_manager.count_students(f"session_{self.current_session}_verification.jpg")
+        # Get camera count (the image is written in the background)
+        detected_count, image_key = self.hardware_manager.capture_verification()
+        if detected_count is None:
+            # Card scanning carries on; the camera is reconnected in the background
+            print("✗ Camera unavailable, verification skipped")
+            return False, "Camera unavailable"
         
         # Log verification
         discrepancy = self.attendance_system.log_camera_verification(
-            self.current_session, 
+            session.session_id, 
             detected_count,
-            f"session_{self.current_session}_verification.jpg"
+            image_key
         )
         
         print(f"Camera detected: {detected_count} students")
@@ -104,36 +309,79 @@ class AttendanceSessionManager:
         
         return True, discrepancy
     
-    def end_attendance_session(self):
-        """End the current attendance session"""
-        if not self.session_active:
-            return False, "No active session"
-        
-        print("\n" + "-"*40)
-        print("ENDING ATTENDANCE SESSION")
-        print("-"*40)
-        
-        # Teacher fingerprint verification to end session
-        print("Teacher verification required to end session...")
-        success, teacher_id = self.hardware_manager.verify_teacher()
-        
-        if not success:
-            print("✗ Teacher verification failed! Session remains active.")
-            return False, "Teacher verification failed"
-        
-        # End session
-        self.attendance_system.end_session(self.current_session)
+    def start_periodic_verification(self, session_id: str = None, **verifier_options):
+        """Re-count the room whenever it changes until the session ends"""
+        session, error = self._session(session_id)
+        if session is None:
+            return False, error
+        
+        def report(count, discrepancy, trigger):
+            print(f"Camera ({trigger}): {count} persons, discrepancy {discrepancy}")
+        
+        with session.lock:
+            if session.verifier is not None:
+                return False, "Periodic verification already running"
+            session.verifier = PeriodicVerifier(self.hardware_manager.camera_system, self.attendance_system,
+                                                session.session_id, on_log=report, **verifier_options)
+            session.verifier.start()
+        return True, "Periodic verification started"
+    
+    def stop_periodic_verification(self, session_id: str = None):
+        session, error = self._session(session_id)
+        if session is None:
+            return False, error
+        
+        with session.lock:
+            if session.verifier is None:
+                return False, "Periodic verification not running"
+            
+            session.verifier.stop()
+            stats = session.verifier.stats
+            print(f"Periodic verification stopped: {stats['samples']} frames sampled, "
+                  f"{stats['detections']} detector runs, {stats['logged']} logged")
+            session.verifier = None
+        return True, stats
+    
+    def end_attendance_session(self, session_id: str = None):
+        """End an attendance session"""
+        session, error = self._session(session_id)
+        if session is None:
+            return False, error
+        
+        with session.lock:
+            if session.ended:
+                return False, "Session not active"
+            
+            print("\n" + "-"*40)
+            print("ENDING ATTENDANCE SESSION")
+            print("-"*40)
+            
+            # Teacher fingerprint verification to end session
+            print("Teacher verification required to end session...")
+            success, teacher_id = self.hardware_manager.verify_teacher()
+            
+            if not success:
+                print("✗ Teacher verification failed! Session remains active.")
+                return False, "Teacher verification failed"
+            
+            # Scans read before the teacher ended the session still count
+            if session.card_service is not None:
+                self.stop_card_reader(session.session_id)
+            if session.verifier is not None:
+                self.stop_periodic_verification(session.session_id)
+            
+            # End session
+            self.attendance_system.end_session(session.session_id)
+            session.ended = True
+            self.sessions.remove(session.session_id)
         
         print(f"✓ Session ended by teacher: {teacher_id}")
         print(f"End time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
         # Generate session report
-        report = self.attendance_system.get_session_report(self.current_session)
+        report = self.attendance_system.get_session_report(session.session_id)
         self.print_session_report(report)
         
-        self.session_active = False
-        self.current_session = None
-        
         return True, "Session ended successfully"
     
     def print_session_report(self, report):
@@ -147,13 +395,13 @@ class AttendanceSessionManager:
         print("="*50)
         
         session = report['session']
-        print(f"Session ID: {session[1]}")
-        print(f"Teacher: {session[-1]} ({session[2]})")
-        print(f"Class: {session[3]}")
-        print(f"Subject: {session[4]}")
-        print(f"Start Time: {session[5]}")
-        print(f"End Time: {session[6]}")
-        print(f"Status: {session[7]}")
+        print(f"Session ID: {session.session_id}")
+        print(f"Teacher: {session.teacher_name} ({session.teacher_id})")
+        print(f"Class: {session.class_name}")
+        print(f"Subject: {session.subject}")
+        print(f"Start Time: {session.start_time}")
+        print(f"End Time: {session.end_time}")
+        print(f"Status: {session.status}")
         
         print(f"\nAttendance Summary:")
         print(f"Total Present: {report['total_present']}")
@@ -161,19 +409,87 @@ class AttendanceSessionManager:
         if report['attendance_records']:
             print(f"\nStudent List:")
             for record in report['attendance_records']:
-                print(f"- {record[7]} (ID: {record[2]}) - Scanned at: {record[3]}")
+                print(f"- {record.student_name} (ID: {record.student_id}) - Scanned at: {record.card_scan_time}")
         
         if report['camera_verification']:
             camera_log = report['camera_verification']
             print(f"\nCamera Verification:")
-            print(f"Detected Count: {camera_log[2]}")
-            print(f"Card Scan Count: {camera_log[3]}")
-            discrepancy = abs(camera_log[2] - camera_log[3])
+            print(f"Detected Count: {camera_log.detected_count}")
+            print(f"Card Scan Count: {camera_log.card_scan_count}")
+            discrepancy = camera_log.discrepancy
             if discrepancy == 0:
                 print("✓ Verification Status: PASSED (No discrepancy)")
             else:
                 print(f"⚠ Verification Status: WARNING ({discrepancy} discrepancy)")
 
+class ClassroomRouter:
+    """Routes sessions and card scans to the session manager of each classroom
+
+    Every room of a DeviceRegistry gets its own AttendanceSessionManager, so
+    sessions in different rooms run side by side. They all share one
+    AttendanceSystem (one DB connection layer).
+    """
+    
+    def __init__(self, attendance_system, registry):
+        self.attendance_system = attendance_system
+        self.registry = registry
+        self._managers = {}
+        self._lock = threading.Lock()
+    
+    def manager(self, classroom: str) -> AttendanceSessionManager:
+        with self._lock:
+            manager = self._managers.get(classroom)
+            if manager is None:
+                manager = AttendanceSessionManager(self.attendance_system, self.registry.get(classroom))
+                self._managers[classroom] = manager
+            return manager
+    
+    def start_session(self, classroom: str, subject: str, card_reader: bool = True):
+        """Start a session in a classroom, reading cards from its reader if it has one"""
+        manager = self.manager(classroom)
+        success, result = manager.start_attendance_session(classroom, subject)
+        source = manager.hardware_manager.card_source
+        if success and card_reader and source is not None:
+            manager.start_card_reader(source, reader_id=f"{classroom}-reader")
+        return success, result
+    
+    def recover_sessions(self, stale_after_hours: float = STALE_AFTER_HOURS):
+        """Resume the registry's classrooms' sessions after a restart and restart their card readers"""
+        conn = self.attendance_system.get_connection()
+        try:
+            sessions, closed = recover_active_sessions(conn, stale_after_hours, self.registry.classrooms())
+        finally:
+            conn.close()
+        
+        resumed = []
+        for session in sessions:
+            manager = self.manager(session.class_name)
+            if not manager.adopt_sessions([session]):
+                continue
+            resumed.append(session.session_id)
+            source = manager.hardware_manager.card_source
+            if source is not None:
+                manager.start_card_reader(source, reader_id=f"{session.class_name}-reader",
+                                          session_id=session.session_id)
+        return resumed, closed
+    
+    def mark_student(self, classroom: str, card_id: str):
+        return self.manager(classroom).mark_student(card_id)
+    
+    def verify(self, classroom: str):
+        return self.manager(classroom).perform_camera_verification()
+    
+    def end_session(self, classroom: str):
+        return self.manager(classroom).end_attendance_session()
+    
+    def active_sessions(self):
+        """classroom -> session_id of every running session"""
+        with self._lock:
+            managers = list(self._managers.items())
+        return {classroom: manager.current_session for classroom, manager in managers
+                if manager.session_active}
+
 # Initialize session manager
 session_manager = AttendanceSessionManager(attendance_system, hardware_manager)
+session_manager.recover_sessions()
 print("Attendance Session Manager initialized successfully!")
\ No newline at end of file
@@ -0,0 +1,123 @@
+# Start-up recovery of active sessions
+#
+# A crash or power cut mid-lesson leaves the session with status 'active'
+# in the DB, while a restarted AttendanceSessionManager knows nothing of it:
+# scans were refused until someone closed the session by hand. Recovery runs
+# at start-up and brings those sessions back before the first card is read:
+#
+#   1. find active sessions through a partial index (it only holds the few
+#      active rows, however long the sessions table grows)
+#   2. close stale ones by policy: started more than STALE_AFTER_HOURS ago,
+#      or an older duplicate of another active session in the same class.
+#      end_time is the last scan (or the start, if nobody scanned) and the
+#      session is folded into the rollups like any ended session
+#   3. rebuild the presence bitmaps of the rest in bulk, with one roster
+#      query and one attendance query for all of them
+#
+# Usage: sessions, closed = recover_active_sessions(conn)
+
+import datetime
+import time
+from typing import List, Optional, Tuple
+
+import metrics
+from presence import PresenceBitmap
+from rollups import apply_session_rollup
+from session_registry import ActiveSession
+
+# A lesson that started this long ago is over; close it rather than resume it
+STALE_AFTER_HOURS = 4.0
+
+SESSIONS_RECOVERED = metrics.counter(
+    'session_recovery_total', 'Active sessions found at start-up', ['outcome'])
+RECOVERY_SECONDS = metrics.histogram('session_recovery_seconds', 'Start-up session recovery time')
+
+
+def create_session_indexes(cursor):
+    """Partial index over active sessions (idempotent)"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_active
+        ON sessions (class_name, start_time) WHERE status = 'active'
+    ''')
+
+
+def _parse_time(value) -> Optional[datetime.datetime]:
+    if isinstance(value, datetime.datetime) or value is None:
+        return value
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _stale_sessions(rows, now: datetime.datetime, stale_after_hours: float) -> List[str]:
+    """Session IDs to close: too old, or superseded by a newer session of the class"""
+    cutoff = now - datetime.timedelta(hours=stale_after_hours)
+    stale, newest = [], {}
+    for session_id, class_name, _, _, start_time in rows:
+        started = _parse_time(start_time)
+        if started is None or started < cutoff:
+            stale.append(session_id)
+            continue
+        previous = newest.get(class_name)
+        if previous is None or started > previous[1]:
+            if previous is not None:
+                stale.append(previous[0])
+            newest[class_name] = (session_id, started)
+        else:
+            stale.append(session_id)
+    return stale
+
+
+def close_sessions(cursor, session_ids: List[str]):
+    """Complete sessions that can't be resumed, ending them at their last scan"""
+    for session_id in session_ids:
+        cursor.execute('''
+            UPDATE sessions SET status = 'completed', end_time = COALESCE(
+                (SELECT MAX(card_scan_time) FROM attendance WHERE session_id = ?), start_time)
+            WHERE session_id = ? AND status = 'active'
+        ''', (session_id, session_id))
+        if cursor.rowcount:
+            apply_session_rollup(cursor, session_id)
+
+
+def recover_active_sessions(conn, stale_after_hours: float = STALE_AFTER_HOURS,
+                            classes: Optional[List[str]] = None,
+                            now: Optional[datetime.datetime] = None) -> Tuple[List[ActiveSession], List[str]]:
+    """Close stale active sessions and rebuild the others
+
+    Returns (sessions, closed): an ActiveSession with its presence bitmap for
+    every session to resume, and the IDs of the sessions that were closed.
+    `classes` limits recovery to the classrooms this process serves.
+    """
+    start = time.perf_counter()
+    now = now or datetime.datetime.now()
+    cursor = conn.cursor()
+    create_session_indexes(cursor)
+
+    class_filter, params = '', ()
+    if classes is not None:
+        class_filter = f"AND class_name IN ({', '.join('?' * len(classes))})"
+        params = tuple(classes)
+    rows = cursor.execute(f'''
+        SELECT session_id, class_name, subject, teacher_id, start_time FROM sessions
+        WHERE status = 'active' {class_filter}
+    ''', params).fetchall()
+
+    closed = _stale_sessions(rows, now, stale_after_hours)
+    if closed:
+        close_sessions(cursor, closed)
+    conn.commit()
+
+    presence = PresenceBitmap.load_active(conn, classes) if len(rows) > len(closed) else {}
+    sessions = []
+    for session_id, class_name, subject, teacher_id, _ in rows:
+        if session_id in presence:
+            session = ActiveSession(session_id, class_name, subject, teacher_id)
+            session.presence = presence[session_id]
+            sessions.append(session)
+
+    SESSIONS_RECOVERED.labels('resumed').inc(len(sessions))
+    SESSIONS_RECOVERED.labels('closed').inc(len(closed))
+    RECOVERY_SECONDS.observe(time.perf_counter() - start)
+    return sessions, closed
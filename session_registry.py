@@ -0,0 +1,123 @@
+# Registry of active attendance sessions
+#
+# AttendanceSessionManager used to hold one current_session, so a second
+# classroom could not start a session until the first one ended. The
+# registry keeps every active session's in-memory state (presence bitmap,
+# card reader, periodic verifier) in an ActiveSession, indexed by session ID,
+# by classroom and by the devices feeding it.
+#
+# The registry lock only guards the indexes and is held for a dictionary
+# update. Work on a session (marking, verification, ending) takes that
+# session's own lock, so hundreds of sessions proceed side by side. A
+# classroom is reserved before its teacher is verified, so two concurrent
+# starts for the same room can't both succeed.
+
+import threading
+from typing import Dict, List, Optional
+
+
+class SessionConflict(RuntimeError):
+    """The classroom or device already belongs to an active session"""
+
+
+class ActiveSession:
+    """In-memory state of one running session"""
+
+    def __init__(self, session_id: str, class_name: str, subject: str = None, teacher_id: str = None):
+        self.session_id = session_id
+        self.class_name = class_name
+        self.subject = subject
+        self.teacher_id = teacher_id
+        self.presence = None      # PresenceBitmap
+        self.card_service = None  # CardReaderService
+        self.scan_writer = None   # ScanEventWriter
+        self.reader_id = None
+        self.verifier = None      # PeriodicVerifier
+        self.ended = False
+        self.lock = threading.RLock()
+
+    def __repr__(self):
+        return f"<ActiveSession {self.session_id[:8]} {self.class_name}>"
+
+
+class SessionRegistry:
+    """Thread-safe index of active sessions by session ID, classroom and device"""
+
+    def __init__(self):
+        self._by_id: Dict[str, ActiveSession] = {}
+        self._by_classroom: Dict[str, Optional[ActiveSession]] = {}  # None while reserved
+        self._by_device: Dict[str, ActiveSession] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, class_name: str) -> bool:
+        """Claim a classroom for a session about to start; False if it is taken"""
+        with self._lock:
+            if class_name in self._by_classroom:
+                return False
+            self._by_classroom[class_name] = None
+            return True
+
+    def release(self, class_name: str):
+        """Give up a reservation whose session did not start"""
+        with self._lock:
+            if self._by_classroom.get(class_name, False) is None:
+                del self._by_classroom[class_name]
+
+    def add(self, session: ActiveSession):
+        """Register a started session (filling its classroom's reservation, if any)"""
+        with self._lock:
+            if session.session_id in self._by_id:
+                raise SessionConflict(f"Session {session.session_id} is already active")
+            holder = self._by_classroom.get(session.class_name)
+            if holder is not None:
+                raise SessionConflict(f"Class {session.class_name} already has an active session")
+            self._by_id[session.session_id] = session
+            self._by_classroom[session.class_name] = session
+
+    def attach_device(self, session_id: str, device: str):
+        """Route a device (e.g. a card reader ID) to a session"""
+        with self._lock:
+            session = self._by_id[session_id]
+            holder = self._by_device.get(device)
+            if holder is not None and holder is not session:
+                raise SessionConflict(f"Device {device} is already in session {holder.session_id}")
+            self._by_device[device] = session
+
+    def detach_device(self, device: str):
+        with self._lock:
+            self._by_device.pop(device, None)
+
+    def remove(self, session_id: str) -> Optional[ActiveSession]:
+        with self._lock:
+            session = self._by_id.pop(session_id, None)
+            if session is None:
+                return None
+            if self._by_classroom.get(session.class_name) is session:
+                del self._by_classroom[session.class_name]
+            for device in [d for d, s in self._by_device.items() if s is session]:
+                del self._by_device[device]
+            return session
+
+    def get(self, session_id: str) -> Optional[ActiveSession]:
+        with self._lock:
+            return self._by_id.get(session_id)
+
+    def for_classroom(self, class_name: str) -> Optional[ActiveSession]:
+        with self._lock:
+            return self._by_classroom.get(class_name)
+
+    def for_device(self, device: str) -> Optional[ActiveSession]:
+        with self._lock:
+            return self._by_device.get(device)
+
+    def sessions(self) -> List[ActiveSession]:
+        with self._lock:
+            return list(self._by_id.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_id)
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._by_id
@@ -0,0 +1,185 @@
+# Simulated card readers for the TCP listener
+#
+# Opens N persistent connections to reader_listener.py and streams
+# `reader_id,card_id,timestamp` lines at a configurable rate, then reports
+# throughput, acknowledgement latency percentiles and status counts. Scans
+# acknowledged with RETRY are resent. SimulatedReader.send() also drives the
+# listener with hand-written lines, for tests.
+#
+# Usage: python simulated_reader.py --readers 1000 --scans 20 --rate 2
+
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+from collections import Counter, deque
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from reader_listener import DEFAULT_PORT
+
+# Resends of a scan acknowledged with RETRY, with exponential delay
+MAX_RESENDS = 5
+RESEND_DELAY_SECONDS = 0.05
+
+
+class SimulatedReader:
+    """One reader connection sending scans and timing their acknowledgements
+
+    Scans acknowledged with RETRY (the listener couldn't write them yet) are
+    resent after a short delay, as a real reader should; latency runs from
+    the first send to the final acknowledgement.
+    """
+
+    def __init__(self, reader_id: str, cards: List[str], host='127.0.0.1', port=DEFAULT_PORT,
+                 session_id: str = None):
+        self.reader_id = reader_id
+        self.cards = cards
+        self.host = host
+        self.port = port
+        self.session_id = session_id
+        self.latencies = []
+        self.statuses = Counter()
+        self.resends = 0
+
+    async def run(self, scans: int, rate: float = 0.0):
+        """Send `scans` random scans at `rate` scans/second (0 = as fast as possible)"""
+        # Generated as they are sent, so each line carries its own send time
+        lines = (self.scan_line(random.choice(self.cards)) for _ in range(scans))
+        return await self.send(lines, rate)
+
+    def scan_line(self, card_id: str, timestamp: str = None) -> str:
+        # Unique timestamp per line so every scan is a distinct event
+        line = f"{self.reader_id},{card_id},{timestamp or f'{time.time():.6f}'}"
+        if self.session_id:
+            line += f",{self.session_id}"
+        return line
+
+    async def send(self, lines: Iterable[str], rate: float = 0.0) -> List[Optional[str]]:
+        """Send raw lines; returns the final acknowledgement of each (None if the listener hung up)"""
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        acks = []
+        pending = deque()  # [index, line, first sent_at, resends], in acknowledgement order
+        state = {'sent_all': False}
+
+        def write(entry):
+            pending.append(entry)
+            writer.write((entry[1] + "\n").encode())
+
+        receiver = asyncio.create_task(self._receive(reader, write, pending, acks, state))
+        interval = 1.0 / rate if rate > 0 else 0.0
+        try:
+            for line in lines:
+                acks.append(None)
+                write([len(acks) - 1, line, time.perf_counter(), 0])
+                await writer.drain()
+                if interval:
+                    await asyncio.sleep(interval * random.uniform(0.5, 1.5))
+        except ConnectionError:
+            pass
+
+        state['sent_all'] = True
+        if not pending:
+            receiver.cancel()
+        try:
+            await receiver
+        except asyncio.CancelledError:
+            pass
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+        return acks
+
+    async def _receive(self, reader, write, pending, acks, state):
+        while pending or not state['sent_all']:
+            try:
+                line = await reader.readline()
+            except ConnectionError:
+                return
+            if not line:
+                return
+            ack = line.decode().rstrip('\n')
+            status = ack.split(',', 1)[0]
+            entry = pending.popleft()
+            if status == 'RETRY' and entry[3] < MAX_RESENDS:
+                self.resends += 1
+                await asyncio.sleep(RESEND_DELAY_SECONDS * 2 ** entry[3])
+                entry[3] += 1
+                write(entry)
+                continue
+            acks[entry[0]] = ack
+            self.latencies.append(time.perf_counter() - entry[2])
+            self.statuses[status] += 1
+
+
+def load_cards(db_path):
+    conn = sqlite3.connect(db_path)
+    cards = [row[0] for row in conn.execute("SELECT card_id FROM students")]
+    conn.close()
+    return cards
+
+
+async def simulate(readers: int, scans: int, rate: float, cards: List[str],
+                   host='127.0.0.1', port=DEFAULT_PORT, session_id: str = None):
+    """Run a fleet of simulated readers and summarize the results"""
+    fleet = [SimulatedReader(f"SIM{i:04d}", cards, host, port, session_id) for i in range(readers)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(r.run(scans, rate) for r in fleet))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([lat for r in fleet for lat in r.latencies]) * 1000
+    statuses = Counter()
+    for r in fleet:
+        statuses.update(r.statuses)
+    resends = sum(r.resends for r in fleet)
+
+    return {
+        'readers': readers,
+        'scans': int(latencies.size),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(latencies.size / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(float(np.percentile(latencies, 50)), 2) if latencies.size else None,
+            'p95': round(float(np.percentile(latencies, 95)), 2) if latencies.size else None,
+            'p99': round(float(np.percentile(latencies, 99)), 2) if latencies.size else None,
+            'max': round(float(latencies.max()), 2) if latencies.size else None,
+        },
+        'statuses': dict(statuses),
+        'resends': resends,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated card readers for reader_listener.py")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--readers', type=int, default=10, help="Concurrent reader connections")
+    parser.add_argument('--scans', type=int, default=20, help="Scans per reader")
+    parser.add_argument('--rate', type=float, default=1.0, help="Scans per second per reader (0 = unthrottled)")
+    parser.add_argument('--db', default='attendance_system.db', help="Database to draw card IDs from")
+    parser.add_argument('--cards', nargs='*', help="Card IDs to scan instead of reading the database")
+    parser.add_argument('--session', help="Session ID to send with each scan")
+    args = parser.parse_args()
+
+    cards = args.cards or load_cards(args.db)
+    if not cards:
+        print("No card IDs available")
+        return
+
+    result = asyncio.run(simulate(args.readers, args.scans, args.rate, cards,
+                                  args.host, args.port, args.session))
+
+    print(f"Readers: {result['readers']}  Scans: {result['scans']}  Elapsed: {result['elapsed_seconds']}s")
+    print(f"Throughput: {result['throughput_per_second']} scans/s")
+    latency = result['latency_ms']
+    print(f"Ack latency ms: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
+    print(f"Statuses: {result['statuses']}  Resends: {result['resends']}")
+
+
+if __name__ == '__main__':
+    main()
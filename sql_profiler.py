@@ -0,0 +1,353 @@
+# Opt-in SQL profiler
+#
+# connect() returns a plain sqlite3 connection unless profiling is enabled
+# (ATTENDANCE_SQL_PROFILE=1, or PROFILER.enable()). Profiled connections
+# hand out cursors that time execute() plus the fetches that follow it, and
+# a trace callback counts every statement SQLite actually runs, including
+# trigger bodies and executescript() parts.
+#
+# Statements are grouped by fingerprint: the SQL with literals and
+# parameter lists normalized to `?`, so `WHERE card_id = 'CARD001'` and
+# `WHERE card_id = 'CARD002'` share one entry. A statement slower than
+# ATTENDANCE_SQL_SLOW_MS (default 50) is logged with its EXPLAIN QUERY PLAN,
+# so a full table scan after a dropped index shows up on the first slow call.
+#
+# Stats are served at /debug/sql (registered only when ATTENDANCE_SQL_PROFILE
+# is set) and can be written to JSON with dump(), or on exit by setting
+# ATTENDANCE_SQL_PROFILE_DUMP=path. Bound parameters of slow statements are
+# card IDs and the like, so the slow log redacts them unless
+# ATTENDANCE_SQL_LOG_PARAMETERS=1.
+#
+# Usage: python sql_profiler.py report sql_profile.json
+
+import atexit
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+from flask import jsonify, request
+
+logger = logging.getLogger('sql_profiler')
+
+DEFAULT_SLOW_MS = 50.0
+SLOW_LOG_SIZE = 100
+
+# Re-capture a fingerprint's plan at most this often (plans change with indexes/ANALYZE)
+PLAN_REFRESH_SECONDS = 60.0
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+SORT_KEYS = ('total_ms', 'mean_ms', 'max_ms', 'calls', 'traced', 'rows', 'slow_calls')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_BLOB_LITERAL = re.compile(r"\b[xX]\?")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_NAMED_PARAMETER = re.compile(r"[:@$]\w+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalize a statement so calls that differ only in values group together"""
+    normalized = _STRING_LITERAL.sub('?', sql)
+    normalized = _BLOB_LITERAL.sub('?', normalized)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _NAMED_PARAMETER.sub('?', normalized)
+    normalized = _PLACEHOLDER_LIST.sub('(?...)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+
+def _fingerprint_id(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+class QueryStats:
+    __slots__ = ('fingerprint', 'calls', 'traced', 'rows', 'total_ms', 'max_ms',
+                 'slow_calls', 'plan', 'plan_captured_at')
+
+    def __init__(self, normalized):
+        self.fingerprint = normalized
+        self.calls = 0
+        self.traced = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow_calls = 0
+        self.plan = None
+        self.plan_captured_at = 0.0
+
+    def to_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'calls': self.calls,
+            'traced': self.traced,
+            'rows': self.rows,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else None,
+            'max_ms': round(self.max_ms, 3),
+            'slow_calls': self.slow_calls,
+            'plan': self.plan,
+        }
+
+
+class SQLProfiler:
+    """Per-fingerprint statement stats shared by all profiled connections"""
+
+    def __init__(self):
+        self.enabled = bool(os.environ.get('ATTENDANCE_SQL_PROFILE'))
+        self.slow_ms = float(os.environ.get('ATTENDANCE_SQL_SLOW_MS', DEFAULT_SLOW_MS))
+        self.log_parameters = bool(os.environ.get('ATTENDANCE_SQL_LOG_PARAMETERS'))
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._slow_log = deque(maxlen=SLOW_LOG_SIZE)
+        self.started_at = datetime.datetime.now()
+
+    def enable(self, slow_ms=None):
+        if slow_ms is not None:
+            self.slow_ms = float(slow_ms)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow_log.clear()
+            self.started_at = datetime.datetime.now()
+
+    def connect(self, db_path, **kwargs):
+        if not self.enabled:
+            return sqlite3.connect(db_path, **kwargs)
+        conn = sqlite3.connect(db_path, factory=ProfiledConnection, **kwargs)
+        conn.profiler = self
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _entry(self, normalized):
+        key = _fingerprint_id(normalized)
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = self._stats[key] = QueryStats(normalized)
+        return entry
+
+    def _trace(self, sql):
+        if sql.lstrip()[:7].upper() == 'EXPLAIN':
+            return
+        normalized = fingerprint(sql)
+        with self._lock:
+            self._entry(normalized).traced += 1
+
+    def record(self, normalized, elapsed_ms, statement_ms, rows=0, new_call=True):
+        """Add timing to a fingerprint; returns the entry for plan capture"""
+        with self._lock:
+            entry = self._entry(normalized)
+            if new_call:
+                entry.calls += 1
+            entry.rows += rows
+            entry.total_ms += elapsed_ms
+            entry.max_ms = max(entry.max_ms, statement_ms)
+            return entry
+
+    def record_slow(self, conn, entry, sql, parameters, elapsed_ms):
+        now = time.time()
+        plan = None
+        if now - entry.plan_captured_at >= PLAN_REFRESH_SECONDS:
+            plan = explain(conn, sql, parameters)
+
+        with self._lock:
+            entry.slow_calls += 1
+            if plan is not None:
+                entry.plan = plan
+                entry.plan_captured_at = now
+            self._slow_log.append({
+                'at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'elapsed_ms': round(elapsed_ms, 3),
+                'fingerprint': entry.fingerprint,
+                'sql': sql.strip(),
+                'parameters': (repr(parameters)[:200] if self.log_parameters
+                               else _redacted(parameters)),
+                'plan': entry.plan,
+            })
+
+        logger.warning("Slow SQL (%.1f ms): %s\nPlan: %s", elapsed_ms, entry.fingerprint,
+                       '; '.join(entry.plan or []) or 'n/a')
+
+    def snapshot(self, order_by='total_ms'):
+        if order_by not in SORT_KEYS:
+            order_by = 'total_ms'
+        with self._lock:
+            stats = [entry.to_dict() for entry in self._stats.values()]
+            slow = list(self._slow_log)
+        stats.sort(key=lambda entry: entry[order_by] or 0, reverse=True)
+        return {
+            'enabled': self.enabled,
+            'slow_ms': self.slow_ms,
+            'since': self.started_at.isoformat(timespec='seconds'),
+            'queries': stats,
+            'slow_queries': slow[::-1],
+        }
+
+    def dump(self, path):
+        """Write the current stats to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+def _redacted(parameters):
+    count = len(parameters) if isinstance(parameters, (list, tuple, dict)) else 1
+    return f"<{count} parameter(s) redacted>" if parameters else None
+
+
+def explain(conn, sql, parameters=()):
+    """EXPLAIN QUERY PLAN detail lines, or None for statements SQLite can't explain"""
+    words = sql.split(None, 1)
+    if not words or words[0].upper() not in EXPLAINABLE:
+        return None
+    try:
+        cursor = sqlite3.Cursor(conn)
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+        return [row[3] for row in cursor.fetchall()]
+    except sqlite3.Error:
+        return None
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute) are profiled"""
+
+    profiler = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or ProfiledCursor)
+
+    # The C implementations of these bypass a Python cursor subclass's execute()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Times each statement from execute() through its last fetch"""
+
+    _statement = None
+
+    def _begin(self, sql, parameters, call):
+        self._statement = None
+        start = time.perf_counter()
+        try:
+            return call()
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            normalized = fingerprint(sql)
+            entry = self.connection.profiler.record(normalized, elapsed_ms, elapsed_ms)
+            self._statement = [entry, sql, parameters, elapsed_ms, False]
+            self._check_slow()
+
+    def _add_fetch(self, start, rows):
+        if self._statement is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._statement[3] += elapsed_ms
+        self.connection.profiler.record(self._statement[0].fingerprint, elapsed_ms,
+                                        self._statement[3], rows, new_call=False)
+        self._check_slow()
+
+    def _check_slow(self):
+        entry, sql, parameters, elapsed_ms, logged = self._statement
+        profiler = self.connection.profiler
+        if elapsed_ms >= profiler.slow_ms and not logged:
+            # Logged once per execution, the first time it crosses the threshold
+            self._statement[4] = True
+            profiler.record_slow(self.connection, entry, sql, parameters, elapsed_ms)
+
+    def execute(self, sql, parameters=()):
+        return self._begin(sql, parameters, lambda: super(ProfiledCursor, self).execute(sql, parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._begin(sql, (), lambda: super(ProfiledCursor, self).executemany(sql, seq_of_parameters))
+
+    def executescript(self, sql_script):
+        return self._begin(sql_script, (), lambda: super(ProfiledCursor, self).executescript(sql_script))
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add_fetch(start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add_fetch(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add_fetch(start, len(rows))
+        return rows
+
+
+PROFILER = SQLProfiler()
+
+
+def connect(db_path, **kwargs):
+    """sqlite3.connect, profiled when PROFILER is enabled"""
+    return PROFILER.connect(db_path, **kwargs)
+
+
+def _dump_on_exit():
+    path = os.environ.get('ATTENDANCE_SQL_PROFILE_DUMP')
+    if path and PROFILER.enabled:
+        PROFILER.dump(path)
+
+
+atexit.register(_dump_on_exit)
+
+
+def init_app(app):
+    """Serve profiler stats at /debug/sql while profiling is enabled"""
+    if not PROFILER.enabled:
+        return PROFILER
+
+    @app.route('/debug/sql', methods=['GET', 'POST'])
+    def sql_profile():
+        """Per-fingerprint SQL stats; POST with ?reset=1 clears them"""
+        if request.method == 'POST' and request.args.get('reset'):
+            PROFILER.reset()
+        return jsonify(PROFILER.snapshot(request.args.get('order', 'total_ms')))
+
+    return PROFILER
+
+
+def print_report(snapshot, limit=20):
+    print(f"SQL profile since {snapshot['since']} (slow threshold {snapshot['slow_ms']} ms)")
+    print(f"{'calls':>8} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'slow':>5}  fingerprint")
+    for entry in snapshot['queries'][:limit]:
+        mean = entry['mean_ms'] if entry['mean_ms'] is not None else 0.0
+        print(f"{entry['calls']:>8} {entry['total_ms']:>10.1f} {mean:>9.2f} "
+              f"{entry['max_ms']:>9.2f} {entry['slow_calls']:>5}  {entry['fingerprint'][:100]}")
+        for line in entry['plan'] or []:
+            print(f"{'':>46}plan: {line}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'report':
+        print("Usage: python sql_profiler.py report <dump.json> [limit]")
+        sys.exit(1)
+
+    with open(sys.argv[2]) as f:
+        print_report(json.load(f), int(sys.argv[3]) if len(sys.argv) > 3 else 20)
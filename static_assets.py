@@ -0,0 +1,229 @@
+# Self-hosted, fingerprinted static assets
+#
+# `python static_assets.py build --vendor` downloads Bootstrap and Font
+# Awesome into static/vendor/ (once), then copies every file under static/
+# to static/dist/ with a content hash in its name, writes precompressed .gz
+# and .br variants next to the text assets, and records the mapping in
+# static/dist/manifest.json.
+#
+# init_app() teaches Flask about the manifest: url_for('static', filename=...)
+# resolves to the hashed name, and /static/dist/ is served with the best
+# precompressed variant and `Cache-Control: immutable`, so repeat page loads
+# make no asset requests at all. Without a manifest (development) assets
+# are served from static/ as usual. Templates link vendored files with
+# asset_url(), which points at the CDN while static/vendor/ hasn't been
+# downloaded, so a fresh checkout still renders with Bootstrap and icons.
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import sys
+import urllib.request
+
+from flask import request, send_file, url_for
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Hashed assets never change, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Only text formats are worth precompressing; woff2/images are already compressed
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.ttf', '.eot'}
+MIN_COMPRESS_BYTES = 256
+
+VENDOR_ASSETS = {
+    'vendor/bootstrap/css/bootstrap.min.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/js/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+    'vendor/fontawesome/css/all.min.css':
+        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
+}
+for _font in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility'):
+    for _ext in ('woff2', 'ttf'):
+        VENDOR_ASSETS[f'vendor/fontawesome/webfonts/{_font}.{_ext}'] = \
+            f'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/webfonts/{_font}.{_ext}'
+
+CSS_URL_PATTERN = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def vendor_assets(static_folder):
+    """Download third-party assets into static/vendor/ (skips existing files)"""
+    fetched = 0
+    for relative_path, url in VENDOR_ASSETS.items():
+        target = os.path.join(static_folder, relative_path)
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        print(f"Downloading {url}")
+        with urllib.request.urlopen(url, timeout=30) as response, open(target + '.tmp', 'wb') as f:
+            shutil.copyfileobj(response, f)
+        os.replace(target + '.tmp', target)
+        fetched += 1
+    return fetched
+
+
+def build_assets(static_folder):
+    """Write fingerprinted, precompressed copies of static/ into static/dist/"""
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist_folder):
+        shutil.rmtree(dist_folder)
+
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_folder]
+        for name in files:
+            full_path = os.path.join(root, name)
+            sources.append(os.path.relpath(full_path, static_folder).replace(os.sep, '/'))
+
+    # CSS goes last so its url() references can point at hashed fonts/images
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+    manifest = {}
+    for relative_path in sources:
+        with open(os.path.join(static_folder, relative_path), 'rb') as f:
+            content = f.read()
+
+        if relative_path.endswith('.css'):
+            content = _rewrite_css_urls(content, relative_path, manifest)
+
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        stem, ext = posixpath.splitext(relative_path)
+        hashed_path = f"{stem}.{digest}{ext}"
+
+        target = os.path.join(dist_folder, hashed_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+        _write_compressed_variants(target, content, ext)
+
+        manifest[relative_path] = hashed_path
+
+    with open(os.path.join(dist_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def _rewrite_css_urls(content, css_path, manifest):
+    css_dir = posixpath.dirname(css_path)
+
+    def replace(match):
+        quote, url = match.group(1), match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+
+        # Keep ?query / #fragment suffixes (e.g. font ?#iefix hacks)
+        split = min([i for i in (url.find('?'), url.find('#')) if i >= 0], default=len(url))
+        path, suffix = url[:split], url[split:]
+
+        target = posixpath.normpath(posixpath.join(css_dir, path))
+        if target not in manifest:
+            return match.group(0)
+
+        hashed = posixpath.relpath(manifest[target], css_dir or '.')
+        return f"url({quote}{hashed}{suffix}{quote})"
+
+    return CSS_URL_PATTERN.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def _write_compressed_variants(target, content, ext):
+    if ext not in COMPRESSIBLE_EXTENSIONS or len(content) < MIN_COMPRESS_BYTES:
+        return
+
+    # mtime=0 keeps the gzip output byte-identical between builds
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(content):
+            with open(target + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def load_manifest(static_folder):
+    manifest_path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_app(app):
+    """Resolve static URLs through the manifest and serve hashed assets"""
+    manifest = load_manifest(app.static_folder)
+    dist_folder = os.path.join(app.static_folder, DIST_DIR)
+    app.config['ASSET_MANIFEST'] = manifest
+
+    # Vendored files this checkout doesn't have (no build, no --vendor yet)
+    cdn_fallback = {
+        relative_path: url for relative_path, url in VENDOR_ASSETS.items()
+        if relative_path not in manifest and not os.path.isfile(os.path.join(app.static_folder, relative_path))
+    }
+
+    def asset_url(filename):
+        """url_for('static') for a vendored asset, or its CDN URL when it isn't vendored"""
+        if filename in cdn_fallback:
+            return cdn_fallback[filename]
+        return url_for('static', filename=filename)
+
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = f"{DIST_DIR}/{manifest[values['filename']]}"
+
+    @app.route(f"{app.static_url_path}/{DIST_DIR}/<path:filename>")
+    def dist_asset(filename):
+        """Serve a fingerprinted asset, precompressed when the client allows"""
+        path = safe_join(dist_folder, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[name] > 0 and os.path.isfile(path + suffix):
+                path, encoding = path + suffix, name
+                break
+
+        response = send_file(path, mimetype=mimetype, conditional=True, max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return manifest
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print("Usage: python static_assets.py build [--vendor] [static_folder]")
+        sys.exit(1)
+
+    args = [arg for arg in sys.argv[2:] if not arg.startswith('--')]
+    static_folder = args[0] if args else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+    if '--vendor' in sys.argv:
+        count = vendor_assets(static_folder)
+        print(f"Vendored {count} new asset(s)")
+
+    manifest = build_assets(static_folder)
+    print(f"Built {len(manifest)} fingerprinted asset(s) into {os.path.join(static_folder, DIST_DIR)}")
@@ -0,0 +1,244 @@
+# Synthetic school data
+#
+# Builds a reproducible school of configurable size: teachers, classes of
+# students, a timetable of completed sessions over N school days, card
+# scans with realistic attendance and lateness, and one camera log per
+# session. The same seed always produces the same database, so benchmark
+# runs on different machines or commits compare like with like.
+#
+# Usage: python synthetic_data.py --scale 100k --db school_100k.db
+#        python synthetic_data.py --students 600 --days 180 --db school.db
+
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import time
+import uuid
+
+import numpy as np
+
+from fingerprint_index import encode_template, simulated_template
+from http_middleware import VERSIONED_TABLES, create_data_version
+from rollups import rebuild_rollups
+from script import create_database
+
+# Presets sized to roughly 1k, 100k and 10M attendance rows
+SCALES = {
+    '1k': {'students': 30, 'days': 7},
+    '100k': {'students': 300, 'days': 72},
+    '10m': {'students': 2400, 'days': 900},
+}
+
+DEFAULT_SEED = 42
+DEFAULT_END_DATE = datetime.date(2025, 6, 27)
+
+CLASS_SIZE = 30
+PERIODS_PER_DAY = 5
+FIRST_PERIOD = datetime.time(8, 0)
+PERIOD_MINUTES = 60
+SESSION_MINUTES = 50
+
+SUBJECTS = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'English',
+            'History', 'Geography', 'Computer Science']
+
+FIRST_NAMES = ['Alice', 'Bob', 'Charlie', 'Diana', 'Ethan', 'Fatima', 'George', 'Hana',
+               'Ivan', 'Julia', 'Kofi', 'Leila', 'Mateo', 'Nina', 'Omar', 'Priya',
+               'Quinn', 'Rosa', 'Sami', 'Tara', 'Umar', 'Vera', 'Wei', 'Yusuf', 'Zoe']
+LAST_NAMES = ['Brown', 'Wilson', 'Davis', 'Miller', 'Garcia', 'Khan', 'Nguyen', 'Okafor',
+              'Patel', 'Rossi', 'Schmidt', 'Silva', 'Tanaka', 'Novak', 'Haddad', 'Smith']
+
+# Students scan ~2 minutes before the bell on average; a few arrive late
+SCAN_OFFSET_MEAN_SECONDS = -120
+SCAN_OFFSET_STD_SECONDS = 90
+LATE_PROBABILITY = 0.06
+LATE_MEAN_SECONDS = 600
+
+# Per-student attendance rates ~ Beta(18, 1.5), i.e. about 92% on average
+ATTENDANCE_BETA = (18.0, 1.5)
+CAMERA_VERIFIED_PROBABILITY = 0.7
+
+# Days per transaction while loading
+COMMIT_EVERY_DAYS = 20
+
+
+def class_names(count):
+    """Class names like 6A..6L, 7A..; one class for every CLASS_SIZE students"""
+    letters = 'ABCDEFGHIJKL'
+    return [f"{6 + i // len(letters)}{letters[i % len(letters)]}" for i in range(count)]
+
+
+def school_days(days, end_date):
+    """The last `days` weekdays up to and including end_date, oldest first"""
+    result = []
+    day = end_date
+    while len(result) < days:
+        if day.weekday() < 5:
+            result.append(day)
+        day -= datetime.timedelta(days=1)
+    return result[::-1]
+
+
+def _timestamps(values, unit='us'):
+    """datetime64 array -> strings in sqlite3's default datetime format"""
+    return np.char.replace(np.datetime_as_string(values, unit=unit), 'T', ' ').tolist()
+
+
+def generate_school(db_path, students=300, days=72, seed=DEFAULT_SEED, end_date=DEFAULT_END_DATE,
+                    progress=None):
+    """Create db_path and fill it with a synthetic school; returns row counts"""
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists")
+
+    start_clock = time.perf_counter()
+    py_rng = random.Random(seed)
+    rng = np.random.default_rng(seed)
+
+    create_database(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA synchronous = OFF")
+
+    # The data_version triggers would fire once per generated row; recreated below
+    for table in VERSIONED_TABLES:
+        for action in ('insert', 'update', 'delete'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS bump_data_version_{table}_{action}")
+
+    n_classes = max(1, -(-students // CLASS_SIZE))
+    classes = class_names(n_classes)
+    n_teachers = max(2, n_classes * PERIODS_PER_DAY // 4)
+
+    teacher_ids = [f"T{i:04d}" for i in range(1, n_teachers + 1)]
+    cursor.executemany(
+        "INSERT INTO teachers (teacher_id, name, fingerprint_template) VALUES (?, ?, ?)",
+        [(teacher_id, f"{py_rng.choice(FIRST_NAMES)} {py_rng.choice(LAST_NAMES)}",
+          encode_template(simulated_template(teacher_id)))
+         for teacher_id in teacher_ids]
+    )
+
+    student_ids = np.array([f"S{i:06d}" for i in range(1, students + 1)])
+    student_class = np.arange(students) % n_classes
+    cursor.executemany(
+        "INSERT INTO students (student_id, name, card_id, class_name) VALUES (?, ?, ?, ?)",
+        [(student_id, f"{py_rng.choice(FIRST_NAMES)} {py_rng.choice(LAST_NAMES)}",
+          f"CARD{i:06d}", classes[student_class[i - 1]])
+         for i, student_id in enumerate(student_ids.tolist(), start=1)]
+    )
+    attendance_rate = rng.beta(*ATTENDANCE_BETA, size=students)
+
+    period_offsets = np.array([
+        (FIRST_PERIOD.hour * 60 + FIRST_PERIOD.minute + p * PERIOD_MINUTES) * 60_000_000
+        for p in range(PERIODS_PER_DAY)
+    ], dtype='timedelta64[us]')
+
+    counts = {'teachers': n_teachers, 'students': students, 'sessions': 0,
+              'attendance': 0, 'camera_logs': 0}
+
+    dates = school_days(days, end_date)
+    for day_index, day in enumerate(dates):
+        # Sessions for this day, indexed [class, period]
+        starts = np.datetime64(day, 'us') + period_offsets[None, :] + \
+            (rng.integers(0, 180, size=(n_classes, PERIODS_PER_DAY)) * 1_000_000).astype('timedelta64[us]')
+        session_ids = np.array([str(uuid.UUID(int=py_rng.getrandbits(128), version=4))
+                                for _ in range(n_classes * PERIODS_PER_DAY)]).reshape(n_classes, PERIODS_PER_DAY)
+        start_strings = np.array(_timestamps(starts.ravel(), 's')).reshape(starts.shape)
+        end_strings = np.array(_timestamps(
+            (starts + np.timedelta64(SESSION_MINUTES * 60, 's')).ravel(), 's')).reshape(starts.shape)
+
+        session_rows = []
+        for c in range(n_classes):
+            for p in range(PERIODS_PER_DAY):
+                subject = SUBJECTS[(c + p + day.weekday()) % len(SUBJECTS)]
+                teacher = teacher_ids[(c * PERIODS_PER_DAY + p + day.weekday()) % n_teachers]
+                session_rows.append((session_ids[c, p], teacher, classes[c], subject,
+                                     start_strings[c, p], end_strings[c, p], start_strings[c, p]))
+        cursor.executemany(
+            "INSERT INTO sessions (session_id, teacher_id, class_name, subject, start_time, end_time, "
+            "status, created_at) VALUES (?, ?, ?, ?, ?, ?, 'completed', ?)",
+            session_rows
+        )
+
+        # Who turned up to each period, and when they scanned in
+        present = rng.random((PERIODS_PER_DAY, students)) < attendance_rate[None, :]
+        period_idx, student_idx = np.nonzero(present)
+        offsets = rng.normal(SCAN_OFFSET_MEAN_SECONDS, SCAN_OFFSET_STD_SECONDS, size=period_idx.size)
+        late = rng.random(period_idx.size) < LATE_PROBABILITY
+        offsets[late] = rng.exponential(LATE_MEAN_SECONDS, size=int(late.sum()))
+        row_class = student_class[student_idx]
+        scan_times = starts[row_class, period_idx] + (offsets * 1_000_000).astype('timedelta64[us]')
+        verified = rng.random(period_idx.size) < CAMERA_VERIFIED_PROBABILITY
+
+        # Chronological insert order, like live scans
+        order = np.lexsort((scan_times, period_idx))
+        cursor.executemany(
+            "INSERT INTO attendance (session_id, student_id, card_scan_time, verified_by_camera) "
+            "VALUES (?, ?, ?, ?)",
+            zip(session_ids[row_class[order], period_idx[order]].tolist(),
+                student_ids[student_idx[order]].tolist(),
+                _timestamps(scan_times[order]),
+                verified[order].tolist())
+        )
+
+        # One camera check per session, ten minutes in
+        scanned = np.bincount(row_class * PERIODS_PER_DAY + period_idx,
+                              minlength=n_classes * PERIODS_PER_DAY)
+        detected = np.clip(scanned + rng.integers(-2, 3, size=scanned.size), 0, None)
+        camera_times = _timestamps((starts + np.timedelta64(10, 'm')).ravel(), 's')
+        cursor.executemany(
+            "INSERT INTO camera_logs (session_id, detected_count, card_scan_count, timestamp) "
+            "VALUES (?, ?, ?, ?)",
+            zip(session_ids.ravel().tolist(), detected.tolist(), scanned.tolist(), camera_times)
+        )
+
+        counts['sessions'] += len(session_rows)
+        counts['attendance'] += int(period_idx.size)
+        counts['camera_logs'] += int(scanned.size)
+
+        if (day_index + 1) % COMMIT_EVERY_DAYS == 0:
+            conn.commit()
+            if progress:
+                progress(day_index + 1, len(dates), counts)
+
+    create_data_version(cursor)
+    conn.commit()
+    conn.close()
+
+    rebuild_rollups(db_path)
+
+    counts['seconds'] = round(time.perf_counter() - start_clock, 2)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic school database")
+    parser.add_argument('--db', required=True, help="Database file to create")
+    parser.add_argument('--scale', choices=sorted(SCALES), help="Preset size (attendance rows)")
+    parser.add_argument('--students', type=int, help="Number of students")
+    parser.add_argument('--days', type=int, help="School days of sessions")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--end-date', type=datetime.date.fromisoformat, default=DEFAULT_END_DATE,
+                        help="Last school day (YYYY-MM-DD)")
+    parser.add_argument('--force', action='store_true', help="Replace an existing database")
+    args = parser.parse_args()
+
+    size = dict(SCALES[args.scale]) if args.scale else dict(SCALES['100k'])
+    if args.students:
+        size['students'] = args.students
+    if args.days:
+        size['days'] = args.days
+
+    if args.force and os.path.exists(args.db):
+        os.remove(args.db)
+
+    def progress(done, total, counts):
+        print(f"  {done}/{total} days, {counts['attendance']:,} attendance rows")
+
+    counts = generate_school(args.db, size['students'], size['days'], args.seed, args.end_date, progress)
+    print(f"Created {args.db}: {counts['teachers']} teachers, {counts['students']} students, "
+          f"{counts['sessions']:,} sessions, {counts['attendance']:,} attendance rows, "
+          f"{counts['camera_logs']:,} camera logs in {counts['seconds']}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import datetime
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from script import create_database  # noqa: E402
+
+# 10A: S001-S003, 10B: S004
+STUDENTS = [
+    ('S001', 'Alice Brown', 'CARD001', '10A'),
+    ('S002', 'Bob Wilson', 'CARD002', '10A'),
+    ('S003', 'Charlie Davis', 'CARD003', '10A'),
+    ('S004', 'Diana Miller', 'CARD004', '10B'),
+]
+
+
+def seed_database(path):
+    """Create a database with two teachers and four students"""
+    create_database(path)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO teachers (teacher_id, name) VALUES (?, ?)",
+                     [('T001', 'Dr. Smith'), ('T002', 'Prof. Johnson')])
+    conn.executemany("INSERT INTO students (student_id, name, card_id, class_name) VALUES (?, ?, ?, ?)",
+                     STUDENTS)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A fresh database with two teachers and four students"""
+    return seed_database(str(tmp_path / 'attendance.db'))
+
+
+def add_session(conn, session_id, class_name='10A', subject='Mathematics', start=None,
+                status='active', teacher_id='T001'):
+    start = start or datetime.datetime(2025, 3, 3, 9, 0)
+    conn.execute("INSERT INTO sessions (session_id, teacher_id, class_name, subject, start_time, status) "
+                 "VALUES (?, ?, ?, ?, ?, ?)", (session_id, teacher_id, class_name, subject, start, status))
+
+
+def add_scan(conn, session_id, student_id, when):
+    conn.execute("INSERT INTO attendance (session_id, student_id, card_scan_time) VALUES (?, ?, ?)",
+                 (session_id, student_id, when))
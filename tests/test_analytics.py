@@ -0,0 +1,110 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from analytics import AttendanceAnalytics
+from conftest import add_scan, add_session
+
+START = datetime.datetime(2025, 3, 3, 9, 0)
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    add_session(conn, 'math-1', start=START, status='completed')
+    add_session(conn, 'math-2', start=START + datetime.timedelta(days=7), status='completed')
+    add_scan(conn, 'math-1', 'S001', START + datetime.timedelta(minutes=2))
+    add_scan(conn, 'math-1', 'S002', START + datetime.timedelta(minutes=12))  # late
+    add_scan(conn, 'math-2', 'S001', START + datetime.timedelta(days=7, minutes=1))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def by_student(result):
+    return {row['student_id']: row for row in result['students']}
+
+
+def test_compute_rates_and_lateness(db_path, conn):
+    result = AttendanceAnalytics(db_path).compute()
+    students = by_student(result)
+
+    assert result['summary']['sessions'] == 2
+    assert result['summary']['attendance_records'] == 3
+    assert students['S001']['sessions_held'] == 2
+    assert students['S001']['attendance_rate'] == 1.0
+    assert students['S002']['late_arrivals'] == 1
+    assert students['S003']['sessions_attended'] == 0
+    assert students['S004']['sessions_held'] == 0
+    assert sum(result['lateness_distribution']['counts']) == 3
+
+
+def test_compute_restricts_to_term(db_path, conn):
+    result = AttendanceAnalytics(db_path).compute('2025-03-01', '2025-03-08')
+    students = by_student(result)
+
+    assert result['summary']['sessions'] == 1
+    assert students['S001']['sessions_attended'] == 1
+    assert students['S001']['sessions_held'] == 1
+
+
+def test_incremental_refresh_picks_up_new_scans(db_path, conn):
+    analytics = AttendanceAnalytics(db_path)
+    analytics.compute()
+    add_scan(conn, 'math-2', 'S002', START + datetime.timedelta(days=7, minutes=3))
+    conn.commit()
+
+    assert by_student(analytics.compute())['S002']['sessions_attended'] == 2
+
+
+def test_scans_of_deleted_rows_are_dropped(db_path, conn):
+    analytics = AttendanceAnalytics(db_path)
+    analytics.compute()  # caches the scans of math-1
+    conn.execute("DELETE FROM attendance WHERE session_id = 'math-1'")
+    conn.execute("DELETE FROM sessions WHERE session_id = 'math-1'")
+    conn.commit()
+
+    result = analytics.compute('2025-03-01', '2025-04-01')
+    students = by_student(result)
+    assert result['summary']['sessions'] == 1
+    assert students['S001']['sessions_attended'] == 1
+    assert students['S002']['sessions_attended'] == 0
+
+
+def test_session_added_during_load_is_not_half_seen(db_path, conn):
+    conn.execute("PRAGMA journal_mode = WAL")
+    analytics = AttendanceAnalytics(db_path)
+    refresh = analytics._refresh_attendance
+
+    def refresh_after_a_new_session(cursor):
+        # A session and its scan land between the sessions query and the scans query
+        writer = sqlite3.connect(db_path)
+        add_session(writer, 'math-3', start=START + datetime.timedelta(days=14))
+        add_scan(writer, 'math-3', 'S003', START + datetime.timedelta(days=14, minutes=1))
+        writer.commit()
+        writer.close()
+        refresh(cursor)
+
+    analytics._refresh_attendance = refresh_after_a_new_session
+    result = analytics.compute('2025-03-01', '2025-03-08')
+    assert result['summary']['sessions'] == 1
+
+    analytics._refresh_attendance = refresh
+    assert by_student(analytics.compute())['S003']['sessions_attended'] == 1
+
+
+def test_scans_into_another_class_are_visits(db_path, conn):
+    add_session(conn, 'bio-1', class_name='10B', subject='Biology', start=START, status='completed')
+    add_scan(conn, 'bio-1', 'S001', START + datetime.timedelta(minutes=1))
+    conn.commit()
+
+    result = AttendanceAnalytics(db_path).compute('2025-03-01', '2025-03-08')
+    alice = by_student(result)['S001']
+    assert (alice['sessions_held'], alice['sessions_attended'], alice['visits']) == (1, 1, 1)
+    assert alice['attendance_rate'] == 1.0
+    assert result['summary']['visitor_scans'] == 1
+
+    trends = {trend['class_name']: trend['attendance_rate'] for trend in result['classes']}
+    assert trends['10B'] == [0.0]
+    assert trends['10A'] == [round(2 / 3, 4)]
@@ -0,0 +1,49 @@
+import importlib
+
+import pytest
+
+
+def app_client(db_path, monkeypatch):
+    monkeypatch.setenv('ATTENDANCE_DB', db_path)
+    import app
+    app = importlib.reload(app)
+    return app.app.test_client()
+
+
+@pytest.fixture
+def client(db_path, monkeypatch):
+    return app_client(db_path, monkeypatch)
+
+
+@pytest.mark.parametrize('query', ['start=garbage', 'end=2025-13-45', 'start=2025-01-01&end=soon'])
+def test_analytics_rejects_bad_dates(client, query):
+    response = client.get(f'/api/analytics?{query}')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_analytics_accepts_dates(client):
+    response = client.get('/api/analytics?start=2025-01-01&end=2025-04-01')
+    assert response.status_code == 200
+    assert response.get_json()['term'] == {'start': '2025-01-01', 'end': '2025-04-01'}
+
+
+def test_scan_batch_with_bad_event_is_not_a_server_error(client):
+    response = client.post('/api/scans', json=[
+        {'event_id': 'e1', 'reader_id': 'R1', 'card_id': ['CARD001'], 'session_id': 'math-1'},
+        {'event_id': 'e2', 'reader_id': 'R1', 'card_id': 'CARD001', 'session_id': {}},
+    ])
+    assert response.status_code == 200
+    assert [r['success'] for r in response.get_json()['results']] == [False, False]
+
+
+def test_compression_stats_are_off_by_default(client):
+    assert client.get('/debug/compression').status_code == 404
+
+
+def test_compression_stats_when_enabled(db_path, monkeypatch):
+    monkeypatch.setenv('ATTENDANCE_COMPRESSION_STATS', '1')
+    client = app_client(db_path, monkeypatch)
+    client.get('/api/analytics')
+
+    assert '/api/analytics' in client.get('/debug/compression').get_json()
@@ -0,0 +1,72 @@
+import sqlite3
+import time
+
+import card_reader_service
+from card_reader_service import ScanEventWriter
+from conftest import add_session
+
+
+class FakeService:
+    """Hands the writer a fixed list of events, one batch at a time"""
+
+    reader_id = 'R1'
+    running = False
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+
+    @property
+    def backlog(self):
+        return len(self.batches)
+
+    def get_batch(self, size, timeout=None):
+        return self.batches.pop(0) if self.batches else []
+
+
+def event(i, card_id='CARD001'):
+    return {'event_id': f"R1:{i}", 'reader_id': 'R1', 'card_id': card_id, 'scanned_at': time.time()}
+
+
+def run_writer(db_path, service, **options):
+    results = []
+    writer = ScanEventWriter(service, db_path, session_for=lambda e: 'math-1',
+                             on_result=lambda e, r: results.append(r), **options)
+    writer.start()
+    started = time.monotonic()
+    writer.stop(timeout=5)
+    return writer, results, time.monotonic() - started
+
+
+def test_permanent_error_fails_the_batch_and_moves_on(tmp_path):
+    db_path = str(tmp_path / 'empty.db')  # no sessions table: every batch fails
+    writer, results, elapsed = run_writer(db_path, FakeService([event(1)], [event(2, 'CARD002')]))
+
+    assert elapsed < 2
+    assert not writer._thread.is_alive()
+    assert [r['success'] for r in results] == [False, False]
+    assert results[0]['message'].startswith('Write failed: no such table')
+    assert writer.stats['write_errors'] == 2 and writer.stats['retries'] == 0
+
+
+def test_locked_database_is_retried(db_path, monkeypatch):
+    conn = sqlite3.connect(db_path)
+    add_session(conn, 'math-1')
+    conn.commit()
+    conn.close()
+
+    apply = card_reader_service.apply_scan_batch
+    calls = []
+
+    def locked_once(conn, events):
+        calls.append(len(events))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return apply(conn, events)
+
+    monkeypatch.setattr(card_reader_service, 'apply_scan_batch', locked_once)
+    monkeypatch.setattr(card_reader_service, 'RETRY_DELAY_SECONDS', 0.01)
+    writer, results, _ = run_writer(db_path, FakeService([event(1), event(2, 'CARD002')]))
+
+    assert calls == [2, 2]
+    assert [r['success'] for r in results] == [True, True]
+    assert writer.stats['retries'] == 1 and writer.stats['write_errors'] == 0
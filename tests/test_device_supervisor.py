@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+import device_supervisor
+from device_supervisor import FAILED, READY, DeviceSupervisor
+
+
+@pytest.fixture(autouse=True)
+def fast_ticks(monkeypatch):
+    monkeypatch.setattr(device_supervisor, 'TICK_SECONDS', 0.01)
+    # No jitter: each retry waits the full backoff delay
+    monkeypatch.setattr(device_supervisor.random, 'uniform', lambda low, high: high)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def slow_connect(seconds, result=True):
+    def connect():
+        time.sleep(seconds)
+        return result
+    return connect
+
+
+def test_devices_connect_concurrently():
+    supervisor = DeviceSupervisor('10A')
+    for device in ('fingerprint', 'card_reader', 'camera'):
+        supervisor.add(device, slow_connect(0.2))
+
+    started = time.monotonic()
+    assert supervisor.connect_all()
+    assert time.monotonic() - started < 0.4  # the slowest device, not the sum
+    assert {name: status['state'] for name, status in supervisor.status().items()} == \
+        {'fingerprint': READY, 'card_reader': READY, 'camera': READY}
+
+
+def test_a_hung_device_times_out_without_holding_the_others():
+    release = threading.Event()
+    supervisor = DeviceSupervisor('10A', retry_base=60)
+    supervisor.add('card_reader', slow_connect(0))
+    supervisor.add('camera', lambda: release.wait(5) and False, timeout=0.1)
+
+    started = time.monotonic()
+    assert not supervisor.connect_all()
+    assert time.monotonic() - started < 0.5
+    assert supervisor.ready('card_reader') and supervisor.missing() == ['camera']
+    status = supervisor.status()['camera']
+    assert status['state'] == FAILED and status['error'] == 'no response after 0.1s'
+    assert 59 < status['retry_in'] <= 60
+
+    # The blocked attempt finally gives up: its reason replaces the timeout
+    release.set()
+    assert wait_for(lambda: supervisor.status()['camera']['error'] == 'not available')
+
+
+def test_failed_device_is_retried_with_backoff():
+    attempts = []
+
+    def connect():
+        attempts.append(time.monotonic())
+        return len(attempts) > 3
+
+    changes = []
+    supervisor = DeviceSupervisor('10A', retry_base=0.05, retry_max=0.1,
+                                  on_change=lambda *change: changes.append(change))
+    supervisor.add('camera', connect)
+    assert not supervisor.connect_all()
+    supervisor.start()
+    try:
+        assert wait_for(lambda: supervisor.ready('camera'))
+    finally:
+        supervisor.stop()
+
+    gaps = [later - earlier for earlier, later in zip(attempts, attempts[1:])]
+    # 0.05 s, doubled to 0.1 s, then capped at retry_max
+    assert gaps[0] >= 0.05 and gaps[1] >= 0.1 and gaps[2] >= 0.1
+    assert gaps[1] > gaps[0] * 1.5
+    assert supervisor.status()['camera']['attempts'] == 4
+    assert changes == [('camera', READY, None)]
+
+
+def test_unhealthy_device_is_reconnected():
+    healthy = threading.Event()
+    healthy.set()
+    connects = []
+    changes = []
+    supervisor = DeviceSupervisor('10A', health_interval=0.02,
+                                  on_change=lambda *change: changes.append(change))
+    supervisor.add('camera', lambda: connects.append(1) or True, check=healthy.is_set)
+    assert supervisor.connect_all()
+    supervisor.start()
+    try:
+        healthy.clear()  # camera unplugged mid-lesson
+        assert wait_for(lambda: changes[-1:] == [('camera', FAILED, 'health check failed')])
+        healthy.set()
+        assert wait_for(lambda: supervisor.ready('camera'))
+    finally:
+        supervisor.stop()
+
+    assert len(connects) == 2
+    assert changes == [('camera', READY, None), ('camera', FAILED, 'health check failed'),
+                       ('camera', READY, None)]
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from device_trace import MAX_SPEED, ReplayClock, ReplayDevices, Trace, _EventCursor, synthesize_day, write_trace
+
+CARDS = ['CARD001', 'CARD002', 'CARD003']
+
+
+class FakeSessionManager:
+    """Starts and ends sessions on fingerprints, as AttendanceSessionManager does"""
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.session_active = False
+        self.present = set()
+
+    def _verify_teacher(self):
+        probe = self.devices.fingerprint_scanner.capture()
+        return probe is not None
+
+    def start_attendance_session(self, class_name, subject):
+        if not self._verify_teacher():
+            return False, "No fingerprint"
+        self.session_active = True
+        self.present = set()
+        return True, "Session started"
+
+    def end_attendance_session(self):
+        self._verify_teacher()
+        self.session_active = False
+        return True, "Session ended"
+
+    def mark_student(self, card_id):
+        assert card_id in CARDS
+        if card_id in self.present:
+            return False, "Already marked present"
+        self.present.add(card_id)
+        return True, "Attendance marked"
+
+    def perform_camera_verification(self):
+        result = self.devices.camera_system.detect()
+        return result is not None, result
+
+
+def expected_stats(events):
+    stats = {'sessions': 0, 'scans': 0, 'marked': 0, 'verifications': 0}
+    active, present = False, set()
+    for event in events:
+        if event['device'] == 'fingerprint':
+            stats['sessions'] += not active
+            active, present = not active, set()
+        elif active and event['device'] == 'card':
+            stats['scans'] += 1
+            stats['marked'] += event['card_id'] not in present
+            present.add(event['card_id'])
+        elif active:
+            stats['verifications'] += 1
+    return stats
+
+
+def test_synthesized_day_replays_at_max_speed(tmp_path):
+    events = synthesize_day(['T001', 'T002'], CARDS, periods=3, bounce_probability=0.5, seed=7)
+    path = str(tmp_path / 'day.jsonl')
+    write_trace(path, events, class_name='10A')
+
+    trace = Trace.load(path)
+    assert trace.header['class_name'] == '10A' and trace.events == events
+    devices = ReplayDevices(trace, speed=MAX_SPEED)
+    # As HardwareManager.initialize_hardware would
+    devices.card_reader.connect()
+    devices.camera_system.connect()
+    devices.camera_system.load_detection_model()
+
+    stats = devices.drive(FakeSessionManager(devices), '10A')
+
+    expected = expected_stats(events)
+    assert expected['sessions'] == 3 and expected['scans'] > expected['marked'] > 0
+    assert {key: stats[key] for key in expected} == expected
+    assert stats['events'] == len(events) and stats['ignored'] == 0
+    assert stats['trace_seconds'] == trace.duration > 3 * 45 * 60
+    assert stats['seconds'] < 5 and stats['speedup'] > 1000
+
+
+def test_waiting_cursor_returns_when_the_clock_stops():
+    clock = ReplayClock(speed=1.0)
+    cursor = _EventCursor([{'t': 3600.0, 'device': 'card', 'card_id': 'CARD001'}], clock)
+    results = []
+    reader = threading.Thread(target=lambda: results.append(cursor.next(timeout=10)))
+
+    started = time.monotonic()
+    reader.start()
+    time.sleep(0.05)
+    # The waiting reader doesn't hold the cursor's lock
+    assert cursor._lock.acquire(timeout=0.1)
+    cursor._lock.release()
+    clock.stop()
+    reader.join(2)
+
+    assert results == [None] and time.monotonic() - started < 1
+    assert cursor.position == 0
@@ -0,0 +1,88 @@
+import importlib
+import os
+import threading
+import time
+
+import pytest
+
+from conftest import seed_database
+from device_worker import DeviceBusy, DeviceWorker
+
+
+@pytest.fixture(scope='module')
+def script_2(tmp_path_factory):
+    """The hardware notebook module; its demo cell needs a database in the working directory"""
+    workdir = tmp_path_factory.mktemp('notebook')
+    seed_database(str(workdir / 'attendance_system.db'))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        return importlib.import_module('script_2')
+    finally:
+        os.chdir(cwd)
+
+
+class HangingHardware:
+    """Fingerprint and camera calls that block until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def verify_teacher(self, fingerprint_data=None):
+        self.calls.append('verify_teacher')
+        self.release.wait(5)
+        return True, 'T001'
+
+    def capture_verification(self):
+        self.calls.append('capture_verification')
+        self.release.wait(5)
+        return 12, None
+
+    def shutdown(self):
+        pass
+
+
+def test_call_times_out_and_a_full_queue_is_busy():
+    worker = DeviceWorker('10A/camera', queue_size=1).start()
+    release = threading.Event()
+    try:
+        with pytest.raises(TimeoutError):
+            worker.call(release.wait, 5, timeout=0.05)  # still running on the device thread
+        worker.submit(time.sleep, 0)  # queued behind it
+        with pytest.raises(DeviceBusy):
+            worker.submit(time.sleep, 0)
+    finally:
+        release.set()
+        worker.stop()
+    assert worker.stats == {'processed': 2, 'errors': 0}
+
+
+def test_errors_reach_the_caller():
+    worker = DeviceWorker('10A/fingerprint').start()
+    with pytest.raises(ZeroDivisionError):
+        worker.call(lambda: 1 / 0, timeout=1)
+    assert worker.call(lambda: 'ok', timeout=1) == 'ok'
+    worker.stop()
+    assert worker.stats == {'processed': 1, 'errors': 1}
+
+
+def test_hung_device_reads_as_unavailable(script_2):
+    hardware = HangingHardware()
+    devices = script_2.ClassroomDevices('10A', hardware, timeout=0.1)
+    devices.fingerprint_worker = DeviceWorker('10A/fingerprint', queue_size=1)
+    devices.start()
+    try:
+        started = time.monotonic()
+        assert devices.verify_teacher(b'probe') == (False, None)
+        assert devices.capture_verification() == (None, None)
+        assert time.monotonic() - started < 1
+
+        # One call still hangs on the scanner and one waits behind it: the queue is full
+        devices.fingerprint_worker.submit(hardware.verify_teacher)
+        assert devices.verify_teacher(b'probe') == (False, None)
+    finally:
+        hardware.release.set()
+        devices.stop()
+    # The timed-out call and the queued one ran; the busy one never reached the device
+    assert hardware.calls == ['verify_teacher', 'capture_verification', 'verify_teacher']
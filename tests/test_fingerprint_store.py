@@ -0,0 +1,67 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from fingerprint_index import FingerprintIndex, encode_template, simulated_template
+from fingerprint_store import TemplateStore
+
+
+def enroll(db_path, teacher_id, enrolled=True):
+    conn = sqlite3.connect(db_path)
+    template = encode_template(simulated_template(teacher_id)) if enrolled else None
+    conn.execute("INSERT INTO teachers (teacher_id, name, fingerprint_template) VALUES (?, ?, ?) "
+                 "ON CONFLICT (teacher_id) DO UPDATE SET fingerprint_template = excluded.fingerprint_template",
+                 (teacher_id, teacher_id, template))
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def store(db_path, tmp_path):
+    for teacher_id in ('T001', 'T002', 'T003'):
+        enroll(db_path, teacher_id)
+    return TemplateStore(db_path, str(tmp_path / 'templates.npy'))
+
+
+def identify(index, teacher_id):
+    return index.identify(simulated_template(teacher_id))[0]
+
+
+def test_warm_start_maps_the_saved_file(store):
+    store.load(FingerprintIndex())
+    index = FingerprintIndex()
+
+    assert store.load(index) == 3
+    assert not index.snapshot()[0].flags.writeable  # memory-mapped, not rebuilt
+    assert identify(index, 'T002') == 'T002'
+
+
+def test_crash_between_file_replacements_rebuilds(store, db_path, tmp_path):
+    index = FingerprintIndex()
+    store.load(index)
+    shutil.copy(store.meta_path, tmp_path / 'old.json')
+
+    # Same number of rows afterwards, but in a different order
+    enroll(db_path, 'T001', enrolled=False)
+    enroll(db_path, 'T004')
+    store.refresh(index)
+    # Crash after the matrix was replaced but before the sidecar was
+    shutil.copy(tmp_path / 'old.json', store.meta_path)
+
+    rebooted = FingerprintIndex()
+    TemplateStore(store.db_path, store.template_path).load(rebooted)
+    assert sorted(rebooted.teacher_ids()) == ['T002', 'T003', 'T004']
+    for teacher_id in ('T002', 'T003', 'T004'):
+        assert identify(rebooted, teacher_id) == teacher_id
+
+
+def test_write_failure_is_left_for_the_caller(store, tmp_path):
+    store.template_path = str(tmp_path / 'missing' / 'templates.npy')
+    store.meta_path = str(tmp_path / 'missing' / 'templates.json')
+    index = FingerprintIndex()
+
+    assert store.load(index) == 3
+    assert 'Could not write template file' in store.save_error
+    assert not os.path.exists(store.template_path)
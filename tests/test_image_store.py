@@ -0,0 +1,77 @@
+import threading
+
+import cv2
+import numpy as np
+
+import image_store
+from image_store import ImageStore, is_image_key
+
+
+def frame(value=0):
+    image = np.zeros((720, 1280, 3), dtype=np.uint8)
+    image[:, :, 1] = value
+    return image
+
+
+def gate_writes(monkeypatch):
+    """Hold the background writer until the returned event is set"""
+    release = threading.Event()
+    write_jpeg = image_store._write_jpeg
+
+    def gated_write(path, image, quality):
+        release.wait(5)
+        write_jpeg(path, image, quality)
+
+    monkeypatch.setattr(image_store, '_write_jpeg', gated_write)
+    return release
+
+
+def test_same_frame_is_stored_once(tmp_path, monkeypatch):
+    release = gate_writes(monkeypatch)
+    store = ImageStore(str(tmp_path))
+    key = store.save(frame(10))
+    # Still being written: not queued a second time
+    assert store.save(frame(10)) == key and is_image_key(key)
+    release.set()
+    assert store.flush(5)
+    assert store.stats == {'saved': 1, 'deduplicated': 0, 'errors': 0}
+
+    # Saved again once the first write is done: found on disk, not rewritten
+    assert store.save(frame(10)) == key
+    assert store.flush(5)
+    assert store.stats == {'saved': 1, 'deduplicated': 1, 'errors': 0}
+    assert store.save(frame(20)) != key
+
+
+def test_full_image_and_thumbnail_are_written(tmp_path):
+    store = ImageStore(str(tmp_path), thumbnail_width=320)
+    key = store.save(frame(10))
+    assert store.flush(5) and store.exists(key)
+
+    path = store.path_for(key)
+    assert path.startswith(str(tmp_path / key[:2] / key[3:5]))
+    assert cv2.imread(path).shape == (720, 1280, 3)
+    assert cv2.imread(store.path_for(key, thumbnail=True)).shape == (180, 320, 3)
+
+
+def test_save_returns_before_the_write(tmp_path, monkeypatch):
+    release = gate_writes(monkeypatch)
+    store = ImageStore(str(tmp_path))
+    key = store.save(frame(10))
+
+    assert store.pending(key) and not store.exists(key)
+    assert not store.flush(0.05)
+    release.set()
+    assert store.flush(5) and not store.pending(key) and store.exists(key)
+
+
+def test_write_errors_are_counted_and_cleared(tmp_path, monkeypatch):
+    def broken(path, image, quality):
+        raise ValueError("JPEG encoding failed")
+
+    monkeypatch.setattr(image_store, '_write_jpeg', broken)
+    store = ImageStore(str(tmp_path))
+    key = store.save(frame(10))
+
+    assert store.flush(5) and not store.exists(key)
+    assert store.stats['errors'] == 1
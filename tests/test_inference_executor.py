@@ -0,0 +1,88 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from inference_executor import InferenceBusy, InferenceExecutor
+
+# Pixel (0, 0) tells the fake detector what to do: channel 0 is the person
+# count, channel 1 the detect time in 10 ms steps, channel 2 = 255 kills the worker
+CRASH = 255
+
+
+class FakeDetector:
+    def detect(self, frame):
+        count, delay, action = (int(v) for v in frame[0, 0])
+        if action == CRASH:
+            os._exit(1)  # a worker dying, e.g. killed for using too much memory
+        time.sleep(delay / 100)
+        return [(i, i, 1, 1) for i in range(count)]
+
+
+def fake_detector(model_path, config_path):
+    """Module level, so the worker processes can unpickle it"""
+    return FakeDetector()
+
+
+def frame(count=0, delay=0, action=0):
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+    image[0, 0] = (count, delay, action)
+    return image
+
+
+@pytest.fixture
+def executor():
+    executor = InferenceExecutor(workers=1, max_pending=2, warmup_width=64, factory=fake_detector)
+    yield executor
+    executor.shutdown()
+
+
+def test_boxes_come_back_from_the_worker(executor):
+    assert executor.submit(frame(count=3)).result(30) == [(0, 0, 1, 1), (1, 1, 1, 1), (2, 2, 1, 1)]
+    assert executor.detect(frame(count=1)) == [(0, 0, 1, 1)]
+    assert executor.stats['completed'] == 2 and executor.pending == 0
+
+
+def test_full_executor_is_busy(executor):
+    executor.submit(frame()).result(30)  # workers up
+    running = executor.submit(frame(delay=30))
+    queued = executor.submit(frame(count=1))
+
+    with pytest.raises(InferenceBusy):
+        executor.submit(frame())
+    assert executor.stats['rejected'] == 1
+
+    assert running.result(30) == [] and queued.result(30) == [(0, 0, 1, 1)]
+    # Slots are free again
+    assert executor.submit(frame(count=2)).result(30) == [(0, 0, 1, 1), (1, 1, 1, 1)]
+
+
+def test_cancel_before_start_skips_the_frame(executor):
+    executor.submit(frame()).result(30)
+    running = executor.submit(frame(delay=30))
+    queued = executor.submit(frame(count=5, delay=200))
+
+    assert queued.cancel()
+    assert running.result(30) == []
+    finished = time.monotonic()
+    while executor.pending and time.monotonic() - finished < 10:
+        time.sleep(0.01)
+
+    # The worker saw the cancel flag instead of spending 2 s on the frame
+    assert executor.pending == 0 and time.monotonic() - finished < 1
+    assert queued.cancelled()
+    assert executor.stats['cancelled'] == 1 and executor.stats['completed'] == 2
+
+
+def test_pool_is_replaced_after_a_worker_dies(executor):
+    assert executor.submit(frame(count=1)).result(30) == [(0, 0, 1, 1)]
+
+    with pytest.raises(BrokenProcessPool):
+        executor.submit(frame(action=CRASH)).result(30)
+    assert executor.stats['errors'] == 1
+
+    # The next submit starts a fresh pool
+    assert executor.submit(frame(count=2)).result(30) == [(0, 0, 1, 1), (1, 1, 1, 1)]
+    assert executor.pending == 0
@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+import load_simulator
+
+
+def test_abandoned_batch_counts_every_scan(monkeypatch):
+    monkeypatch.setattr(load_simulator, 'RETRY_BACKOFF_SECONDS', 0)
+    stats = load_simulator._Stats()
+
+    def locked():
+        raise sqlite3.OperationalError('database is locked')
+
+    assert load_simulator._with_retries(locked, stats, max_retries=2, scans=20) is None
+    assert (stats.locked_errors, stats.retries, stats.failures) == (3, 2, 20)
+
+
+def test_other_errors_are_not_retried():
+    def broken():
+        raise sqlite3.OperationalError('no such table: attendance')
+
+    with pytest.raises(sqlite3.OperationalError):
+        load_simulator._with_retries(broken, load_simulator._Stats(), max_retries=2)
+
+
+def test_readers_get_their_classroom_cards(db_path, tmp_path):
+    opened, cards = load_simulator.prepare_database(db_path, str(tmp_path / 'load.db'), 'wal', 2, seed=1)
+
+    assert [class_name for _, class_name in opened] == ['10A', '10B']
+    assert sorted(cards['10A']) == ['CARD001', 'CARD002', 'CARD003']
+    assert cards['10B'] == ['CARD004']
+
+    reader = load_simulator.SimulatedCardReader('R1', cards['10A'], duplicate_rate=0, seed=1)
+    reader.connect()
+    assert sorted(reader.read_card() for _ in range(3)) == ['CARD001', 'CARD002', 'CARD003']
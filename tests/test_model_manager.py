@@ -0,0 +1,71 @@
+import threading
+import time
+
+import numpy as np
+
+import model_manager
+from model_manager import ModelManager
+
+
+class SlowDetector:
+    """Takes a while to load; records the frames it is run on"""
+
+    name = 'slow'
+
+    def __init__(self, model_path, config_path):
+        time.sleep(0.05)
+        self.model_path = model_path
+        self.frames = []
+        self.running = 0
+        self.overlapped = False
+
+    def detect(self, frame):
+        self.running += 1
+        self.overlapped |= self.running > 1
+        time.sleep(0.001)
+        self.frames.append(frame.shape)
+        self.running -= 1
+        return []
+
+
+def test_model_is_loaded_once_and_shared(monkeypatch):
+    loads = []
+
+    def make_detector(model_path=None, config_path=None):
+        loads.append((model_path, config_path))
+        return SlowDetector(model_path, config_path)
+
+    monkeypatch.setattr(model_manager, 'make_detector', make_detector)
+    manager = ModelManager()
+
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(manager.get('ssd.pb', warmup_width=320)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == [('ssd.pb', None)]
+    assert len(models) == 8 and all(model is models[0] for model in models)
+    # Warmed up before anyone got it: two blank inferences at the warmup width
+    assert models[0].detector.frames == [(180, 320, 3)] * 2
+    info = models[0].info()
+    assert info['model'] == 'ssd.pb' and info['warmup_ms'] is not None and not info['inherited']
+
+    assert manager.get() is not models[0] and loads[-1] == (None, None)
+    assert [m['model'] for m in manager.loaded()] == ['ssd.pb', 'hog']
+
+
+def test_shared_model_serializes_detect(monkeypatch):
+    monkeypatch.setattr(model_manager, 'make_detector', lambda *key: SlowDetector(*key))
+    model = ModelManager().get()
+
+    threads = [threading.Thread(target=model.detect, args=(np.zeros((4, 4, 3)),)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(model.detector.frames) == 2 + 8  # after the two warmup inferences
+    assert not model.detector.overlapped
@@ -0,0 +1,84 @@
+import sqlite3
+import time
+
+import numpy as np
+
+from periodic_verifier import VERIFIER_ERRORS, PeriodicVerifier
+
+
+class FlakyCamera:
+    """Fails its first few frame reads and detector runs, then counts `count` people"""
+
+    def __init__(self, frame_failures=2, detect_failures=2, count=3):
+        self.frame_failures = frame_failures
+        self.detect_failures = detect_failures
+        self.count = count
+        self.detections = 0
+
+    def latest_frame(self):
+        if self.frame_failures:
+            self.frame_failures -= 1
+            raise OSError("Camera unplugged")
+        return np.zeros((72, 128, 3), dtype=np.uint8)
+
+    def detect(self, keep_image=False):
+        self.detections += 1
+        if self.detect_failures:
+            self.detect_failures -= 1
+            raise RuntimeError("Detector crashed")
+        return {'count': self.count, 'image': None}
+
+    def store_image(self, result):
+        return None
+
+
+class FakeAttendance:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.logged = []
+
+    def log_camera_verification(self, session_id, count, image_key):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError('database is locked')
+        self.logged.append((session_id, count))
+        return False
+
+
+def errors_metric():
+    return VERIFIER_ERRORS.snapshot().get('[]', 0)
+
+
+def run_verifier(camera, attendance, seconds=0.3):
+    verifier = PeriodicVerifier(camera, attendance, 'math-1', sample_interval=0.01,
+                                min_interval=0.0, max_interval=0.02)
+    verifier.start()
+    time.sleep(seconds)
+    alive = verifier.running
+    verifier.stop()
+    return verifier, alive
+
+
+def test_failing_ticks_are_counted_and_the_thread_keeps_running():
+    before = errors_metric()
+    camera = FlakyCamera()
+    verifier, alive = run_verifier(camera, FakeAttendance(failures=1))
+
+    assert alive
+    # Two detector crashes, two frame reads and one locked log write
+    assert verifier.stats['errors'] == 5 and errors_metric() - before == 5
+    assert verifier.stats['logged'] == 1 and verifier.last_count == 3
+    assert verifier.stats['detections'] > 1
+
+
+def test_failed_detector_runs_wait_for_the_next_interval():
+    camera = FlakyCamera(frame_failures=0, detect_failures=1000)
+    verifier = PeriodicVerifier(camera, FakeAttendance(), 'math-1', sample_interval=0.01,
+                                min_interval=0.0, max_interval=0.1)
+    verifier.start()
+    time.sleep(0.35)
+    verifier.stop()
+
+    # Not retried on every 10 ms sample: the start run plus one per max_interval
+    assert 2 <= camera.detections <= 5
+    assert verifier.stats['errors'] == camera.detections
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import numpy as np
+
+from person_counter import FrameRing, PersonCounter
+
+
+class FakeCapture:
+    """Pushes a blank 1280x720 frame into its ring every few milliseconds"""
+
+    def __init__(self, interval=0.005):
+        self.ring = FrameRing()
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.ring.push(np.zeros((720, 1280, 3), dtype=np.uint8))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class FakeDetector:
+    """Reports the given person counts in turn, taking `delay` seconds per frame"""
+
+    name = 'fake'
+
+    def __init__(self, counts, delay=0.0):
+        self.counts = list(counts)
+        self.delay = delay
+        self.widths = []
+
+    def detect(self, frame):
+        self.widths.append(frame.shape[1])
+        time.sleep(self.delay)
+        return [(10 * i, 10, 5, 5) for i in range(self.counts.pop(0))]
+
+
+def test_count_is_the_median_of_the_burst():
+    detector = FakeDetector([2, 5, 3, 3, 9])
+    with FakeCapture() as capture:
+        result = PersonCounter(capture, detector, detect_width=640, burst_frames=5).count(keep_image=True)
+
+    assert result['count'] == 3
+    assert result['counts'] == [2, 5, 3, 3, 9]
+    assert not result['budget_exhausted'] and result['detector'] == 'fake'
+    assert detector.widths == [640] * 5  # downscaled before detection
+    assert result['image'].shape == (720, 1280, 3)  # annotated at full size
+
+
+def test_burst_stops_at_the_time_budget():
+    detector = FakeDetector([4] * 10, delay=0.15)
+    with FakeCapture() as capture:
+        result = PersonCounter(capture, detector, burst_frames=10, time_budget=0.5).count()
+
+    assert result['budget_exhausted']
+    assert 1 <= result['frames'] < 10 and result['count'] == 4
+    # A frame that probably can't finish in time is skipped, not started
+    assert result['seconds'] <= 0.5 + 0.05
+
+
+def test_no_frames_counts_zero():
+    capture = type('Stalled', (), {'ring': FrameRing()})()
+    result = PersonCounter(capture, FakeDetector([]), time_budget=0.1).count()
+
+    assert result['count'] == 0 and result['frames'] == 0 and result['budget_exhausted']
@@ -0,0 +1,162 @@
+import asyncio
+import sqlite3
+import threading
+
+import reader_listener
+from conftest import add_session
+from reader_listener import MAX_LINE_BYTES, ReaderListener
+from simulated_reader import SimulatedReader, simulate
+
+
+def run_with_listener(db_path, client, **options):
+    """Start a listener on a free port, run client(listener) against it, stop it"""
+    async def main():
+        listener = ReaderListener(db_path, host='127.0.0.1', port=0, **options)
+        await listener.start()
+        try:
+            return listener, await asyncio.wait_for(client(listener), 10)
+        finally:
+            await asyncio.wait_for(listener.stop(), 10)
+    return asyncio.run(main())
+
+
+def active_session(db_path):
+    conn = sqlite3.connect(db_path)
+    add_session(conn, 'math-1')
+    conn.commit()
+    conn.close()
+
+
+def statuses(acks):
+    return [ack.split(',', 1)[0] if ack else None for ack in acks]
+
+
+def test_scans_are_acknowledged_ok(db_path):
+    active_session(db_path)
+
+    async def client(listener):
+        return await SimulatedReader('R1', [], port=listener.port).send(['R1,CARD001,100.5', 'R1,CARD002,101.0'])
+
+    _, acks = run_with_listener(db_path, client)
+    assert statuses(acks) == ['OK', 'OK']
+    assert [ack.split(',')[1:3] for ack in acks] == [['CARD001', '100.5'], ['CARD002', '101.0']]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM attendance WHERE session_id = 'math-1'").fetchone()[0] == 2
+    conn.close()
+
+
+def test_resent_line_is_a_duplicate(db_path):
+    active_session(db_path)
+
+    async def client(listener):
+        reader = SimulatedReader('R1', [], port=listener.port)
+        first = await reader.send(['R1,CARD001,100.5'])
+        return first + await reader.send(['R1,CARD001,100.5'])
+
+    _, acks = run_with_listener(db_path, client)
+    assert statuses(acks) == ['OK', 'DUP']
+
+
+def test_malformed_and_overlong_lines(db_path):
+    active_session(db_path)
+
+    async def client(listener):
+        reader = SimulatedReader('R1', [], port=listener.port)
+        malformed = await reader.send(['R1,CARD001', 'R1,CARD002,100.5'])
+        overlong = await reader.send(['R1,CARD003,' + '9' * MAX_LINE_BYTES, 'R1,CARD003,101.0'])
+        return malformed, overlong
+
+    _, (malformed, overlong) = run_with_listener(db_path, client)
+    assert statuses(malformed) == ['ERR', 'OK']
+    assert malformed[0].endswith('Expected reader_id,card_id,timestamp[,session_id]')
+    # The listener hangs up on a reader that overruns the line limit
+    assert overlong == ['ERR,,,Line too long', None]
+
+
+def test_concurrent_readers_share_batches(db_path):
+    active_session(db_path)
+    readers = 50
+
+    async def client(listener):
+        return await simulate(readers, 1, 0.0, ['CARD001', 'CARD002', 'CARD003'], port=listener.port)
+
+    listener, result = run_with_listener(db_path, client, batch_window=0.2)
+    assert sum(result['statuses'].values()) == readers
+    assert listener.stats['scans'] == readers
+    assert listener.stats['batches'] < readers // 5
+    # Only the first scan of each card marks attendance
+    assert result['statuses']['OK'] == 3
+
+
+def test_locked_database_is_retried_then_acknowledged_retry(db_path, monkeypatch):
+    active_session(db_path)
+    monkeypatch.setattr(reader_listener, 'RETRY_DELAY_SECONDS', 0.001)
+    calls = []
+
+    def locked(self, events):
+        calls.append(len(events))
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(ReaderListener, '_write_batch', locked)
+    monkeypatch.setattr('simulated_reader.MAX_RESENDS', 0)
+
+    async def client(listener):
+        return await SimulatedReader('R1', [], port=listener.port).send(['R1,CARD001,100.5'])
+
+    listener, acks = run_with_listener(db_path, client)
+    assert statuses(acks) == ['RETRY']
+    assert len(calls) == reader_listener.WRITE_ATTEMPTS
+    assert listener.stats['retries'] == reader_listener.WRITE_ATTEMPTS - 1
+
+
+def test_reader_resends_on_retry(db_path, monkeypatch):
+    active_session(db_path)
+    monkeypatch.setattr(reader_listener, 'WRITE_ATTEMPTS', 1)
+    monkeypatch.setattr('simulated_reader.RESEND_DELAY_SECONDS', 0.001)
+    write_batch = ReaderListener._write_batch
+    calls = []
+
+    def locked_once(self, events):
+        calls.append(len(events))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return write_batch(self, events)
+
+    monkeypatch.setattr(ReaderListener, '_write_batch', locked_once)
+
+    async def client(listener):
+        reader = SimulatedReader('R1', [], port=listener.port)
+        return reader, await reader.send(['R1,CARD001,100.5'])
+
+    _, (reader, acks) = run_with_listener(db_path, client)
+    assert statuses(acks) == ['OK']
+    assert reader.resends == 1
+
+
+def test_stop_answers_scans_still_queued(db_path, monkeypatch):
+    active_session(db_path)
+    release = threading.Event()
+
+    def stuck(self, events):
+        release.wait(5)
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(ReaderListener, '_write_batch', stuck)
+    monkeypatch.setattr('simulated_reader.MAX_RESENDS', 0)
+
+    async def main():
+        listener = ReaderListener(db_path, host='127.0.0.1', port=0, batch_size=1)
+        await listener.start()
+        reader = SimulatedReader('R1', [], port=listener.port)
+        sending = asyncio.create_task(reader.send([f'R1,CARD001,{100 + i}' for i in range(5)]))
+        while listener.stats['scans'] == 0 and listener.queue.qsize() < 4:
+            await asyncio.sleep(0.01)
+        stopping = asyncio.create_task(listener.stop())
+        acks = await asyncio.wait_for(sending, 5)
+        release.set()
+        await asyncio.wait_for(stopping, 5)
+        return acks
+
+    acks = asyncio.run(main())
+    assert statuses(acks) == ['RETRY'] * 5
+    assert all(ack.endswith('Listener stopping') for ack in acks)
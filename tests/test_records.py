@@ -0,0 +1,21 @@
+import sqlite3
+
+from records import Student
+
+
+def load_students(db_path):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.row_factory = Student.row_factory
+    students = cursor.execute(f"SELECT {Student.SQL_COLUMNS} FROM students st ORDER BY st.student_id").fetchall()
+    conn.close()
+    return students
+
+
+def test_records_are_hashable_values(db_path):
+    first, second = load_students(db_path), load_students(db_path)
+
+    assert first == second and first[0] is not second[0]
+    assert len(set(first + second)) == len(first)
+    assert {first[0]: 'present'}[second[0]] == 'present'
+    assert first[0] != first[1] and hash(first[0]) != hash(first[1])
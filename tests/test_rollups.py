@@ -0,0 +1,94 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from conftest import add_scan, add_session
+from rollups import apply_session_rollup, get_class_monthly_report, get_student_monthly_report, rebuild_rollups
+
+START = datetime.datetime(2025, 3, 3, 9, 0)
+
+
+def end_session(conn, session_id):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE sessions SET status = 'completed' WHERE session_id = ?", (session_id,))
+    applied = apply_session_rollup(cursor, session_id)
+    conn.commit()
+    return applied
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    add_session(conn, 'math-1', start=START)
+    add_scan(conn, 'math-1', 'S001', START + datetime.timedelta(minutes=1))
+    add_scan(conn, 'math-1', 'S002', START + datetime.timedelta(minutes=15))  # late
+    add_scan(conn, 'math-1', 'S004', START + datetime.timedelta(minutes=2))   # visitor from 10B
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_class_rollup_counts_only_class_members(db_path, conn):
+    end_session(conn, 'math-1')
+
+    [month] = get_class_monthly_report(db_path, '10A')
+    assert month['month'] == '2025-03'
+    assert month['sessions_held'] == 1
+    assert month['sessions_attended'] == 2
+    assert month['late_arrivals'] == 1
+    assert month['attendance_rate'] == round(2 / 3, 4)
+
+
+def test_student_rollups(db_path, conn):
+    end_session(conn, 'math-1')
+
+    [alice] = get_student_monthly_report(db_path, 'S001')
+    assert (alice['sessions_held'], alice['sessions_attended'], alice['late_arrivals']) == (1, 1, 0)
+    [charlie] = get_student_monthly_report(db_path, 'S003')
+    assert (charlie['sessions_held'], charlie['sessions_attended']) == (1, 0)
+    # The visitor's scan is counted in their own report, under the class they visited
+    [visit] = get_student_monthly_report(db_path, 'S004')
+    assert (visit['class_name'], visit['sessions_held'], visit['sessions_attended']) == ('10A', 1, 1)
+
+
+def test_ending_twice_does_not_double_count(db_path, conn):
+    assert end_session(conn, 'math-1')
+    assert not end_session(conn, 'math-1')
+
+    assert get_class_monthly_report(db_path, '10A')[0]['sessions_held'] == 1
+
+
+def test_active_sessions_are_not_rolled_up(db_path, conn):
+    assert get_class_monthly_report(db_path, '10A') == []
+    rebuild_rollups(db_path)
+    assert get_class_monthly_report(db_path, '10A') == []
+
+
+def test_rebuild_matches_incremental(db_path, conn):
+    add_session(conn, 'bio-1', class_name='10B', subject='Biology', start=START + datetime.timedelta(days=30))
+    add_scan(conn, 'bio-1', 'S004', START + datetime.timedelta(days=30, minutes=3))
+    conn.commit()
+    end_session(conn, 'math-1')
+    end_session(conn, 'bio-1')
+    incremental = [get_class_monthly_report(db_path, c) for c in ('10A', '10B')]
+
+    assert rebuild_rollups(db_path) == 2
+    assert [get_class_monthly_report(db_path, c) for c in ('10A', '10B')] == incremental
+
+
+def test_rebuild_bumps_data_version(db_path, conn):
+    def version():
+        return conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+
+    before = version()
+    rebuild_rollups(db_path)
+    assert version() == before + 1
+
+
+def test_ending_a_session_runs_no_schema_statements(conn):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    end_session(conn, 'math-1')
+
+    assert statements and not [sql for sql in statements if sql.lstrip().upper().startswith('CREATE')]
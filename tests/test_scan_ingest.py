@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from conftest import add_session
+from scan_ingest import apply_scan_batch
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    add_session(conn, 'math-1')
+    add_session(conn, 'old-1', status='completed')
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def scan(event_id, card_id='CARD001', session_id='math-1', **fields):
+    return dict(event_id=event_id, reader_id='R1', card_id=card_id, session_id=session_id,
+                scanned_at='2025-03-03T09:01:00', **fields)
+
+
+def attendance(conn):
+    return conn.execute("SELECT session_id, student_id FROM attendance ORDER BY id").fetchall()
+
+
+def test_batch_marks_and_rejects_per_event(conn):
+    results = apply_scan_batch(conn, [
+        scan('e1'),
+        scan('e2', card_id='CARD002'),
+        scan('e3'),                         # repeat tap
+        scan('e4', card_id='NOPE'),
+        scan('e5', session_id='old-1'),
+        scan('e6', session_id='missing'),
+    ])
+
+    assert [r['success'] for r in results] == [True, True, False, False, False, False]
+    assert [r['message'] for r in results[2:]] == [
+        'Already marked present', 'Student not found', 'Session is not active', 'Session not found']
+    assert attendance(conn) == [('math-1', 'S001'), ('math-1', 'S002')]
+
+
+def test_retried_events_are_duplicates(conn):
+    first = apply_scan_batch(conn, [scan('e1'), scan('e1')])
+    again = apply_scan_batch(conn, [scan('e1')])
+
+    assert [r['duplicate'] for r in first] == [False, True]
+    assert again[0]['duplicate'] and again[0]['success']
+    assert len(attendance(conn)) == 1
+
+
+@pytest.mark.parametrize('event', [
+    'not an event',
+    {'event_id': 'e9', 'reader_id': 'R1', 'card_id': 'CARD001'},
+    scan('e9', card_id=['CARD001']),
+    scan('e9', session_id={'id': 'math-1'}),
+    scan(['e9']),
+    scan(17),
+    dict(scan('e9'), scanned_at='half past nine'),
+    dict(scan('e9'), scanned_at=[2025, 3, 3]),
+])
+def test_malformed_events_fail_alone(conn, event):
+    results = apply_scan_batch(conn, [event, scan('e1')])
+
+    assert results[0]['success'] is False and results[0]['duplicate'] is False
+    assert results[1]['success'] is True
+    assert attendance(conn) == [('math-1', 'S001')]
+
+
+def test_rejected_malformed_event_can_be_retried(conn):
+    apply_scan_batch(conn, [dict(scan('e1'), scanned_at='half past nine')])
+    [result] = apply_scan_batch(conn, [scan('e1')])
+
+    assert result['success'] and not result['duplicate']
@@ -0,0 +1,96 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from conftest import add_scan, add_session
+from presence import PresenceBitmap
+from rollups import get_class_monthly_report
+from session_recovery import recover_active_sessions
+
+NOW = datetime.datetime(2025, 3, 3, 11, 0)
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def status(conn, session_id):
+    return conn.execute("SELECT status, end_time FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+
+
+def test_resumes_active_sessions_with_presence(conn):
+    add_session(conn, 'math-1', start=NOW - datetime.timedelta(minutes=20))
+    add_session(conn, 'bio-1', class_name='10B', subject='Biology', start=NOW - datetime.timedelta(minutes=5))
+    add_session(conn, 'done-1', start=NOW - datetime.timedelta(days=1), status='completed')
+    add_scan(conn, 'math-1', 'S001', NOW - datetime.timedelta(minutes=19))
+    add_scan(conn, 'math-1', 'S004', NOW - datetime.timedelta(minutes=18))  # visitor from 10B
+    conn.commit()
+
+    sessions, closed = recover_active_sessions(conn, now=NOW)
+
+    assert closed == []
+    by_id = {session.session_id: session for session in sessions}
+    assert sorted(by_id) == ['bio-1', 'math-1']
+    math = by_id['math-1']
+    assert (math.class_name, math.subject, math.teacher_id) == ('10A', 'Mathematics', 'T001')
+    assert math.presence.is_present('CARD001') and math.presence.is_present('CARD004')
+    assert (math.presence.present_count, math.presence.absent_count) == (2, 2)
+    assert by_id['bio-1'].presence.present_count == 0
+
+
+def test_closes_stale_and_duplicate_sessions(db_path, conn):
+    add_session(conn, 'yesterday', start=NOW - datetime.timedelta(hours=26))
+    add_session(conn, 'earlier', start=NOW - datetime.timedelta(hours=1))
+    add_session(conn, 'current', start=NOW - datetime.timedelta(minutes=10))
+    last_scan = NOW - datetime.timedelta(hours=25, minutes=30)
+    add_scan(conn, 'yesterday', 'S001', last_scan)
+    conn.commit()
+
+    sessions, closed = recover_active_sessions(conn, now=NOW)
+
+    assert [session.session_id for session in sessions] == ['current']
+    assert sorted(closed) == ['earlier', 'yesterday']
+    assert status(conn, 'yesterday') == ('completed', str(last_scan))
+    assert status(conn, 'earlier')[0] == 'completed'
+    assert status(conn, 'current') == ('active', None)
+    # Closed sessions are rolled up like ended ones
+    assert sum(month['sessions_held'] for month in get_class_monthly_report(db_path, '10A')) == 2
+
+
+def test_limits_recovery_to_classes(conn):
+    add_session(conn, 'math-1', start=NOW - datetime.timedelta(minutes=5))
+    add_session(conn, 'bio-1', class_name='10B', start=NOW - datetime.timedelta(hours=9))
+    conn.commit()
+
+    sessions, closed = recover_active_sessions(conn, classes=['10A'], now=NOW)
+
+    assert [session.session_id for session in sessions] == ['math-1']
+    assert closed == []
+    assert status(conn, 'bio-1')[0] == 'active'
+
+
+def test_bulk_presence_matches_per_session_load(conn):
+    for i, class_name in enumerate(['10A', '10B', '10A']):
+        add_session(conn, f"s{i}", class_name=class_name)
+    add_scan(conn, 's0', 'S002', NOW)
+    add_scan(conn, 's1', 'S004', NOW)
+    add_scan(conn, 's2', 'S001', NOW)
+    add_scan(conn, 's2', 'S003', NOW)
+    conn.commit()
+
+    bulk = PresenceBitmap.load_active(conn)
+    for session_id, bitmap in bulk.items():
+        single = PresenceBitmap.load(conn, session_id)
+        assert bitmap.student_ids == single.student_ids
+        assert bitmap.absent_student_ids() == single.absent_student_ids()
+        assert bitmap.present_count == single.present_count
+
+
+def test_active_sessions_query_uses_the_partial_index(conn):
+    recover_active_sessions(conn, now=NOW)
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT session_id FROM sessions WHERE status = 'active'").fetchall()
+    assert 'idx_sessions_active' in str(plan)
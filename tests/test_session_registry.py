@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from session_registry import ActiveSession, SessionConflict, SessionRegistry
+
+
+def test_classroom_is_reserved_until_the_session_starts():
+    registry = SessionRegistry()
+    assert registry.reserve('10A')
+    assert not registry.reserve('10A')
+    assert registry.reserve('10B')
+    assert registry.for_classroom('10A') is None and len(registry) == 0
+
+    session = ActiveSession('math-1', '10A', 'Mathematics', 'T001')
+    registry.add(session)  # fills the reservation
+    assert registry.for_classroom('10A') is session and registry.get('math-1') is session
+    assert not registry.reserve('10A')
+
+
+def test_release_frees_only_a_reservation():
+    registry = SessionRegistry()
+    registry.reserve('10A')
+    registry.release('10A')
+    assert registry.reserve('10A')
+
+    registry.add(ActiveSession('math-1', '10A'))
+    registry.release('10A')  # a started session is not a reservation
+    assert registry.for_classroom('10A').session_id == 'math-1'
+    registry.release('10C')  # never reserved: nothing to do
+
+
+def test_conflicting_sessions_and_devices():
+    registry = SessionRegistry()
+    registry.add(ActiveSession('math-1', '10A'))
+    with pytest.raises(SessionConflict):
+        registry.add(ActiveSession('math-1', '10B'))
+    with pytest.raises(SessionConflict):
+        registry.add(ActiveSession('bio-1', '10A'))
+
+    registry.add(ActiveSession('bio-1', '10B'))
+    registry.attach_device('math-1', 'R1')
+    registry.attach_device('math-1', 'R1')  # already its own
+    with pytest.raises(SessionConflict):
+        registry.attach_device('bio-1', 'R1')
+    assert registry.for_device('R1').session_id == 'math-1'
+
+
+def test_remove_frees_the_classroom_and_devices():
+    registry = SessionRegistry()
+    session = ActiveSession('math-1', '10A')
+    registry.add(session)
+    registry.attach_device('math-1', 'R1')
+
+    assert registry.remove('math-1') is session
+    assert registry.remove('math-1') is None
+    assert 'math-1' not in registry and registry.for_device('R1') is None
+    assert registry.reserve('10A')
+
+
+def test_concurrent_starts_for_one_classroom_get_one_reservation():
+    registry = SessionRegistry()
+    barrier = threading.Barrier(16)
+    results = []
+
+    def start():
+        barrier.wait()
+        results.append(registry.reserve('10A'))
+
+    threads = [threading.Thread(target=start) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
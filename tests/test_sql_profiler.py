@@ -0,0 +1,36 @@
+from flask import Flask
+
+import sql_profiler
+
+
+def slow_log(db_path, log_parameters):
+    profiler = sql_profiler.SQLProfiler()
+    profiler.enable(slow_ms=0)
+    profiler.log_parameters = log_parameters
+    conn = profiler.connect(db_path)
+    conn.execute("SELECT student_id FROM students WHERE card_id = ?", ('CARD001',)).fetchall()
+    conn.close()
+    return profiler.snapshot()['slow_queries']
+
+
+def test_slow_log_redacts_parameters(db_path):
+    [entry] = slow_log(db_path, log_parameters=False)
+    assert 'CARD001' not in str(entry)
+    assert entry['parameters'] == '<1 parameter(s) redacted>'
+
+
+def test_slow_log_parameters_when_enabled(db_path):
+    [entry] = slow_log(db_path, log_parameters=True)
+    assert 'CARD001' in entry['parameters']
+
+
+def test_debug_endpoint_only_while_profiling(monkeypatch):
+    monkeypatch.setattr(sql_profiler.PROFILER, 'enabled', False)
+    app = Flask(__name__)
+    sql_profiler.init_app(app)
+    assert app.test_client().get('/debug/sql').status_code == 404
+
+    monkeypatch.setattr(sql_profiler.PROFILER, 'enabled', True)
+    app = Flask(__name__)
+    sql_profiler.init_app(app)
+    assert app.test_client().get('/debug/sql').get_json()['enabled'] is True
@@ -0,0 +1,44 @@
+import os
+
+from flask import Flask
+
+import static_assets
+
+BOOTSTRAP_CSS = 'vendor/bootstrap/css/bootstrap.min.css'
+
+
+def make_app(static_folder):
+    app = Flask(__name__, static_folder=str(static_folder), static_url_path='/static')
+    static_assets.init_app(app)
+    return app
+
+
+def asset_url(app, filename):
+    with app.test_request_context():
+        return app.jinja_env.globals['asset_url'](filename)
+
+
+def test_falls_back_to_cdn_without_vendored_files(tmp_path):
+    app = make_app(tmp_path)
+    assert asset_url(app, BOOTSTRAP_CSS) == static_assets.VENDOR_ASSETS[BOOTSTRAP_CSS]
+
+
+def test_serves_vendored_file_when_present(tmp_path):
+    target = tmp_path / BOOTSTRAP_CSS
+    os.makedirs(target.parent)
+    target.write_text('body { margin: 0 }')
+
+    assert asset_url(make_app(tmp_path), BOOTSTRAP_CSS) == f'/static/{BOOTSTRAP_CSS}'
+
+
+def test_serves_fingerprinted_file_after_build(tmp_path):
+    target = tmp_path / BOOTSTRAP_CSS
+    os.makedirs(target.parent)
+    target.write_text('body { margin: 0 }' * 100)
+    manifest = static_assets.build_assets(str(tmp_path))
+
+    app = make_app(tmp_path)
+    assert asset_url(app, BOOTSTRAP_CSS) == f'/static/dist/{manifest[BOOTSTRAP_CSS]}'
+    response = app.test_client().get(asset_url(app, BOOTSTRAP_CSS), headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == static_assets.IMMUTABLE_CACHE_CONTROL